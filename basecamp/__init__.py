@@ -1,6 +1,3 @@
-# See http://peak.telecommunity.com/DevCenter/setuptools#namespace-packages
-try:
-    __import__('pkg_resources').declare_namespace(__name__)
-except ImportError:
-    from pkgutil import extend_path
-    __path__ = extend_path(__path__, __name__)
+# namespace package, declared with pkgutil as pkg_resources is slow to import
+from pkgutil import extend_path
+__path__ = extend_path(__path__, __name__)
@@ -1 +1,4 @@
-from basecamp import Basecamp
\ No newline at end of file
+# Basecamp and the modules it needs are imported on first access
+from lazy import lazyPackage
+
+lazyPackage(__name__, {'Basecamp': 'basecamp'})
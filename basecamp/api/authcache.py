@@ -0,0 +1,117 @@
+"""Persistent cache of authenticated persons
+
+Person attributes are stored along with the id, so sessions can rebuild
+the authenticated person without a request. Files written by earlier
+versions hold ids only.
+"""
+import os
+import json
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # no inter-process locking on Windows
+    fcntl = None
+
+DEFAULT_PATH = os.path.join('~', '.basecamp-identity.json')
+
+# person attributes never written into the file
+SECRET_FIELDS = ('password', 'token')
+
+
+class IdentityCache(object):
+    """Stores persons keyed by account URL and username in a JSON file
+
+    The file is re-read on every lookup miss and replaced atomically on
+    update, so it may be shared by many processes.
+    """
+
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(path or DEFAULT_PATH)
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def _key(self, url, username):
+        return '%s %s' % (url.rstrip('/'), username)
+
+    def _read(self):
+        try:
+            f = open(self.path)
+        except IOError:
+            return {}
+        try:
+            try:
+                return json.load(f)
+            except ValueError:
+                return {}
+        finally:
+            f.close()
+
+    def _lookup(self, url, username):
+        key = self._key(url, username)
+        self._lock.acquire()
+        try:
+            if key not in self._ids:
+                self._ids = self._read()
+            return self._ids.get(key)
+        finally:
+            self._lock.release()
+
+    def get(self, url, username):
+        """Return person id or None if it is not known yet
+        """
+        value = self._lookup(url, username)
+        if isinstance(value, dict):
+            return value.get('id')
+        return value
+
+    def getPerson(self, url, username):
+        """Return dict of person attributes or None if it is not known yet
+
+        Persons stored by id only have just the id.
+        """
+        value = self._lookup(url, username)
+        if isinstance(value, dict):
+            return dict(value)
+        if value is not None:
+            return {'id': value}
+        return None
+
+    def set(self, url, username, person):
+        """Remember person id, or dict of person attributes (toDict)
+        """
+        if isinstance(person, dict):
+            person = dict([(name, value) for name, value in person.items()
+                           if name not in SECRET_FIELDS])
+        self._update(self._key(url, username), person)
+
+    def invalidate(self, url, username):
+        """Forget person id, e.g. after login was given to another person
+        """
+        self._update(self._key(url, username), None)
+
+    def _update(self, key, value):
+        self._lock.acquire()
+        try:
+            lock = open(self.path + '.lock', 'a')
+            try:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                # merge with persons stored by other processes meanwhile
+                self._ids = self._read()
+                if value is None:
+                    self._ids.pop(key, None)
+                else:
+                    self._ids[key] = value
+                temp = '%s.%d' % (self.path, os.getpid())
+                f = open(temp, 'w')
+                try:
+                    json.dump(self._ids, f)
+                finally:
+                    f.close()
+                os.rename(temp, self.path)
+            finally:
+                lock.close()
+        finally:
+            self._lock.release()
@@ -2,14 +2,38 @@
 
 """
 import time
-from xml.dom import minidom
+import threading
+from collections import deque
 from xml.parsers.expat import ExpatError
 
+from lazy import lazyImport
 from restclient import RESTClient
 from restclient import absoluteURL
 from resources import Project, Company, Person
 from resources import Message, Category
 from resources import TodoList, TodoItem, TimeEntry
+from transport import HTTPTransport, ConnectionPool, DNSCache
+from timeouts import CallScope
+from cache import ResourceCache, cached
+# errors raised when calls take too long or are cancelled
+from timeouts import RequestTimeoutError, DeadlineExceededError
+from timeouts import CancelledError
+
+# modules loaded on first use
+_package = __name__.rsplit('.', 1)[0]
+minidom = lazyImport('xml.dom.minidom')
+pulldom = lazyImport('xml.dom.pulldom')
+bulk = lazyImport(_package + '.bulk')
+crawler = lazyImport(_package + '.crawler')
+identitymap = lazyImport(_package + '.identitymap')
+offload = lazyImport(_package + '.offload')
+authcache = lazyImport(_package + '.authcache')
+cassette = lazyImport(_package + '.cassette')
+mutations = lazyImport(_package + '.mutations')
+profiling = lazyImport(_package + '.profiling')
+decoding = lazyImport(_package + '.decoding')
+workers = lazyImport(_package + '.workers')
+http2 = lazyImport(_package + '.http2')
 
 # Basecamp errors
 class UnauthorizedError(Exception):
@@ -21,6 +45,10 @@ class ForbiddenError(Exception):
 class NotFoundError(Exception):
     pass
 
+class ResponseError(Exception):
+    """Basecamp returned errors where a list of resources was expected
+    """
+
 
 class Basecamp(object):
     """Python wrapper for Basecamp API
@@ -29,7 +57,44 @@ class Basecamp(object):
     headers = {'Content-Type': 'application/xml',
                'Accept': 'application/xml'}
     
+    # set to IdentityMap instance to get single shared instance per entity
+    identityMap = None
+    
+    # set to ParseOffload instance to decode large responses in processes
+    parseOffload = None
+    
+    # set to IdentityCache instance to persist authenticated person ids
+    identityCache = None
+    
+    # set to ResourceCache instance to cache results of read methods
+    resourceCache = None
+    
+    # set to read around resourceCache: results are fetched again and
+    # replace cached ones, e.g. to see changes made by others
+    refreshCache = False
+    
+    # set by useMutationQueue
+    mutationQueue = None
+    
+    # set by useProfiler
+    profiler = None
+    
+    # set to BulkDecoder instance to decode lists of resources with
+    # cElementTree instead of minidom
+    bulkDecoder = None
+    
+    # timeout in seconds for connecting to Basecamp and waiting for
+    # response, either a number or a (connect, read) pair
+    timeout = None
+    
+    _authenticatedPerson = None
+    # deadline and cancellation inherited from the session cloned, scopes
+    # entered with deadline() apply to their thread only
+    _baseDeadline = None
+    _baseCancellation = None
+    
     def __init__(self, baseURL, username, password, headers={}):
+        self._scope = threading.local()
         # normalize url
         url = absoluteURL(baseURL, '')
         if url.endswith('/'):
@@ -48,6 +113,187 @@ class Basecamp(object):
             self.requestHeaders.update(headers)
         self.client.requestHeaders.update(self.requestHeaders)
 
+    def clone(self):
+        """Return new session for the same account and credentials
+        
+        RESTClient keeps the state of the last response, so concurrent
+        calls should be made through separate sessions.
+        """
+        session = self.__class__(self.url, self.username, self.password,
+                                 self.requestHeaders)
+        session.client.pool = self.client.pool
+        session.client.transport = self.client.transport
+        session.client.dnsCache = self.client.dnsCache
+        session.identityMap = self.identityMap
+        session.parseOffload = self.parseOffload
+        session.bulkDecoder = self.bulkDecoder
+        session.identityCache = self.identityCache
+        session.resourceCache = self.resourceCache
+        session.refreshCache = self.refreshCache
+        session._authenticatedPerson = self._authenticatedPerson
+        session.timeout = self.timeout
+        session._baseDeadline = self._deadline
+        session._baseCancellation = self._cancellation
+        if self.profiler is not None:
+            session.profiler = self.profiler
+            self.profiler.install(session)
+        return session
+
+    def deadline(self, seconds=None):
+        """Limit overall time of all calls made inside the with block
+        
+            >>> with bc.deadline(10) as call:
+            ...     person = bc.getAuthenticatedPerson()
+        
+        Every request made inside gets at most the remaining time, once
+        it is over DeadlineExceededError is raised. call.cancel() aborts
+        requests in flight from another thread with CancelledError.
+        """
+        return CallScope(self, seconds)
+
+    @property
+    def _deadline(self):
+        return getattr(self._scope, 'deadline', self._baseDeadline)
+
+    @property
+    def _cancellation(self):
+        return getattr(self._scope, 'cancellation', self._baseCancellation)
+
+    def useIdentityMap(self):
+        """Decode every entity into a single shared instance
+        
+        Resources fetched again are updated in place, so the same company
+        or person found in different responses is the same object.
+        """
+        if self.identityMap is None:
+            self.identityMap = identitymap.IdentityMap()
+        return self.identityMap
+
+    def useParseOffload(self, threshold=1024 * 1024, processes=None):
+        """Decode responses larger than threshold (in bytes) in a pool
+        of worker processes
+        """
+        if self.parseOffload is None:
+            self.parseOffload = offload.ParseOffload(threshold, processes)
+        return self.parseOffload
+
+    def useBulkDecoder(self, pauseGC=True):
+        """Decode lists of resources without building DOM trees
+        
+        Nothing decoded leaves cyclic garbage, so the garbage collector
+        may be paused while decoding, see decoding module.
+        """
+        if self.bulkDecoder is None:
+            self.bulkDecoder = decoding.BulkDecoder(pauseGC)
+        return self.bulkDecoder
+
+    def useCassette(self, path, record=False, latency=None, speed=0,
+                    loop=False, strict=False):
+        """Record session into cassette file or replay it from there
+        
+        In record mode requests are made through the current transport
+        and recorded, call save() on returned recorder to write the
+        cassette. Otherwise responses are replayed from the cassette
+        with simulated latency, see cassette.CassettePlayer for options.
+        """
+        if record:
+            transport = self.client.transport
+            if transport is None:
+                transport = self.client.httpTransport()
+            self.client.transport = cassette.CassetteRecorder(path, transport)
+        else:
+            self.client.transport = cassette.CassettePlayer(path, latency,
+                                                            speed, loop,
+                                                            strict)
+        return self.client.transport
+
+    def useResourceCache(self, maxsize=1000, maxAge=None):
+        """Cache results of read methods, keeping them consistent with
+        changes made through this session
+        
+        Results are kept for at most maxAge seconds if it is given, to
+        see changes made by others. See cache module for details.
+        """
+        if self.resourceCache is None:
+            self.resourceCache = ResourceCache(maxsize, maxAge)
+        return self.resourceCache
+
+    def useMutationQueue(self, journal=None, interval=1.0, batchSize=50,
+                         concurrency=4):
+        """Make mutations through write-behind queue
+        
+        Returned MutationQueue has the same mutation methods as Basecamp,
+        they return Futures at once. Pending mutations of the same entity
+        are collapsed and flushed in the background, see mutations module.
+        """
+        if self.mutationQueue is None:
+            self.mutationQueue = mutations.MutationQueue(self, journal,
+                                                         interval, batchSize,
+                                                         concurrency)
+        return self.mutationQueue
+
+    def useProfiler(self, methods=None, rate=1.0, sampling=False,
+                    interval=0.001):
+        """Profile calls of given methods (all API calls by default)
+        
+        A `rate` fraction of calls is profiled with cProfile, or by
+        sampling stacks every `interval` seconds. See profiling.Profiler
+        for reports and flamegraph output.
+        """
+        if self.profiler is None:
+            self.profiler = profiling.Profiler(methods, rate, sampling,
+                                               interval)
+            self.profiler.install(self)
+        return self.profiler
+
+    def useHTTP2(self):
+        """Make requests of this session and its clones as streams of
+        a single HTTP/2 connection, requires h2
+        
+        See http2 module.
+        """
+        if not isinstance(self.client.transport, http2.HTTP2Transport):
+            self.client.transport = http2.HTTP2Transport(self.client.dnsCache)
+        return self.client.transport
+
+    def useDNSCache(self, ttl=300):
+        """Resolve Basecamp host once per `ttl` seconds for new
+        connections of this session and its clones
+        """
+        if self.client.dnsCache is None:
+            self.client.dnsCache = DNSCache(ttl)
+        return self.client.dnsCache
+
+    def warmUp(self, connections=4, timeout=None):
+        """Establish connections to Basecamp in advance
+        
+        Connections, TLS handshakes included, are made in parallel and
+        kept in the connection pool of the session, which is created if
+        there is none, so the first calls of a fresh worker reuse them.
+        Returns number of connections established, nothing is done when
+        requests don't go over network, e.g. with cassette. HTTP/2
+        transport needs a single connection.
+        """
+        if self.client.pool is None:
+            self.client.pool = ConnectionPool(max(connections, 10))
+        transport = self.client.transport
+        if transport is None:
+            transport = self.client.httpTransport()
+        if not hasattr(transport, 'warmUp'):
+            return 0
+        if timeout is None:
+            timeout = self.timeout
+        return transport.warmUp(self.url, connections, timeout)
+
+    def useIdentityCache(self, path=None):
+        """Persist authenticated person in the given file
+        
+        See getAuthenticatedPerson.
+        """
+        if self.identityCache is None:
+            self.identityCache = authcache.IdentityCache(path)
+        return self.identityCache
+
 
     #
     # Basecamp API
@@ -56,6 +302,7 @@ class Basecamp(object):
     
     # Projects API Calls
     
+    @cached(('projects', None))
     def getProjects(self):
         """Get projects
                 
@@ -64,13 +311,9 @@ class Basecamp(object):
         Returns all accessible projects. This includes active, inactive, and archived projects.
         """
         path = '/projects.xml'
-        rootElement = self.fromXML(self.get(path).contents)
-        # TODO: use special Array attribute
-        projects = []
-        for data in rootElement.getElementsByTagName('project'):
-            projects.append(Project.load(data))
-        return projects
+        return self.decodeResources(Project, self.get(path).contents)
 
+    @cached(('project', 'project_id'))
     def getProjectById(self, project_id):
         """Get project
         
@@ -86,12 +329,12 @@ class Basecamp(object):
         if response.status == 404:
             raise NotFoundError, 'Project with %d id is not found!' % project_id
         
-        rootElement = self.fromXML(response.contents)
-        return Project.load(rootElement)
+        return self.decodeResource(Project, response.contents)
 
 
     # To-do Lists API Calls
     
+    @cached(('todo_lists', None))
     def getTodoLists(self, responsible_party=None, company=False):
         """Get all lists (across projects)
         
@@ -123,12 +366,28 @@ class Basecamp(object):
             else:
                 raise NotFoundError, 'Person with %d id is not found!' % responsible_party
             
-        rootElement = self.fromXML(response.contents)
-        # TODO: use special Array attribute
-        todo_lists = []
-        for data in rootElement.getElementsByTagName('todo-list'):
-            todo_lists.append(TodoList.load(data))
-        return todo_lists
+        return self.decodeResources(TodoList, response.contents)
+
+    @cached(('todo_lists', 'project_id'))
+    def getTodoListsForProject(self, project_id, filter='all'):
+        """Get lists (for a given project)
+        
+        REST: GET /projects/#{project_id}/todo_lists.xml?filter=#{filter}
+
+        Returns a list of todo-list records that are in the given project.
+        By default all lists are returned, filter may be "pending" for
+        lists with uncompleted items or "finished" for completed ones.
+        """
+        # ensure that we got numerical project id
+        assert isinstance(project_id, int)
+        assert filter in ('all', 'pending', 'finished')
+        
+        path = '/projects/%d/todo_lists.xml?filter=%s' % (project_id, filter)
+        response = self.get(path)
+        if response.status == 404:
+            raise NotFoundError, 'Project with %d id is not found!' % project_id
+        
+        return self.decodeResources(TodoList, response.contents)
 
 
     # To-do List Items API Calls
@@ -199,13 +458,27 @@ class Basecamp(object):
         response = self.post(path, data=data)
         # successfuly created entry
         if response.status == 201:
-            id = int(dict(response.headers)['location'].split('/')[-1])
+            id = int(response.headers['location'].split('/')[-1])
             todo = TodoItem(id=id,
                             content=content,
                             responsible_party=responsible_party,
                             responsible_party_type=((company and
                                 responsible_party) and 'c' or None),
                             creator_id=responsible_party)
+            if self.resourceCache is not None:
+                # lists across projects are filtered by responsible party,
+                # which the new item may not match, and lists of its
+                # project by completion; other projects are not affected
+                project_ids = set([todoList.project_id for todoList in
+                                   self.resourceCache.find(TodoList,
+                                                           todo_list_id)])
+                project_ids.discard(None)
+                if len(project_ids) == 1:
+                    self.resourceCache.invalidate(('todo_lists',
+                                                   project_ids.pop()))
+                else:
+                    # project of the list is unknown
+                    self.resourceCache.invalidate(('todo_lists', None))
             return todo
         return self.getErrors(response.contents)
 
@@ -226,6 +499,9 @@ class Basecamp(object):
         
         # successfuly checked entry
         if response.status == 200:
+            if self.resourceCache is not None:
+                self.resourceCache.update(TodoItem, todo_item_id,
+                                          completed=True)
             return True
         return self.getErrors(response.contents)
 
@@ -248,12 +524,37 @@ class Basecamp(object):
         
         # successfuly checked entry
         if response.status == 200:
+            if self.resourceCache is not None:
+                self.resourceCache.update(TodoItem, todo_item_id,
+                                          completed=False)
             return True
         return self.getErrors(response.contents)
 
+    def completeTodoItems(self, ids, concurrency=4, retries=3):
+        """Complete many items at once
+        
+        Requests are made by `concurrency` parallel sessions over pooled
+        keep-alive connections, network errors and 5xx responses are
+        retried up to `retries` times.
+        
+        Returns dict mapping every id to True, list of errors or raised
+        exception.
+        """
+        return bulk.batchCall(self, 'completeTodoItem', ids, concurrency,
+                              retries)
+
+    def uncompleteTodoItems(self, ids, concurrency=4, retries=3):
+        """Uncomplete many items at once
+        
+        See completeTodoItems for details.
+        """
+        return bulk.batchCall(self, 'uncompleteTodoItem', ids, concurrency,
+                              retries)
+
 
     # Time Entries API Calls
 
+    @cached(('time_entries', 'filter_project_id'))
     def getEntriesReport(self, _from, _to, subject_id=None, todo_item_id=None,
                          filter_project_id=None, filter_company_id=None):
         """Get time report
@@ -282,6 +583,29 @@ class Basecamp(object):
               ...
             </time-entries>
         """
+        path = self._entriesReportPath(_from, _to, subject_id, todo_item_id,
+                                       filter_project_id, filter_company_id)
+        response = self.get(path)
+        if response.status != 200:
+            return self.getErrors(response.contents)
+
+        return self.decodeResources(TimeEntry, response.contents)
+    
+    def iterEntriesReport(self, _from, _to, subject_id=None,
+                          todo_item_id=None, filter_project_id=None,
+                          filter_company_id=None):
+        """Get time report as a stream
+        
+        Same as getEntriesReport, but time entries are yielded as soon as
+        they are read from the response, without holding the whole
+        report in memory.
+        """
+        path = self._entriesReportPath(_from, _to, subject_id, todo_item_id,
+                                       filter_project_id, filter_company_id)
+        return self.iterResources(TimeEntry, path)
+
+    def _entriesReportPath(self, _from, _to, subject_id, todo_item_id,
+                           filter_project_id, filter_company_id):
         # ensure that we got numerical ids
         query = ['from=%s' % _from, 'to=%s' % _to]
         if subject_id:
@@ -296,19 +620,9 @@ class Basecamp(object):
         if filter_company_id:
             assert isinstance(filter_company_id, int)
             query.append('filter_company_id=%d' % filter_company_id)
-
-        path = '/time_entries/report.xml?%s' % '&'.join(query)
-        response = self.get(path)
-        if response.status != 200:
-            return self.getErrors(response.contents)
-
-        rootElement = self.fromXML(response.contents)
-        # TODO: use special Array attribute
-        time_entries = []
-        for data in rootElement.getElementsByTagName('time-entry'):
-            time_entries.append(TimeEntry.load(data))
-        return time_entries
+        return '/time_entries/report.xml?%s' % '&'.join(query)
     
+    @cached(('todo_item', 'todo_item_id'))
     def getEntriesForTodoItem(self, todo_item_id):
         """Get all entries (for a todo item)
         
@@ -335,12 +649,7 @@ class Basecamp(object):
             raise NotFoundError, 'Todo item with %d id is not found!' % \
                  todo_item_id
         
-        rootElement = self.fromXML(response.contents)
-        # TODO: use special Array attribute
-        time_entries = []
-        for data in rootElement.getElementsByTagName('time-entry'):
-            time_entries.append(TimeEntry.load(data))
-        return time_entries
+        return self.decodeResources(TimeEntry, response.contents)
 
     def createTimeEntryForTodoItem(self, todo_item_id, hours='', date=None,
                                    person_id=None, description=''): 
@@ -387,7 +696,11 @@ class Basecamp(object):
         
         # successfuly created entry
         if response.status == 201:
-            entry.id = int(dict(response.headers)['location'].split('/')[-1])
+            entry.id = int(response.headers['location'].split('/')[-1])
+            if self.resourceCache is not None:
+                self.resourceCache.append(('todo_item', todo_item_id), entry)
+                # project of the item is unknown here
+                self.resourceCache.invalidate(('time_entries', None))
             return entry
         return self.getErrors(response.contents)
 
@@ -436,10 +749,59 @@ class Basecamp(object):
         
         # successfuly created entry
         if response.status == 201:
-            entry.id = int(dict(response.headers)['location'].split('/')[-1])
+            entry.id = int(response.headers['location'].split('/')[-1])
+            if self.resourceCache is not None:
+                self.resourceCache.invalidate(('time_entries', project_id))
             return entry
         return self.getErrors(response.contents)
 
+    def updateTimeEntry(self, id, hours=None, date=None, person_id=None,
+                        description=None, todo_item_id=None):
+        """Update entry
+        
+        REST: PUT /time_entries/#{id}.xml
+        
+        Updates the given time entry record, only given fields are sent.
+        
+        XML Request:
+            <time-entry>
+                <person-id>#{person-id}</person-id>
+                <date>#{date}</date>
+                <hours>#{hours}</hours>
+                <description>#{description}</description>
+                <todo-item-id>#{todo-item-id}</todo-item-id>
+            </time-entry>
+        
+        Response:
+            Returns HTTP status code 200 on success.
+        """
+        # ensure we got numerical entry id
+        assert isinstance(id, int)
+        
+        values = {}
+        for name, value in (('hours', hours), ('date', date),
+                            ('person_id', person_id),
+                            ('description', description),
+                            ('todo_item_id', todo_item_id)):
+            if value is not None:
+                values[name] = value
+        entry = TimeEntry(**values)
+        path = '/time_entries/%d.xml' % id
+        response = self.put(path, data=entry.serialize())
+        if response.status == 200:
+            if self.resourceCache is not None:
+                if set(values) & set(['todo_item_id', 'date', 'person_id']):
+                    # entry may move between item lists and reports
+                    self.resourceCache.invalidate(('todo_item', None),
+                                                  ('time_entries', None))
+                else:
+                    self.resourceCache.update(TimeEntry, id, **values)
+            return True
+        elif response.status == 404:
+            raise NotFoundError, 'Time Entry with <%d> id is not found!' % id
+        else:
+            return self.getErrors(response.contents)
+
     def destroyTimeEntry(self, id):
         """Destroy time entry
         
@@ -456,12 +818,42 @@ class Basecamp(object):
         path = '/time_entries/%d.xml' % id
         response = self.delete(path)
         if response.status == 200:
+            if self.resourceCache is not None:
+                self.resourceCache.remove(TimeEntry, id)
             return True
         elif response.status == 404:
             raise NotFoundError, 'Time Entry with <%d> id is not found!' % id
         else:
             return self.getErrors(response.contents)
 
+    def importTimeEntries(self, entries, concurrency=4, rate=None,
+                          checkpoint=None):
+        """Create many time entries at once
+        
+        Takes an iterable of TimeEntry objects or dicts (e.g. rows read with
+        csv.DictReader) having todo_item_id or project_id key. All entries
+        are validated and serialized before posting, ValueError is raised
+        if any of them is invalid. Then entries are posted by `concurrency`
+        parallel sessions, no more than `rate` requests per second.
+        
+        If checkpoint file path is given, created entries are recorded
+        there, and calling this method again with the same entries will
+        post only those which were not imported yet.
+        
+        Returns list of created entries (or lists of errors for failed
+        ones) in the same order as given.
+        """
+        return bulk.importTimeEntries(self, entries, concurrency, rate,
+                                      checkpoint)
+
+    def destroyTimeEntries(self, ids, concurrency=4, retries=3):
+        """Destroy many time entries at once
+        
+        See completeTodoItems for details.
+        """
+        return bulk.batchCall(self, 'destroyTimeEntry', ids, concurrency,
+                              retries)
+
 
     # Companies API Calls
     
@@ -485,12 +877,7 @@ class Basecamp(object):
             </companies>
         """
         path = '/companies.xml'
-        rootElement = self.fromXML(self.get(path).contents)
-        # TODO: use special Array attribute
-        companies = []
-        for data in rootElement.getElementsByTagName('company'):
-            companies.append(Company.load(data))
-        return companies
+        return self.decodeResources(Company, self.get(path).contents)
     
     def getCompaniesForProject(self, project_id):
         """Get companies on project
@@ -514,17 +901,12 @@ class Basecamp(object):
         # ensure that we got numerical project id
         assert isinstance(project_id, int)
         
-        path = '/projects/%d/companies.xml'
+        path = '/projects/%d/companies.xml' % project_id
         response = self.get(path)
         if response.status == 404:
             raise NotFoundError, 'Project with %d id is not found!' % project_id
         
-        rootElement = self.fromXML(response.contents)
-        # TODO: use special Array attribute
-        companies = []
-        for data in rootElement.getElementsByTagName('company'):
-            companies.append(Company.load(data))
-        return companies
+        return self.decodeResources(Company, response.contents)
     
     def getCompanyById(self, company_id):
         """Get company
@@ -547,8 +929,7 @@ class Basecamp(object):
         if response.status == 404:
             raise NotFoundError, 'Company with %d id is not found!' % company_id
         
-        rootElement = self.fromXML(response.contents)
-        return Company.load(rootElement)
+        return self.decodeResource(Company, response.contents)
         
     # People API Calls
     
@@ -570,8 +951,7 @@ class Basecamp(object):
         if response.status != 200:
             return self.getErrors(response.contents)
 
-        data = self.fromXML(response.contents)
-        return Person.load(data)
+        return self.decodeResource(Person, response.contents)
     
     def getPeopleForCompany(self, company_id, project_id=None):
         """Get people (for company)
@@ -605,12 +985,7 @@ class Basecamp(object):
         if response.status == 404:
             raise NotFoundError, 'Company [%d] or Project [%d] is not found!' % (company_id, project_id)
         
-        rootElement = self.fromXML(response.contents)
-        # TODO: use special Array attribute
-        people = []
-        for data in rootElement.getElementsByTagName('person'):
-            people.append(Person.load(data))
-        return people
+        return self.decodeResources(Person, response.contents)
     
     def getPeopleForProject(self, project_id, company_id):
         """Get people on project
@@ -640,12 +1015,7 @@ class Basecamp(object):
         if response.status == 404:
             raise NotFoundError, 'Project [%d] or Company [%d] is not found!' % (project_id, company_id)
         
-        rootElement = self.fromXML(response.contents)
-        # TODO: use special Array attribute
-        people = []
-        for data in rootElement.getElementsByTagName('person'):
-            people.append(Person.load(data))
-        return people
+        return self.decodeResources(Person, response.contents)
     
     def getPersonById(self, person_id):
         """Get person (by id)
@@ -667,8 +1037,7 @@ class Basecamp(object):
         if response.status == 404:
             raise NotFoundError, 'Person with %d id is not found!' % person_id
         
-        rootElement = self.fromXML(response.contents)
-        return Person.load(rootElement)
+        return self.decodeResource(Person, response.contents)
     
     def getPersonByLogin(self, login):
         """Finds person by it's login
@@ -694,6 +1063,48 @@ class Basecamp(object):
     def getAuthenticatedPerson(self):
         """Get authenticated person
         
+        The person is resolved once per session, using the cheapest
+        source available:
+            1.  person remembered by this session;
+            2.  person stored in identity cache (see useIdentityCache)
+                for this account URL and username, no requests are made;
+            3.  GET /me.xml, a single request;
+            4.  slow implicit lookups described in findAuthenticatedPerson.
+        Found person is stored into identity cache, if it is set, so other
+        sessions and processes don't need to resolve it again. Persons
+        cached by earlier versions have only id and user_name set, use
+        getPersonById when all fields are needed.
+        """
+        if self._authenticatedPerson is not None:
+            return self._authenticatedPerson
+        
+        person = None
+        if self.identityCache is not None:
+            data = self.identityCache.getPerson(self.url, self.username)
+            if data is not None:
+                person = Person.fromDict(data)
+                if person.user_name is None:
+                    person.user_name = self.username
+        
+        if person is None:
+            try:
+                person = self.getCurrentPerson()
+            except (UnauthorizedError, ForbiddenError, NotFoundError), e:
+                person = None
+            if not isinstance(person, Person) or person.id is None:
+                person = self.findAuthenticatedPerson()
+            if (isinstance(person, Person) and person.id is not None and
+                    self.identityCache is not None):
+                self.identityCache.set(self.url, self.username,
+                                       person.toDict())
+        
+        if isinstance(person, Person) and person.id is not None:
+            self._authenticatedPerson = person
+        return person
+    
+    def findAuthenticatedPerson(self):
+        """Find authenticated person with implicit lookups
+        
         Basecamp API doesn't provide any methods to get authenticated
         user. That's why this method is implemented using a few implicit
         calls to Basecamp API. This works not so quickly as it is
@@ -748,11 +1159,15 @@ class Basecamp(object):
         
         # TODO: this is not working either, ForbiddenError is raised
         rootElement = self.fromXML(self.get('/projects/%d/post_categories' % projects[0].id).contents)
-        categories = rootElement.getElementsByTagName('post-category')
-        if not len(categories) > 0:   # can't do anything if we have not categories yet
-            return None
-        else:
-            category = Category.load(categories[0])
+        try:
+            categories = rootElement.getElementsByTagName('post-category')
+            if not len(categories) > 0:   # can't do anything if we have not categories yet
+                return None
+            else:
+                category = self.loadResource(Category, categories[0])
+        finally:
+            if rootElement is not None:
+                rootElement.ownerDocument.unlink()
         
         # create message using legacy API, cause new REST based API
         # won't return any useful information in it's response
@@ -761,15 +1176,108 @@ class Basecamp(object):
                           title='temporary message to take login for client person')
         response = self.post(path, data="""<request>%s</request>""" % message.serialize())
         if response.status == 201:    # successfuly created entry
-            message_id = int(dict(response.headers)['location'].split('/')[-1][:-4])
-            self.destroyMessage(message_id)
-            return message
+            message_id = int(response.headers['location'].split('/')[-1][:-4])
+            # author of the message is the authenticated person
+            rootElement = self.fromXML(response.contents)
+            try:
+                self.destroyMessage(message_id)
+                if rootElement is None:
+                    return None
+                authors = rootElement.getElementsByTagName('author-id')
+                if not len(authors) > 0:
+                    return None
+                person_id = int(''.join([node.data for node in authors[0].childNodes
+                                         if node.nodeType == node.TEXT_NODE]))
+            finally:
+                # the message is gone, free its tree right away
+                if rootElement is not None:
+                    rootElement.ownerDocument.unlink()
+            try:
+                return self.getPersonById(person_id)
+            except (UnauthorizedError, ForbiddenError, NotFoundError), e:
+                # clients may not be allowed to see people, id is all we got
+                return Person(id=person_id, user_name=self.username)
         else:
             return None
     
     
     # Message API Calls
     
+    @cached(('messages', 'project_id'))
+    def getMessages(self, project_id, page=1):
+        """Get messages (page of them)
+        
+        REST: GET /projects/#{project_id}/posts.xml?page=#{page}
+        
+        Returns a page of the most recent messages in the given project,
+        newest first. Use iterMessages to go through all of them.
+        
+        Response:
+            <posts type="array">
+                <post>
+                    ...
+                </post>
+                ...
+            </posts>
+        """
+        # ensure that we got numerical ids
+        assert isinstance(project_id, int)
+        assert isinstance(page, int) and page > 0
+        
+        path = '/projects/%d/posts.xml' % project_id
+        if page > 1:
+            path = '%s?page=%d' % (path, page)
+        response = self.get(path)
+        if response.status == 404:
+            raise NotFoundError, 'Project with %d id is not found!' % \
+                project_id
+        if response.status != 200:
+            return self.getErrors(response.contents)
+        return self.decodeResources(Message, response.contents)
+
+    def iterMessages(self, project_id, readAhead=2):
+        """Get all messages of project as a stream
+        
+        Pages are fetched until an empty one, one shorter than the
+        first or one repeating the previous page, which is what servers
+        ignoring `page` return. While messages of a page are consumed the next `readAhead`
+        pages are fetched in background sessions, no more pages are
+        requested once the caller stops iterating.
+        """
+        assert isinstance(project_id, int)
+        assert readAhead >= 0
+        
+        def fetch(page):
+            return self.clone().getMessages(project_id, page)
+        
+        pending = deque()
+        nextPage = 1
+        pageSize = None
+        previous = None
+        last = False
+        while True:
+            while not last and len(pending) <= readAhead:
+                pending.append(workers.callInThread(fetch, nextPage))
+                nextPage += 1
+            if not pending:
+                return
+            messages = pending.popleft().result()
+            if messages and not isinstance(messages[0], Message):
+                raise ResponseError, '%s (project %d)' % (
+                    ', '.join(messages), project_id)
+            ids = [message.id for message in messages]
+            if messages and ids == previous:
+                return
+            previous = ids
+            if pageSize is None:
+                pageSize = len(messages)
+            if not messages or len(messages) < pageSize:
+                # pages fetched ahead are past the end
+                last = True
+                pending.clear()
+            for message in messages:
+                yield message
+
     def createMessage(self, project_id, title, category_id, body='',
                       extended_body='', private=0, notifiers=[],
                       attachments=[], milestone_id=None):
@@ -838,7 +1346,9 @@ class Basecamp(object):
 
         # successfuly created entry
         if response.status == 201:
-            message.id = int(dict(response.headers)['location'].split('/')[-1][:-4])
+            message.id = int(response.headers['location'].split('/')[-1][:-4])
+            if self.resourceCache is not None:
+                self.resourceCache.invalidate(('messages', project_id))
             return message
         return self.getErrors(response.contents)
 
@@ -858,15 +1368,26 @@ class Basecamp(object):
         path = '/posts/%d.xml' % id
         response = self.delete(path)
         if response.status == 200:
+            if self.resourceCache is not None:
+                self.resourceCache.remove(Message, id)
             return True
         elif response.status == 404:
             raise NotFoundError, 'Message with <%d> id is not found!' % id
         else:
             return self.getErrors(response.contents)
+
+    def destroyMessages(self, ids, concurrency=4, retries=3):
+        """Destroy many messages at once
+        
+        See completeTodoItems for details.
+        """
+        return bulk.batchCall(self, 'destroyMessage', ids, concurrency,
+                              retries)
     
     
     # Categories API Calls
     
+    @cached(('categories', 'project_id'))
     def getCategories(self, project_id, cat_type=None):
         """Get categories
         
@@ -893,12 +1414,23 @@ class Basecamp(object):
                     cat_type.lower() in ['post', 'attachment'])
             path = '%s?type=%s' % (path, cat_type.lower())
             
-        rootElement = self.fromXML(self.get(path).contents)
-        # TODO: use special Array attribute
-        categories = []
-        for data in rootElement.getElementsByTagName('category'):
-            categories.append(Category.load(data))
-        return categories
+        return self.decodeResources(Category, self.get(path).contents)
+
+
+    # Snapshots
+    
+    def crawl(self, spec, concurrency=8):
+        """Collect resources described by spec
+        
+        Spec is a nested dict of resource kinds to collect, e.g.:
+        
+            {'projects': {'companies': {'people': {}}, 'categories': {}},
+             'todo_lists': {'todo_items': {'time_entries': {}}}}
+        
+        Returns Crawler yielding (kind, parent, resource, new) tuples as
+        resources are fetched, see crawler module for details.
+        """
+        return crawler.Crawler(self, spec, concurrency)
 
 
     # Helpful functions
@@ -908,12 +1440,19 @@ class Basecamp(object):
         errors = self.fromXML(xml)
         if errors is None:
             return ['Invalid xml in response: %s.' % xml]
-        errors = errors.getElementsByTagName('error')
-        return [error.childNodes[0].nodeValue for error in errors]
+        try:
+            return [error.childNodes[0].nodeValue
+                    for error in errors.getElementsByTagName('error')]
+        finally:
+            errors.ownerDocument.unlink()
     
-    def open(self, path='', data=None, params=None, headers={}, method='GET'):
+    def open(self, path='', data=None, params=None, headers={}, method='GET',
+             stream=False):
         """Wrap RESTClient open method to add constantly some extra headers,
         catch a few common errors, etc...
+        
+        Returns restclient.Response, with stream set its contents is
+        a file-like object.
         """
         url = '%s%s' % (self.url, path)
         
@@ -923,19 +1462,30 @@ class Basecamp(object):
             h['Content-Length'] = isinstance(data, (str, unicode)) and len(data
                 ) or 0
         
-        self.client.open(url, data, params, h, method)
-        if self.client.status == 401:
+        timeout = self.timeout
+        if self._deadline is not None:
+            timeout = self._deadline.limit(timeout)
+        try:
+            response = self.client.open(url, data, params, h, method,
+                                        timeout, self._cancellation, stream)
+        except RequestTimeoutError:
+            if self._deadline is not None:
+                # raises DeadlineExceededError if it is the reason
+                self._deadline.remaining()
+            raise
+        if response.status == 401:
             raise UnauthorizedError, 'Perhaps your credentials (login or ' \
-                'password) are not correct. %s (%s).' % (self.client.contents,
-                url)
-        elif self.client.status == 403:
-            raise ForbiddenError, '%s (%s).' % (dict(self.client.headers
-                )['status'], url)
-        elif dict(self.client.headers)['status'] == \
+                'password) are not correct. %s (%s).' % (response.read(), url)
+        elif response.status == 403:
+            response.close()
+            raise ForbiddenError, '%s (%s).' % (response.headers.get('status'),
+                                                url)
+        elif response.headers.get('status') == \
              '404 The requested account could not be found':
+            response.close()
             raise NotFoundError, 'The requested account could not be found. ' \
                 '(%s)' % url
-        return self.client
+        return response
     
     def get(self, path='', params=None, headers={}):
         return self.open(path, None, params, headers)
@@ -950,6 +1500,89 @@ class Basecamp(object):
         return self.open(path, None, params, headers, 'DELETE')
 
     # Utility methods
+    def loadResource(self, factory, data):
+        """Build resource from xml node
+        """
+        resource = factory.load(data)
+        if self.identityMap is not None:
+            resource = self.identityMap.merge(resource)
+        return resource
+
+    def loadResources(self, factory, rootElement):
+        """Build resources from all nodes of factory type found
+        inside the root element
+        """
+        return [self.loadResource(factory, data) for data in
+                rootElement.getElementsByTagName(factory._resource_type)]
+
+    def decodeResource(self, factory, contents):
+        """Parse xml response and build resource from its root element
+        """
+        rootElement = self.fromXML(contents)
+        try:
+            return self.loadResource(factory, rootElement)
+        finally:
+            # resources don't refer to the tree, free it without
+            # waiting for garbage collector
+            if rootElement is not None:
+                rootElement.ownerDocument.unlink()
+
+    def decodeResources(self, factory, contents):
+        """Parse xml response and build resources of factory type
+        
+        Large responses are decoded in worker processes if parse
+        offload is enabled, with bulk decoder set no DOM is built.
+        """
+        if (self.parseOffload is not None and
+                self.parseOffload.accepts(contents)):
+            resources = self.parseOffload.decode(factory, contents)
+        elif self.bulkDecoder is not None:
+            resources = self.bulkDecoder.decode(factory, contents)
+        else:
+            rootElement = self.fromXML(contents)
+            try:
+                return self.loadResources(factory, rootElement)
+            finally:
+                if rootElement is not None:
+                    rootElement.ownerDocument.unlink()
+        if self.identityMap is not None:
+            resources = [self.identityMap.merge(resource)
+                         for resource in resources]
+        return resources
+
+    def iterResources(self, factory, path, params=None):
+        """Stream resources of factory type from GET response
+        
+        Response is parsed incrementally while it is read from network,
+        only the resource being built is kept in memory.
+        """
+        response = self.open(path, params=params, stream=True)
+        body = response.contents
+        try:
+            if response.status != 200:
+                errors = self.getErrors(body.read())
+                if response.status == 404:
+                    raise NotFoundError, '%s (%s)' % (', '.join(errors), path)
+                raise ResponseError, '%s (%s)' % (', '.join(errors), path)
+            if self.bulkDecoder is not None:
+                for resource in self.bulkDecoder.iterparse(factory, body):
+                    if self.identityMap is not None:
+                        resource = self.identityMap.merge(resource)
+                    yield resource
+                return
+            events = pulldom.parse(body)
+            for event, node in events:
+                if event == pulldom.START_ELEMENT and \
+                        node.tagName == factory._resource_type:
+                    events.expandNode(node)
+                    # text may arrive in several chunks
+                    node.normalize()
+                    resource = self.loadResource(factory, node)
+                    node.unlink()
+                    yield resource
+        finally:
+            body.close()
+
     def fromXML(self, content):
         try:
             dom = minidom.parseString(content)
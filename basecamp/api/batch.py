@@ -0,0 +1,257 @@
+"""Columnar batches of resources of the same type
+
+Pickled list of resources carries class reference and attribute names
+for every resource. ResourceBatch keeps values of every attribute packed
+together in a column, so the whole batch is a small header and a single
+string of data:
+
+    >>> batch = ResourceBatch.fromResources(TimeEntry, entries)
+    >>> data = cPickle.dumps(batch, 2)
+
+To hand a batch to another process without pickling data at all, put it
+into shared memory and pass the path; the other process maps the file
+and reads values straight from it:
+
+    >>> path = batch.share()
+    >>> batch = ResourceBatch.attach(path, unlink=True)
+    >>> hours = batch.column('hours')
+
+Integer, boolean and text attributes are packed into binary columns,
+nested resources and arrays are stored pickled.
+"""
+import os
+import mmap
+import json
+import struct
+import tempfile
+import cPickle
+
+from offload import pack, unpack
+from resources.base import _VALUE, _ARRAY
+from resources.attributes import IntegerAttribute, BooleanAttribute
+
+# column kinds
+INT, BOOL, TEXT, OBJECT = 'int', 'bool', 'text', 'object'
+
+# None in integer columns
+NULL_INT = -2 ** 63
+
+SHARED_DIR = '/dev/shm'
+
+
+def kindOf(field, kind=_VALUE):
+    if kind is not _VALUE:
+        return OBJECT
+    if isinstance(field, IntegerAttribute):
+        return INT
+    if isinstance(field, BooleanAttribute):
+        return BOOL
+    return TEXT
+
+
+def encodeColumn(kind, fieldKind, values):
+    """Return packed column data
+    """
+    count = len(values)
+    if kind == INT:
+        return struct.pack('=%dq' % count, *[NULL_INT if value is None else
+                                             value for value in values])
+    if kind == BOOL:
+        return struct.pack('=%db' % count, *[-1 if value is None else
+                                             int(bool(value))
+                                             for value in values])
+    if kind == TEXT:
+        # offsets of values in text, nulls flags and text itself
+        offsets = [0]
+        nulls = bytearray(count)
+        pieces = []
+        position = 0
+        for i, value in enumerate(values):
+            if value is None:
+                nulls[i] = 1
+            else:
+                if isinstance(value, unicode):
+                    value = value.encode('utf-8')
+                pieces.append(value)
+                position += len(value)
+            offsets.append(position)
+        return struct.pack('=%dq' % (count + 1), *offsets) + str(nulls) + \
+            ''.join(pieces)
+    if fieldKind is _ARRAY:
+        values = [None if value is None else [pack(item) for item in value]
+                  for value in values]
+    else:
+        values = [None if value is None else pack(value) for value in values]
+    return cPickle.dumps(values, 2)
+
+
+def _rebuild(factory, count, columns, data):
+    return ResourceBatch(factory, count, columns, data)
+
+
+class ResourceBatch(object):
+    """Immutable columnar batch of resources of factory type
+
+    columns - list of (name, kind, start, size) of columns in data
+    data - string or buffer with packed columns
+    """
+
+    def __init__(self, factory, count, columns, data):
+        self.factory = factory
+        self.count = count
+        self.columns = [tuple(column) for column in columns]
+        self.data = data
+        self._fields = dict((name, (kind, nested)) for name, kind, nested
+                            in factory.fieldTable())
+        self._objects = {}
+        self._map = None
+
+    @classmethod
+    def fromResources(cls, factory, resources):
+        """Pack resources of factory type into batch
+        """
+        resources = list(resources)
+        columns = []
+        pieces = []
+        start = 0
+        for name, fieldKind, nested in factory.fieldTable():
+            field = factory.__dict__[name]
+            kind = kindOf(field, fieldKind)
+            values = [resource.__dict__.get(name) for resource in resources]
+            piece = encodeColumn(kind, fieldKind, values)
+            columns.append((name, kind, start, len(piece)))
+            pieces.append(piece)
+            start += len(piece)
+        return cls(factory, len(resources), columns, ''.join(pieces))
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for i in xrange(self.count):
+            yield self[i]
+
+    def __getitem__(self, index):
+        """Build resource at index
+        """
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError, 'batch index out of range'
+        resource = self.factory.__new__(self.factory)
+        values = resource.__dict__
+        for column in self.columns:
+            value = self._value(column, index)
+            if value is not None:
+                values[column[0]] = value
+        return resource
+
+    def column(self, name):
+        """Return list of all values of the attribute
+        """
+        for column in self.columns:
+            if column[0] == name:
+                break
+        else:
+            raise KeyError, name
+        name, kind, start, size = column
+        count = self.count
+        if kind == INT:
+            return [None if value == NULL_INT else value for value in
+                    struct.unpack_from('=%dq' % count, self.data, start)]
+        if kind == BOOL:
+            return [None if value < 0 else bool(value) for value in
+                    struct.unpack_from('=%db' % count, self.data, start)]
+        return [self._value(column, i) for i in xrange(count)]
+
+    def _value(self, column, index):
+        name, kind, start, size = column
+        data = self.data
+        if kind == INT:
+            value = struct.unpack_from('=q', data, start + 8 * index)[0]
+            return None if value == NULL_INT else value
+        if kind == BOOL:
+            value = struct.unpack_from('=b', data, start + index)[0]
+            return None if value < 0 else bool(value)
+        if kind == TEXT:
+            nulls = start + 8 * (self.count + 1)
+            if data[nulls + index] != '\0':
+                return None
+            begin, end = struct.unpack_from('=2q', data, start + 8 * index)
+            text = nulls + self.count
+            return data[text + begin:text + end].decode('utf-8')
+        objects = self._objects.get(name)
+        if objects is None:
+            objects = self._objects[name] = \
+                cPickle.loads(data[start:start + size])
+        value = objects[index]
+        if value is None:
+            return None
+        kind, nested = self._fields[name]
+        if kind is _ARRAY:
+            return [unpack(nested, item) for item in value]
+        return unpack(nested, value)
+
+    def __reduce__(self):
+        data = self.data
+        if not isinstance(data, str):
+            data = data[:]
+        return _rebuild, (self.factory, self.count, self.columns, data)
+
+    # Shared memory
+    def share(self, path=None):
+        """Write batch into a file in shared memory and return its path
+
+        The file is left for the receiving side to remove, see attach.
+        """
+        if path is None:
+            directory = os.path.isdir(SHARED_DIR) and SHARED_DIR or None
+            fd, path = tempfile.mkstemp(prefix='basecamp-batch-',
+                                        dir=directory)
+            stream = os.fdopen(fd, 'wb')
+        else:
+            stream = open(path, 'wb')
+        header = json.dumps({'module': self.factory.__module__,
+                             'factory': self.factory.__name__,
+                             'count': self.count,
+                             'columns': self.columns})
+        try:
+            stream.write(struct.pack('=q', len(header)))
+            stream.write(header)
+            stream.write(self.data)
+        finally:
+            stream.close()
+        return path
+
+    @classmethod
+    def attach(cls, path, unlink=False):
+        """Map batch shared at path, values are read without copying it
+
+        With unlink set, the file is removed once mapped; the memory is
+        released when batch is closed.
+        """
+        stream = open(path, 'rb')
+        try:
+            mapped = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            stream.close()
+        if unlink:
+            os.unlink(path)
+        size = struct.unpack_from('=q', mapped)[0]
+        header = json.loads(mapped[8:8 + size])
+        module = __import__(header['module'], {}, {}, [str(header['factory'])])
+        factory = getattr(module, header['factory'])
+        batch = cls(factory, header['count'],
+                    [(str(name), str(kind), start, length) for
+                     name, kind, start, length in header['columns']],
+                    buffer(mapped, 8 + size))
+        batch._map = mapped
+        return batch
+
+    def close(self):
+        """Unmap shared memory of attached batch
+        """
+        if self._map is not None:
+            self.data = None
+            self._map.close()
+            self._map = None
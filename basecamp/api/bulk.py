@@ -0,0 +1,269 @@
+"""Bulk Basecamp API calls
+
+Time entries import: entries are validated and serialized before the
+first request is made, then posted concurrently by a few worker sessions.
+Imported entries are recorded in an optional checkpoint file, so an
+interrupted import can be started again with the same input and it will
+only post what is left.
+
+Batch mutations: the same complete/uncomplete/destroy call is made for
+many ids by worker sessions sharing a pool of keep-alive connections,
+transient failures are retried.
+"""
+import os
+import time
+import socket
+import httplib
+import threading
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+from resources import TimeEntry
+from transport import ConnectionPool
+from workers import RateLimiter, runConcurrently
+
+# fields accepted from CSV rows or dicts
+FIELDS = ('todo_item_id', 'project_id', 'person_id', 'date', 'hours',
+          'description')
+
+# statuses worth retrying: server errors and Basecamp throttling
+TRANSIENT_STATUSES = (500, 502, 503, 504)
+
+_marker = object()
+
+
+class Checkpoint(object):
+    """Append-only journal of already imported entries
+
+    Every line holds an entry key and id of the time entry created for it.
+    An entry posted right before a crash may get created without being
+    recorded, so at most `concurrency` entries can be duplicated on resume.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            for line in open(path):
+                parts = line.split()
+                # skip torn last line
+                if len(parts) == 2:
+                    self.entries[parts[0]] = int(parts[1])
+        self._file = open(path, 'a')
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def record(self, key, entry_id):
+        self._lock.acquire()
+        try:
+            self.entries[key] = entry_id
+            self._file.write('%s %d\n' % (key, entry_id))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        finally:
+            self._lock.release()
+
+    def close(self):
+        self._file.close()
+
+
+def _hasPerson(entry):
+    if isinstance(entry, TimeEntry):
+        return entry.person_id is not None
+    return bool(entry.get('person_id'))
+
+
+def entryKey(index, entry):
+    """Return checkpoint key of input entry
+
+    The key is taken from the input as given, before defaults like the
+    current date are applied, so it stays the same on a later resume.
+    """
+    if isinstance(entry, TimeEntry):
+        entry = entry.__dict__
+    values = []
+    for name in FIELDS:
+        value = entry.get(name)
+        if value is None:
+            value = ''
+        elif isinstance(value, unicode):
+            value = value.encode('utf-8')
+        values.append('%s=%s' % (name, value))
+    return '%d-%s' % (index, sha1('\n'.join(values)).hexdigest())
+
+
+def prepareTimeEntry(entry, person_id=None):
+    """Validate time entry or CSV row and return (path, entry) tuple
+
+    Raises ValueError describing the first problem found.
+    """
+    if not isinstance(entry, TimeEntry):
+        data = {}
+        for name in FIELDS:
+            value = entry.get(name)
+            if value is not None and value != '':
+                data[name] = value
+        try:
+            entry = TimeEntry(**data)
+        except ValueError, e:
+            raise ValueError, 'Invalid value: %s' % e
+
+    if (entry.todo_item_id is None) == (entry.project_id is None):
+        raise ValueError, 'Exactly one of todo_item_id and project_id ' \
+            'should be given'
+    try:
+        float(entry.hours)
+    except (TypeError, ValueError):
+        raise ValueError, 'Invalid hours: %r' % entry.hours
+    if entry.date is None:
+        entry.date = time.strftime('%Y-%m-%d')
+    try:
+        time.strptime(entry.date, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise ValueError, 'Invalid date: %r' % entry.date
+    if entry.person_id is None:
+        if person_id is None:
+            raise ValueError, 'Person is not given'
+        entry.person_id = person_id
+
+    if entry.todo_item_id is not None:
+        path = '/todo_items/%d/time_entries.xml' % entry.todo_item_id
+    else:
+        path = '/projects/%d/time_entries.xml' % entry.project_id
+    return path, entry
+
+
+def importTimeEntries(bc, entries, concurrency=4, rate=None,
+                      checkpoint=None):
+    """Create all given time entries
+
+    entries - iterable of TimeEntry objects or dicts (e.g. rows from
+              csv.DictReader) with todo_item_id or project_id, person_id,
+              date, hours and description keys
+    concurrency - number of requests made at the same time
+    rate - maximum number of requests started per second
+    checkpoint - path to checkpoint file to resume interrupted import from
+
+    Returns list of created time entries in the input order, failed
+    entries are represented with list of errors instead.
+    """
+    person_id = _marker
+    prepared = []
+    problems = []
+    for index, entry in enumerate(entries):
+        if person_id is _marker and not _hasPerson(entry):
+            # resolve authenticated person only once for all entries
+            person = bc.getAuthenticatedPerson()
+            person_id = person is not None and person.id or None
+        key = entryKey(index, entry)
+        try:
+            path, entry = prepareTimeEntry(entry,
+                person_id is not _marker and person_id or None)
+        except ValueError, e:
+            problems.append('Entry #%d: %s' % (index, e))
+            continue
+        data = entry.serialize()
+        prepared.append((key, path, data, entry))
+    if problems:
+        raise ValueError, '\n'.join(problems)
+
+    if checkpoint is not None:
+        checkpoint = Checkpoint(checkpoint)
+    results = [None] * len(prepared)
+    pending = []
+    for index, (key, path, data, entry) in enumerate(prepared):
+        if checkpoint is not None and key in checkpoint:
+            entry.id = checkpoint.get(key)
+            results[index] = entry
+        else:
+            pending.append((index, key, path, data, entry))
+
+    sessions = threading.local()
+
+    def post(item):
+        index, key, path, data, entry = item
+        session = getattr(sessions, 'session', None)
+        if session is None:
+            session = sessions.session = bc.clone()
+        response = session.post(path, data=data)
+        if response.status == 201:
+            entry.id = int(response.headers['location'].split('/')[-1])
+            if checkpoint is not None:
+                checkpoint.record(key, entry.id)
+            return entry
+        return session.getErrors(response.contents)
+
+    limiter = rate and RateLimiter(rate, burst=concurrency) or None
+    try:
+        for position, item, result, error in runConcurrently(post, pending,
+                concurrency, limiter):
+            if error is not None:
+                raise error[0], error[1], error[2]
+            results[item[0]] = result
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+    return results
+
+
+def batchCall(bc, method, ids, concurrency=4, retries=3, backoff=0.5):
+    """Call given Basecamp method for every id
+
+    method - name of Basecamp method taking single id, e.g.
+             'completeTodoItem'
+    retries - how many times a call is repeated after network errors
+              or 5xx responses
+    backoff - delay before the first retry, doubled after each attempt,
+              Retry-After header sent by Basecamp takes precedence
+
+    Returns dict mapping every id to True on success, to list of errors
+    returned by Basecamp, or to the exception raised by the call.
+    """
+    pool = bc.client.pool
+    if pool is None:
+        pool = ConnectionPool(concurrency)
+    sessions = threading.local()
+
+    def call(id):
+        session = getattr(sessions, 'session', None)
+        if session is None:
+            session = sessions.session = bc.clone()
+            session.client.pool = pool
+        attempt = 0
+        while True:
+            delay = backoff * 2 ** attempt
+            try:
+                result = getattr(session, method)(id)
+            except (socket.error, httplib.HTTPException):
+                if attempt >= retries:
+                    raise
+            else:
+                response = session.client.response
+                if (result is True or attempt >= retries or
+                        response.status not in TRANSIENT_STATUSES):
+                    return result
+                retryAfter = response.headers.get('retry-after')
+                if retryAfter and retryAfter.isdigit():
+                    delay = int(retryAfter)
+            attempt += 1
+            time.sleep(delay)
+
+    results = {}
+    try:
+        for index, id, result, error in runConcurrently(call, ids,
+                                                        concurrency):
+            if error is not None:
+                result = error[1]
+            results[id] = result
+    finally:
+        if pool is not bc.client.pool:
+            pool.clear()
+    return results
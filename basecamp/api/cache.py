@@ -0,0 +1,287 @@
+"""Local cache of Basecamp read results
+
+Results of read methods are cached under the method name and arguments,
+tagged by (kind, id) pairs of entities they depend on, e.g.
+('time_entries', project_id). Mutation methods keep cached results
+consistent: they update cached resources in place where the change is
+known, e.g. complete a todo item in cached todo lists, and invalidate
+only results tagged by what they touch otherwise:
+
+    >>> bc.useResourceCache()
+    >>> lists = bc.getTodoLists()        # fetched
+    >>> bc.completeTodoItem(item_id)     # item in lists is completed
+    >>> lists = bc.getTodoLists()        # no request
+
+Changes made by others are only seen once results expire (maxAge) or
+are read by a session with refreshCache set, which fetches them again
+and replaces cached ones.
+"""
+import time
+import inspect
+import threading
+from collections import OrderedDict
+
+from resources.base import Resource
+
+_miss = object()
+
+
+def walk(value):
+    """Yield resources in value and resources nested in them
+    """
+    if isinstance(value, list):
+        for item in value:
+            for resource in walk(item):
+                yield resource
+    elif isinstance(value, Resource):
+        yield value
+        for name, kind, factory in value.fieldTable():
+            nested = value.__dict__.get(name)
+            if nested is not None and factory is not None:
+                for resource in walk(nested):
+                    yield resource
+
+
+def cacheable(value):
+    """Only resources and lists of resources are cached, not errors
+    """
+    if isinstance(value, list):
+        for item in value:
+            if not isinstance(item, Resource):
+                return False
+        return True
+    return isinstance(value, Resource)
+
+
+class ResourceCache(object):
+    """LRU cache of resources and lists of resources with tags
+
+    No more than maxsize results are kept, for no longer than maxAge
+    seconds if it is set. Tags are (kind, id) pairs, id None stands for
+    results depending on all entities of that kind.
+    """
+
+    def __init__(self, maxsize=1000, maxAge=None):
+        self.maxsize = maxsize
+        self.maxAge = maxAge
+        self._entries = OrderedDict()
+        # kind -> id -> keys
+        self._tags = {}
+        # (class, id) -> keys of results containing such resource
+        self._index = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(key, _miss)
+            if entry is _miss:
+                return default
+            if self.maxAge is not None and \
+                    time.time() - entry[3] > self.maxAge:
+                self._drop(key)
+                return default
+            # move to the end of LRU order
+            del self._entries[key]
+            self._entries[key] = entry
+            value = entry[0]
+        finally:
+            self._lock.release()
+        if isinstance(value, list):
+            return list(value)
+        return value
+
+    def set(self, key, value, tags=()):
+        self._lock.acquire()
+        try:
+            self._drop(key)
+            if isinstance(value, list):
+                value = list(value)
+            refs = set([(resource.__class__, resource.__dict__.get('id'))
+                        for resource in walk(value)])
+            self._entries[key] = (value, tuple(tags), refs, time.time())
+            for kind, id in tags:
+                self._tags.setdefault(kind, {}).setdefault(id, set()).add(key)
+            for ref in refs:
+                self._index.setdefault(ref, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(iter(self._entries).next())
+        finally:
+            self._lock.release()
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        value, tags, refs, stored = entry
+        for kind, id in tags:
+            keys = self._tags[kind][id]
+            keys.discard(key)
+            if not keys:
+                del self._tags[kind][id]
+        for ref in refs:
+            keys = self._index[ref]
+            keys.discard(key)
+            if not keys:
+                del self._index[ref]
+
+    def invalidate(self, *tags):
+        """Drop results tagged by any of given (kind, id) tags
+
+        Results tagged by (kind, None) depend on every entity of the
+        kind and are dropped too, tag with id None drops all of them.
+        """
+        self._lock.acquire()
+        try:
+            keys = set()
+            for kind, id in tags:
+                ids = self._tags.get(kind, {})
+                if id is None:
+                    for tagged in ids.values():
+                        keys.update(tagged)
+                else:
+                    keys.update(ids.get(id, ()))
+                    keys.update(ids.get(None, ()))
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+        finally:
+            self._lock.release()
+
+    def find(self, factory, id):
+        """Return cached resources of factory type with given id
+        """
+        self._lock.acquire()
+        try:
+            found = []
+            for key in self._index.get((factory, id), ()):
+                for resource in walk(self._entries[key][0]):
+                    if resource.__class__ is factory and \
+                            resource.__dict__.get('id') == id and \
+                            resource not in found:
+                        found.append(resource)
+            return found
+        finally:
+            self._lock.release()
+
+    def update(self, factory, id, **values):
+        """Set attribute values of cached resources in place
+        """
+        self._lock.acquire()
+        try:
+            for resource in self.find(factory, id):
+                for name, value in values.items():
+                    setattr(resource, name, value)
+        finally:
+            self._lock.release()
+
+    def insert(self, factory, id, name, resource):
+        """Append resource to array attribute of cached resources
+        """
+        self._lock.acquire()
+        try:
+            for parent in self.find(factory, id):
+                parent.__dict__[name] = parent.__dict__.get(name, []) + \
+                    [resource]
+            self._reindex(resource, self._index.get((factory, id), ()))
+        finally:
+            self._lock.release()
+
+    def append(self, tag, resource):
+        """Append resource to cached lists tagged by tag
+        """
+        self._lock.acquire()
+        try:
+            kind, id = tag
+            keys = self._tags.get(kind, {}).get(id, ())
+            for key in keys:
+                value = self._entries[key][0]
+                if isinstance(value, list):
+                    value.append(resource)
+            self._reindex(resource, keys)
+        finally:
+            self._lock.release()
+
+    def remove(self, factory, id):
+        """Remove resource from cached lists and arrays
+
+        Results being the resource itself are dropped.
+        """
+        self._lock.acquire()
+        try:
+            def keep(item):
+                return not (item.__class__ is factory and
+                            item.__dict__.get('id') == id)
+            ref = (factory, id)
+            for key in list(self._index.get(ref, ())):
+                value = self._entries[key][0]
+                if not isinstance(value, list) and not keep(value):
+                    self._drop(key)
+                    continue
+                if isinstance(value, list):
+                    value[:] = filter(keep, value)
+                for resource in walk(value):
+                    for name, kind, nested in resource.fieldTable():
+                        items = resource.__dict__.get(name)
+                        if isinstance(items, list):
+                            resource.__dict__[name] = filter(keep, items)
+                self._entries[key][2].discard(ref)
+                keys = self._index[ref]
+                keys.discard(key)
+                if not keys:
+                    del self._index[ref]
+        finally:
+            self._lock.release()
+
+    def _reindex(self, resource, keys):
+        refs = [(item.__class__, item.__dict__.get('id'))
+                for item in walk(resource)]
+        for key in list(keys):
+            self._entries[key][2].update(refs)
+            for ref in refs:
+                self._index.setdefault(ref, set()).add(key)
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            self._tags.clear()
+            self._index.clear()
+        finally:
+            self._lock.release()
+
+
+def cached(*tags):
+    """Cache results of Basecamp read method in session resourceCache
+
+    tags - (kind, argument name) pairs, tag id is the value of the
+           argument; None instead of argument name tags with (kind, None)
+
+    Sessions with refreshCache set don't read cached results, they fetch
+    them and replace cached ones.
+    """
+    def decorator(method):
+        def wrapper(self, *args, **kw):
+            cache = self.resourceCache
+            if cache is None:
+                return method(self, *args, **kw)
+            arguments = inspect.getcallargs(method, self, *args, **kw)
+            del arguments['self']
+            key = (method.__name__, tuple(sorted(arguments.items())))
+            result = _miss
+            if not self.refreshCache:
+                result = cache.get(key, _miss)
+            if result is _miss:
+                result = method(self, *args, **kw)
+                if cacheable(result):
+                    cache.set(key, result,
+                              [(kind, name and arguments[name] or None)
+                               for kind, name in tags])
+            return result
+        wrapper.__name__ = method.__name__
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+    return decorator
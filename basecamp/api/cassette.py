@@ -0,0 +1,159 @@
+"""Cassettes: recorded Basecamp sessions stored in files
+
+Cassette is a gzip compressed file with one JSON encoded interaction per
+line (see RecordingTransport), preceded by a header line. Record a
+session once:
+
+    >>> recorder = bc.useCassette('session.cassette', record=True)
+    >>> bc.getEntriesReport('20121101', '20121130')
+    >>> recorder.save()
+
+and replay it later without network, as many times as needed:
+
+    >>> bc.useCassette('session.cassette', latency=0.05)
+    >>> bc.getEntriesReport('20121101', '20121130')
+"""
+import gzip
+import json
+import time
+import threading
+
+from transport import RawResponse, RecordingTransport, ReplayTransport
+from transport import ReplayError
+
+VERSION = 1
+
+
+def _encode(value):
+    # json handles only unicode, keep raw bytes intact with latin-1
+    if isinstance(value, str):
+        return value.decode('latin-1')
+    return value
+
+def _decode(value):
+    if isinstance(value, unicode):
+        return value.encode('latin-1')
+    return value
+
+
+def saveCassette(path, interactions):
+    """Write interactions into cassette file
+    """
+    f = gzip.open(path, 'wb')
+    try:
+        f.write(json.dumps({'version': VERSION,
+                            'interactions': len(interactions)}) + '\n')
+        for interaction in interactions:
+            data = dict(interaction)
+            for name in ('method', 'url', 'body', 'reason', 'response'):
+                data[name] = _encode(data[name])
+            data['headers'] = [(_encode(name), _encode(value))
+                               for name, value in data['headers']]
+            f.write(json.dumps(data, separators=(',', ':')) + '\n')
+    finally:
+        f.close()
+
+
+def loadCassette(path):
+    """Read interactions from cassette file
+    """
+    f = gzip.open(path, 'rb')
+    try:
+        header = json.loads(f.readline())
+        if header.get('version') != VERSION:
+            raise ValueError, 'Unsupported cassette version: %s' % \
+                header.get('version')
+        interactions = []
+        for line in f:
+            data = json.loads(line)
+            for name in ('method', 'url', 'body', 'reason', 'response'):
+                data[name] = _decode(data[name])
+            data['headers'] = [(_decode(name), _decode(value))
+                               for name, value in data['headers']]
+            interactions.append(data)
+        return interactions
+    finally:
+        f.close()
+
+
+class CassetteRecorder(RecordingTransport):
+    """Records interactions made through another transport into cassette
+    """
+
+    def __init__(self, path, transport):
+        super(CassetteRecorder, self).__init__(transport)
+        self.path = path
+
+    def save(self):
+        """Write all interactions recorded so far into cassette
+        """
+        self._lock.acquire()
+        try:
+            interactions = list(self.interactions)
+        finally:
+            self._lock.release()
+        saveCassette(self.path, interactions)
+
+    def close(self):
+        self.save()
+        super(CassetteRecorder, self).close()
+
+
+class CassettePlayer(ReplayTransport):
+    """Replays interactions from cassette
+
+    latency - fixed delay in seconds added to every response, if it is
+              None recorded response times are replayed scaled by speed
+    strict - expect requests in exactly the recorded order, which makes
+             sequential replays deterministic; otherwise responses are
+             matched by method and URL only
+    """
+
+    def __init__(self, path, latency=None, speed=0, loop=False,
+                 strict=False):
+        if latency is not None:
+            speed = 0
+        self.interactions = loadCassette(path)
+        super(CassettePlayer, self).__init__(self.interactions, loop, speed)
+        self.path = path
+        self.latency = latency
+        self.strict = strict
+        self._position = 0
+        self._sequenceLock = threading.Lock()
+
+    def request(self, method, url, body=None, headers=None, timeout=None,
+                cancel=None, stream=False):
+        if not self.strict:
+            response = super(CassettePlayer, self).request(method, url, body,
+                                                           headers, timeout,
+                                                           cancel, stream)
+            if self.latency is not None:
+                time.sleep(self.latency)
+            return response
+
+        if cancel is not None:
+            cancel.check()
+        self._sequenceLock.acquire()
+        try:
+            if self._position >= len(self.interactions):
+                if not self.loop or not self.interactions:
+                    raise ReplayError, 'Cassette is over at %s %s' % (method,
+                                                                        url)
+                self._position = 0
+            interaction = self.interactions[self._position]
+            self._position += 1
+        finally:
+            self._sequenceLock.release()
+        if (interaction['method'], interaction['url']) != (method, url):
+            raise ReplayError, 'Expected %s %s, got %s %s' % (
+                interaction['method'], interaction['url'], method, url)
+        if self.latency is not None:
+            time.sleep(self.latency)
+        elif self.speed:
+            time.sleep(interaction.get('elapsed', 0) / self.speed)
+        response = RawResponse(interaction['status'], interaction['reason'],
+                               list(interaction['headers']),
+                               interaction['response'])
+        if stream:
+            return response.streamed()
+        return response
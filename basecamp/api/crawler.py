@@ -0,0 +1,167 @@
+"""Account snapshot crawler
+
+Collects resources described by a nested spec, e.g.:
+
+    {'projects': {'companies': {'people': {}},
+                  'categories': {},
+                  'todo_lists': {}},
+     'todo_lists': {'todo_items': {'time_entries': {}}}}
+
+Every key is a resource kind and its value is the spec of resources to
+collect for each resource of that kind. Calls for child resources are
+scheduled as soon as their parent is fetched, so independent calls are
+made in parallel by worker sessions.
+"""
+import sys
+import threading
+import Queue
+
+_done = object()
+
+
+def _projects(session, context):
+    return session.getProjects()
+
+def _companies(session, context):
+    if 'projects' in context:
+        return session.getCompaniesForProject(context['projects'].id)
+    return session.getCompanies()
+
+def _categories(session, context):
+    return session.getCategories(context['projects'].id)
+
+def _people(session, context):
+    if 'projects' in context:
+        return session.getPeopleForProject(context['projects'].id,
+                                           context['companies'].id)
+    return session.getPeopleForCompany(context['companies'].id)
+
+def _todoLists(session, context):
+    if 'projects' in context:
+        return session.getTodoListsForProject(context['projects'].id)
+    return session.getTodoLists()
+
+def _todoItems(session, context):
+    # todo items come embedded into todo lists
+    return context['todo_lists'].todo_items
+
+def _timeEntries(session, context):
+    return session.getEntriesForTodoItem(context['todo_items'].id)
+
+# kind: (fetcher, kinds of parents it may be called for)
+KINDS = {
+    'projects': (_projects, (None,)),
+    'companies': (_companies, (None, 'projects')),
+    'categories': (_categories, ('projects',)),
+    'people': (_people, ('companies',)),
+    'todo_lists': (_todoLists, (None, 'projects')),
+    'todo_items': (_todoItems, ('todo_lists',)),
+    'time_entries': (_timeEntries, ('todo_items',)),
+}
+
+
+def validateSpec(spec, parent=None):
+    """Raise ValueError if spec asks for unknown or misplaced resources
+    """
+    for kind, children in spec.items():
+        if kind not in KINDS:
+            raise ValueError, 'Unknown resource kind: %s' % kind
+        if parent not in KINDS[kind][1]:
+            raise ValueError, 'Can not collect %s for %s' % (kind,
+                parent or 'account')
+        validateSpec(children, kind)
+
+
+class Crawler(object):
+    """Collects account snapshot with parallel dependent calls
+
+    Iterating over crawler yields (kind, parent, resource, new) tuples as
+    soon as resources are fetched. Parent is a (kind, id) tuple or None
+    for top level resources. The same resource, e.g. company shared by
+    several projects, is decoded once and yielded with new set to False
+    on next occurrences. Identical calls are made only once.
+
+    Errors raised by calls (e.g. ForbiddenError for client users) do not
+    stop crawling, they are collected in `errors` list as
+    (kind, parent, exception) tuples.
+
+    roots - dict of top level kinds and resources to crawl instead of
+            fetching all of them, e.g. {'projects': changedProjects}
+    """
+
+    def __init__(self, bc, spec, concurrency=8, roots=None):
+        validateSpec(spec)
+        self.bc = bc
+        self.spec = spec
+        self.concurrency = concurrency
+        self.roots = roots or {}
+        self.errors = []
+
+    def __iter__(self):
+        tasks = Queue.Queue()
+        results = Queue.Queue()
+
+        def work():
+            session = self.bc.clone()
+            while True:
+                task = tasks.get()
+                if task is _done:
+                    break
+                kind, spec, context, parent = task
+                try:
+                    result = KINDS[kind][0](session, context)
+                except Exception:
+                    results.put((task, None, sys.exc_info()[1]))
+                else:
+                    results.put((task, result, None))
+
+        threads = [threading.Thread(target=work)
+                   for i in range(self.concurrency)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        seen = {}
+        calls = set()
+        pending = [0]
+
+        def schedule(spec, context, parent):
+            for kind, children in spec.items():
+                key = (kind, tuple(sorted((name, resource.id) for name,
+                    resource in context.items())))
+                if key in calls:
+                    continue
+                calls.add(key)
+                pending[0] += 1
+                if not context and kind in self.roots:
+                    results.put(((kind, children, context, parent),
+                                 self.roots[kind], None))
+                else:
+                    tasks.put((kind, children, context, parent))
+
+        try:
+            schedule(self.spec, {}, None)
+            while pending[0]:
+                (kind, spec, context, parent), result, error = results.get()
+                pending[0] -= 1
+                if error is not None:
+                    self.errors.append((kind, parent, error))
+                    continue
+                for resource in result or []:
+                    key = (kind, resource.id)
+                    new = key not in seen
+                    if new:
+                        seen[key] = resource
+                    else:
+                        resource = seen[key]
+                    if spec:
+                        children = context.copy()
+                        children[kind] = resource
+                        schedule(spec, children, key)
+                    yield kind, parent, resource, new
+        finally:
+            for thread in threads:
+                tasks.put(_done)
+        # all calls are done here, so workers exit immediately
+        for thread in threads:
+            thread.join()
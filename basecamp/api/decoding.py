@@ -0,0 +1,125 @@
+"""Bulk decoding of xml responses without cyclic garbage
+
+minidom trees are webs of parent/child references, so every parsed
+response is garbage the cyclic collector has to find, and building
+thousands of resources triggers full collections on the way. BulkDecoder
+parses with cElementTree, whose elements don't refer to their parents,
+builds resources straight from elements and frees them as it goes, so
+everything is released by reference counting. The collector is paused
+while decoding:
+
+    >>> bc.useBulkDecoder()
+    >>> entries = bc.getEntriesReport('20120101', '20121231')
+"""
+import gc
+import threading
+from cStringIO import StringIO
+from contextlib import contextmanager
+
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+
+from resources.base import tagName2Attribute, _RESOURCE, _ARRAY
+
+_gcLock = threading.Lock()
+_gcPauses = [0, False]
+
+
+@contextmanager
+def gcPaused():
+    """Disable cyclic garbage collector inside the with block
+
+    Pauses nest and may overlap in several threads, the collector is
+    enabled again when the last one is over if it was enabled before.
+    """
+    _gcLock.acquire()
+    try:
+        if _gcPauses[0] == 0:
+            _gcPauses[1] = gc.isenabled()
+            gc.disable()
+        _gcPauses[0] += 1
+    finally:
+        _gcLock.release()
+    try:
+        yield
+    finally:
+        _gcLock.acquire()
+        try:
+            _gcPauses[0] -= 1
+            if _gcPauses[0] == 0 and _gcPauses[1]:
+                gc.enable()
+        finally:
+            _gcLock.release()
+
+
+def loadElement(factory, element):
+    """Build resource of factory type from ElementTree element
+
+    Counterpart of Resource.load for elements.
+    """
+    resource = factory()
+    table = dict([(name, (kind, nested))
+                  for name, kind, nested in factory.fieldTable()])
+    for child in element:
+        name = tagName2Attribute(child.tag)
+        kind, nested = table.get(name, (None, None))
+        if kind is _RESOURCE:
+            if len(child):
+                resource.__dict__[name] = loadElement(nested, child)
+        elif kind is _ARRAY:
+            resource.__dict__[name] = [loadElement(nested, item)
+                                       for item in child]
+        elif len(child):
+            # unknown nested element is kept as it is
+            setattr(resource, name, child)
+        elif child.text:
+            setattr(resource, name, unicode(child.text))
+    return resource
+
+
+class BulkDecoder(object):
+    """Decodes xml responses into resources with cElementTree
+
+    pauseGC - disable cyclic garbage collector while decoding
+    """
+
+    def __init__(self, pauseGC=True):
+        self.pauseGC = pauseGC
+
+    def iterparse(self, factory, stream):
+        """Yield resources of factory type read from file-like stream
+
+        Elements are cleared once resources are built from them, so only
+        the resource being built is kept in memory.
+        """
+        tag = factory._resource_type
+        root = None
+        depth = 0
+        for event, element in ElementTree.iterparse(stream,
+                                                    ('start', 'end')):
+            if root is None:
+                root = element
+            if element.tag != tag:
+                continue
+            if event == 'start':
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 0:
+                resource = loadElement(factory, element)
+                element.clear()
+                # drop elements built so far, resources may be nested
+                # in elements still being parsed but these are detached
+                root.clear()
+                yield resource
+
+    def decode(self, factory, contents):
+        """Return list of resources of factory type found in xml string
+        """
+        if not self.pauseGC:
+            return list(self.iterparse(factory, StringIO(contents)))
+        with gcPaused():
+            return list(self.iterparse(factory, StringIO(contents)))
+
@@ -0,0 +1,200 @@
+"""Streaming export of resources into files
+
+Resources are taken from any iterable, usually a stream like
+Basecamp.iterEntriesReport, and written into a sink. Network reading and
+parsing run in a separate thread and hand resources over through a
+bounded buffer, so writing overlaps with fetching while memory use stays
+constant:
+
+    >>> sink = CSVSink(open('entries.csv', 'wb'), TimeEntry)
+    >>> exportResources(bc.iterEntriesReport('20120101', '20121231'), sink)
+
+Sinks: NDJSONSink, CSVSink and ParquetSink (requires pyarrow).
+"""
+import sys
+import csv
+import json
+import threading
+import Queue
+
+from resources.base import _RESOURCE, _ARRAY
+from resources.attributes import IntegerAttribute, BooleanAttribute
+
+_done = object()
+
+
+def resourceData(resource, nested=True):
+    """Return dict of set resource attribute values
+
+    Nested resources become dicts and arrays lists of dicts. Without
+    nested, resources are replaced by their ids and arrays are skipped,
+    which gives flat rows.
+    """
+    if nested:
+        return resource.toDict()
+    data = {}
+    for name, kind, factory in resource.fieldTable():
+        value = resource.__dict__.get(name)
+        if value is None:
+            continue
+        if kind is _RESOURCE:
+            value = value.id
+        elif kind is _ARRAY:
+            continue
+        data[name] = value
+    return data
+
+
+class NDJSONSink(object):
+    """Writes one JSON object per line
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, resource):
+        self.stream.write(json.dumps(resourceData(resource),
+                                     separators=(',', ':')) + '\n')
+
+    def close(self):
+        self.stream.close()
+
+
+class CSVSink(object):
+    """Writes flat rows with a header of all factory fields
+    """
+
+    def __init__(self, stream, factory):
+        self.stream = stream
+        self.fields = [name for name, kind, nested in factory.fieldTable()
+                       if kind is not _ARRAY]
+        self.writer = csv.writer(stream)
+        self.writer.writerow(self.fields)
+
+    def write(self, resource):
+        data = resourceData(resource, nested=False)
+        row = []
+        for name in self.fields:
+            value = data.get(name)
+            if value is None:
+                value = ''
+            elif isinstance(value, unicode):
+                value = value.encode('utf-8')
+            row.append(value)
+        self.writer.writerow(row)
+
+    def close(self):
+        self.stream.close()
+
+
+class ParquetSink(object):
+    """Writes columnar Parquet file in row groups of rowGroupSize rows
+
+    Column types are taken from resource attributes. Requires pyarrow.
+    """
+
+    def __init__(self, path, factory, rowGroupSize=10000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError, 'pyarrow is required to write Parquet files'
+        self.pa = pyarrow
+        self.rowGroupSize = rowGroupSize
+        self.fields = []
+        types = []
+        for name, kind, nested in factory.fieldTable():
+            if kind is _ARRAY:
+                continue
+            field = factory.__dict__[name]
+            if kind is _RESOURCE or isinstance(field, IntegerAttribute):
+                types.append(pyarrow.int64())
+            elif isinstance(field, BooleanAttribute):
+                types.append(pyarrow.bool_())
+            else:
+                types.append(pyarrow.string())
+            self.fields.append(name)
+        self.schema = pyarrow.schema([pyarrow.field(name, type) for name, type
+                                      in zip(self.fields, types)])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self._columns = [[] for name in self.fields]
+
+    def write(self, resource):
+        data = resourceData(resource, nested=False)
+        for name, column in zip(self.fields, self._columns):
+            column.append(data.get(name))
+        if len(self._columns[0]) >= self.rowGroupSize:
+            self.flush()
+
+    def flush(self):
+        """Write buffered rows as a row group
+        """
+        if not self._columns[0]:
+            return
+        arrays = [self.pa.array(column, type=field.type) for column, field
+                  in zip(self._columns, self.schema)]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays,
+                                                          schema=self.schema))
+        self._columns = [[] for name in self.fields]
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def exportResources(resources, sink, bufferSize=1000, close=True):
+    """Write resources into sink while they are still being fetched
+
+    Resources are consumed in a separate thread and passed through
+    a buffer of at most bufferSize resources; when the sink can't keep
+    up, fetching is paused. Returns number of written resources.
+    """
+    buffer = Queue.Queue(bufferSize)
+    stop = threading.Event()
+    errors = []
+
+    def put(item):
+        # give up once the consumer is gone, e.g. after the sink failed
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except Queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(resources)
+        try:
+            try:
+                for resource in iterator:
+                    if not put(resource):
+                        break
+            except Exception:
+                errors.append(sys.exc_info())
+        finally:
+            # closing a stream like iterEntriesReport releases its response
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+            put(_done)
+
+    producer = threading.Thread(target=produce)
+    producer.daemon = True
+    producer.start()
+
+    count = 0
+    try:
+        while True:
+            resource = buffer.get()
+            if resource is _done:
+                break
+            sink.write(resource)
+            count += 1
+    finally:
+        stop.set()
+        if close:
+            sink.close()
+    if errors:
+        raise errors[0][0], errors[0][1], errors[0][2]
+    return count
@@ -0,0 +1,484 @@
+"""HTTP/2 transport multiplexing requests over one connection per host
+
+HTTP/1.1 connections carry one request at a time, so many concurrent
+calls need as many connections. HTTP2Transport opens a single connection
+per host and sends every request as a stream on it; responses arrive
+interleaved and are read by a background thread. Flow control windows
+are honoured for request bodies and reopened for response data as it is
+consumed, so a slow reader of a streamed response only holds back its
+own stream. Requires h2:
+
+    >>> bc.useHTTP2()
+    >>> results = bc.completeTodoItems(ids, concurrency=100)
+
+HTTPS connections negotiate h2 with ALPN, plain http ones use HTTP/2
+with prior knowledge, as local test servers do.
+"""
+import sys
+import time
+import socket
+import threading
+import urlparse
+import httplib
+
+try:
+    import h2.events
+    import h2.config
+    import h2.connection
+    import h2.exceptions
+except ImportError:
+    h2 = None
+
+from workers import Future
+from transport import Transport, RawResponse, splitTimeout
+from timeouts import RequestTimeoutError, CancelledError
+
+# headers meaningful for a single HTTP/1.1 connection only
+CONNECTION_HEADERS = ('connection', 'keep-alive', 'proxy-connection',
+                      'transfer-encoding', 'upgrade', 'host')
+
+# how often requests with timeout or cancellation check them, waits
+# with timeout poll in Python 2 so others block
+POLL_INTERVAL = 0.1
+
+
+class HTTP2Error(httplib.HTTPException):
+    """Stream was reset or connection terminated by server
+    """
+
+
+class StreamBody(object):
+    """File-like body of streamed response
+
+    Received data is acknowledged to the server as it is read, so the
+    server sends no more than the stream window ahead of the reader.
+    """
+
+    def __init__(self, connection, stream):
+        self._connection = connection
+        self._stream = stream
+        self._buffer = ''
+
+    def read(self, size=-1):
+        stream = self._stream
+        while size is None or size < 0 or len(self._buffer) < size:
+            chunk = stream.nextChunk()
+            if chunk is None:
+                break
+            self._connection.acknowledge(stream.id, len(chunk))
+            self._buffer += chunk
+        if size is None or size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def close(self):
+        if not self._stream.ended:
+            self._connection.reset(self._stream.id)
+
+
+class Stream(object):
+    """State of one request on HTTP/2 connection
+    """
+
+    def __init__(self, id, streamed):
+        self.id = id
+        self.streamed = streamed
+        self.status = None
+        self.headers = []
+        self.chunks = []
+        self.ended = False
+        self.error = None
+        # set once headers are received, with the whole body unless
+        # the response is streamed
+        self.future = Future()
+        self._condition = threading.Condition()
+
+    def receiveHeaders(self, headers):
+        for name, value in headers:
+            if name == ':status':
+                self.status = int(value)
+            elif not name.startswith(':'):
+                self.headers.append((name, value))
+        if self.streamed:
+            self.future.setResult(self)
+
+    def receiveData(self, data):
+        self._condition.acquire()
+        try:
+            self.chunks.append(data)
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+
+    def end(self, error=None):
+        self._condition.acquire()
+        try:
+            self.ended = True
+            self.error = error
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+        if self.future.done():
+            return
+        if error is not None:
+            self.future.setError(error)
+        else:
+            self.future.setResult(self)
+
+    def nextChunk(self):
+        """Wait for next chunk of streamed body, None at the end
+        """
+        self._condition.acquire()
+        try:
+            while not self.chunks and not self.ended:
+                self._condition.wait()
+            if self.chunks:
+                return self.chunks.pop(0)
+            if self.error is not None:
+                raise self.error[0], self.error[1], self.error[2]
+            return None
+        finally:
+            self._condition.release()
+
+
+class HTTP2Connection(object):
+    """Client HTTP/2 connection multiplexing concurrent requests
+    """
+
+    def __init__(self, scheme, host, timeout=None, dnsCache=None,
+                 sslContext=None):
+        self.scheme = scheme
+        self.host = host
+        self.closed = False
+        self._streams = {}
+        self._lock = threading.RLock()
+        # notified when flow control windows or stream slots open
+        self._condition = threading.Condition(self._lock)
+        pieces = urlparse.urlsplit('//' + host)
+        hostname = pieces.hostname
+        secure = scheme == 'https'
+        port = pieces.port or (secure and 443 or 80)
+        if dnsCache is not None:
+            sock = dnsCache.createConnection((hostname, port), timeout)
+        elif timeout is not None:
+            sock = socket.create_connection((hostname, port), timeout)
+        else:
+            sock = socket.create_connection((hostname, port))
+        try:
+            if secure:
+                sock = sslContext.wrap_socket(sock, server_hostname=hostname)
+                if sock.selected_alpn_protocol() != 'h2':
+                    raise HTTP2Error, '%s does not support HTTP/2' % host
+            sock.settimeout(None)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except Exception:
+            sock.close()
+            raise
+        self.sock = sock
+        self._h2 = h2.connection.H2Connection(h2.config.H2Configuration(
+            client_side=True, header_encoding='utf-8'))
+        self._h2.initiate_connection()
+        self._flush()
+        self._settled = False
+        self._reader = threading.Thread(target=self._read)
+        self._reader.daemon = True
+        self._reader.start()
+        # limits of the server are unknown until its settings arrive,
+        # waiting for them is part of connecting
+        deadline = timeout is not None and time.time() + timeout
+        self._lock.acquire()
+        try:
+            while not self._settled and not self.closed:
+                if not deadline:
+                    self._condition.wait()
+                    continue
+                wait = deadline - time.time()
+                if wait <= 0:
+                    break
+                self._condition.wait(wait)
+            expired = not self._settled and not self.closed
+        finally:
+            self._lock.release()
+        if expired:
+            self.close()
+            raise RequestTimeoutError, 'No HTTP/2 settings received from ' \
+                '%s in time' % host
+
+    def _flush(self):
+        data = self._h2.data_to_send()
+        if data:
+            self.sock.sendall(data)
+
+    def submit(self, method, path, body=None, headers=None, streamed=False):
+        """Send request and return its Stream
+        """
+        authority = self.host
+        requestHeaders = [(':method', method), (':authority', authority),
+                          (':scheme', self.scheme), (':path', path)]
+        for name, value in (headers or {}).items():
+            name = name.lower()
+            if name not in CONNECTION_HEADERS:
+                requestHeaders.append((name, str(value)))
+        body = body or ''
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+
+        self._lock.acquire()
+        try:
+            # wait for a slot if server limits concurrent streams
+            while not self.closed and self._h2.open_outbound_streams >= \
+                    self._h2.remote_settings.max_concurrent_streams:
+                self._condition.wait()
+            if self.closed:
+                raise HTTP2Error, 'Connection to %s is closed' % self.host
+            id = self._h2.get_next_available_stream_id()
+            stream = self._streams[id] = Stream(id, streamed)
+            self._h2.send_headers(id, requestHeaders, end_stream=not body)
+            self._flush()
+            while body:
+                # send no more than flow control windows allow
+                window = min(self._h2.local_flow_control_window(id),
+                             self._h2.max_outbound_frame_size)
+                if window <= 0:
+                    if self.closed or stream.ended:
+                        break
+                    self._condition.wait()
+                    continue
+                chunk, body = body[:window], body[window:]
+                self._h2.send_data(id, chunk, end_stream=not body)
+                self._flush()
+        finally:
+            self._lock.release()
+        return stream
+
+    def acknowledge(self, id, size):
+        """Reopen stream flow control window for consumed response data
+
+        The connection window is reopened as soon as data arrives.
+        """
+        self._lock.acquire()
+        try:
+            if self.closed or id not in self._streams or size <= 0:
+                return
+            try:
+                self._h2.increment_flow_control_window(size, stream_id=id)
+            except h2.exceptions.StreamClosedError:
+                return
+            self._flush()
+        finally:
+            self._lock.release()
+
+    def reset(self, id):
+        """Abandon stream, e.g. on timeout or cancellation
+        """
+        self._lock.acquire()
+        try:
+            stream = self._streams.pop(id, None)
+            if self.closed or stream is None:
+                return
+            try:
+                self._h2.reset_stream(id)
+                self._flush()
+            except h2.exceptions.StreamClosedError:
+                pass
+        finally:
+            self._lock.release()
+
+    def _read(self):
+        try:
+            while True:
+                data = self.sock.recv(65536)
+                if not data:
+                    raise HTTP2Error, 'Connection to %s is closed' % \
+                        self.host
+                self._lock.acquire()
+                try:
+                    for event in self._h2.receive_data(data):
+                        self._handle(event)
+                    self._flush()
+                    self._condition.notifyAll()
+                finally:
+                    self._lock.release()
+        except Exception:
+            self._terminate(sys.exc_info())
+
+    def _handle(self, event):
+        if isinstance(event, h2.events.RemoteSettingsChanged):
+            self._settled = True
+            return
+        if isinstance(event, h2.events.WindowUpdated):
+            return
+        if isinstance(event, h2.events.ConnectionTerminated):
+            raise HTTP2Error, 'Connection terminated by server (error ' \
+                '%s)' % event.error_code
+        if isinstance(event, h2.events.DataReceived) and \
+                event.flow_controlled_length:
+            # reopen the shared connection window at once, so that unread
+            # streamed response holds back its own stream only
+            self._h2.increment_flow_control_window(
+                event.flow_controlled_length)
+        stream = self._streams.get(getattr(event, 'stream_id', None))
+        if stream is None:
+            return
+        if isinstance(event, h2.events.ResponseReceived):
+            stream.receiveHeaders(event.headers)
+        elif isinstance(event, h2.events.DataReceived):
+            stream.receiveData(event.data)
+            if not stream.streamed and event.flow_controlled_length and \
+                    not event.stream_ended:
+                # buffered bodies are consumed at once
+                self._h2.increment_flow_control_window(
+                    event.flow_controlled_length, stream_id=event.stream_id)
+        elif isinstance(event, h2.events.StreamEnded):
+            del self._streams[event.stream_id]
+            stream.end()
+        elif isinstance(event, h2.events.StreamReset):
+            del self._streams[event.stream_id]
+            try:
+                raise HTTP2Error, 'Stream reset by server (error %s)' % \
+                    event.error_code
+            except HTTP2Error:
+                stream.end(sys.exc_info())
+
+    def _terminate(self, error):
+        self._lock.acquire()
+        try:
+            self.closed = True
+            streams, self._streams = self._streams.values(), {}
+            self._condition.notifyAll()
+        finally:
+            self._lock.release()
+        for stream in streams:
+            stream.end(error)
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            if not self.closed:
+                try:
+                    self._h2.close_connection()
+                    self._flush()
+                except (socket.error, h2.exceptions.ProtocolError):
+                    pass
+        finally:
+            self._lock.release()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        if self._reader is not threading.current_thread():
+            # reader sees the shutdown and ends streams left
+            self._reader.join()
+
+
+class HTTP2Transport(Transport):
+    """Makes requests as streams of one HTTP/2 connection per host
+
+    A closed connection is replaced by a new one on next request.
+    """
+
+    def __init__(self, dnsCache=None, sslContext=None):
+        if h2 is None:
+            raise ImportError, 'h2 is required for HTTP/2 transport'
+        self.dnsCache = dnsCache
+        if sslContext is None:
+            import ssl
+            sslContext = ssl.create_default_context()
+            sslContext.set_alpn_protocols(['h2'])
+        self.sslContext = sslContext
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def connection(self, scheme, host, timeout=None):
+        """Return open connection to host, connecting if needed
+        """
+        self._lock.acquire()
+        try:
+            connection = self._connections.get((scheme, host))
+            if connection is None or connection.closed:
+                connection = self._connections[(scheme, host)] = \
+                    HTTP2Connection(scheme, host, timeout, self.dnsCache,
+                                    self.sslContext)
+            return connection
+        finally:
+            self._lock.release()
+
+    def submit(self, method, url, body=None, headers=None, timeout=None,
+               cancel=None, stream=False):
+        """Send request and return Future of its RawResponse
+
+        No thread is used per request, responses are completed by the
+        reader thread of the connection.
+        """
+        if cancel is not None:
+            cancel.check()
+        pieces = urlparse.urlparse(url)
+        path = urlparse.urlunparse(('', '') + tuple(pieces[2:])) or '/'
+        connectTimeout = splitTimeout(timeout)[0]
+        connection = self.connection(pieces[0], pieces[1], connectTimeout)
+        request = connection.submit(method, path, body, headers, stream)
+        future = Future()
+
+        def complete(result):
+            try:
+                response = result.result()
+            except Exception:
+                future.setError(sys.exc_info())
+                return
+            if stream:
+                body = StreamBody(connection, response)
+            else:
+                body = ''.join(response.chunks)
+            future.setResult(RawResponse(
+                response.status, httplib.responses.get(response.status, ''),
+                response.headers, body))
+        request.future.addCallback(complete)
+        future.connection = connection
+        future.stream = request
+        return future
+
+    def request(self, method, url, body=None, headers=None, timeout=None,
+                cancel=None, stream=False):
+        future = self.submit(method, url, body, headers, timeout, cancel,
+                             stream)
+        readTimeout = splitTimeout(timeout)[1]
+        deadline = readTimeout is not None and time.time() + readTimeout
+        if not deadline and cancel is None:
+            future.wait()
+        while not future.done():
+            wait = POLL_INTERVAL
+            if deadline:
+                wait = min(wait, deadline - time.time())
+                if wait <= 0:
+                    future.connection.reset(future.stream.id)
+                    raise RequestTimeoutError, 'Request timed out'
+            if cancel is not None and cancel.isCancelled():
+                future.connection.reset(future.stream.id)
+                raise CancelledError, 'Request is cancelled'
+            future.wait(wait)
+        return future.result()
+
+    def warmUp(self, url, count=1, timeout=None):
+        """Open connection to host of url, one is all requests need
+
+        Returns number of connections established.
+        """
+        scheme, host = urlparse.urlparse(url)[:2]
+        self.connection(scheme, host, splitTimeout(timeout)[0])
+        return 1
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            connections, self._connections = self._connections.values(), {}
+        finally:
+            self._lock.release()
+        for connection in connections:
+            connection.close()
+
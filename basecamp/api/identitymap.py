@@ -0,0 +1,67 @@
+"""Identity map for decoded Basecamp resources
+
+"""
+import threading
+import weakref
+
+from resources.attributes import ResourceAttribute, ArrayAttribute
+
+
+class IdentityMap(object):
+    """Keeps single shared instance per resource type and id
+
+    Instances are held weakly, so entities nobody refers to any more are
+    dropped from the map.
+    """
+
+    def __init__(self):
+        self._instances = weakref.WeakValueDictionary()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._instances)
+
+    def get(self, factory, id):
+        """Return shared instance of given type and id or None
+        """
+        return self._instances.get((factory, id))
+
+    def merge(self, resource):
+        """Return shared instance for the given resource
+
+        If there is one already, it is updated in place with attribute
+        values set on the given resource, otherwise the given resource
+        becomes the shared instance. Nested resources are merged too.
+        """
+        self._lock.acquire()
+        try:
+            for name, field in resource.fields():
+                value = resource.__dict__.get(name)
+                if value is None:
+                    continue
+                if isinstance(field, ResourceAttribute):
+                    resource.__dict__[name] = self.merge(value)
+                elif isinstance(field, ArrayAttribute):
+                    resource.__dict__[name] = [self.merge(item)
+                                               for item in value]
+
+            id = resource.__dict__.get('id')
+            if id is None:
+                return resource
+            key = (resource.__class__, id)
+            instance = self._instances.get(key)
+            if instance is None:
+                self._instances[key] = resource
+                return resource
+            if instance is not resource:
+                instance.__dict__.update(resource.__dict__)
+            return instance
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._instances.clear()
+        finally:
+            self._lock.release()
@@ -0,0 +1,70 @@
+"""Deferred imports to keep `import basecamp.api` cheap
+
+lazyImport returns a stand-in for a module which imports it on first
+attribute access, lazyPackage makes names of a package load from their
+submodules on first access.
+"""
+import sys
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    """Module imported on first attribute access
+    """
+
+    def __init__(self, name):
+        ModuleType.__init__(self, name)
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            __import__(self.__name__)
+            module = self.__dict__['_module'] = sys.modules[self.__name__]
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __repr__(self):
+        return '<lazy module %r>' % self.__name__
+
+
+def lazyImport(name):
+    """Return module stand-in, name is absolute module name
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
+
+
+class LazyPackage(ModuleType):
+    """Package loading its attributes from submodules on first access
+    """
+
+    def __getattr__(self, name):
+        module = self.__dict__['_attributes'].get(name)
+        if module is None:
+            raise AttributeError, name
+        __import__('%s.%s' % (self.__name__, module))
+        value = getattr(sys.modules['%s.%s' % (self.__name__, module)], name)
+        setattr(self, name, value)
+        return value
+
+
+def lazyPackage(name, attributes):
+    """Replace package in sys.modules by LazyPackage
+
+    attributes - mapping of names to submodules defining them
+    """
+    origin = sys.modules[name]
+    package = LazyPackage(name)
+    package.__dict__.update(origin.__dict__)
+    package.__dict__.update({'_attributes': attributes,
+                             '__all__': sorted(attributes),
+                             # globals of original module are cleared
+                             # once it is gone
+                             '_origin': origin})
+    sys.modules[name] = package
+    return package
@@ -0,0 +1,228 @@
+"""Many Basecamp accounts served by one process
+
+AccountManager keeps a session per account, all sharing one pool of
+keep-alive connections. Calls are queued per account and picked by a
+fixed set of worker threads in round-robin order, so a long report pull
+of one account doesn't hold back calls of the others:
+
+    >>> manager = AccountManager(concurrency=16)
+    >>> manager.addAccount('acme', 'https://acme.basecamphq.com/',
+    ...                    'user', 'pass', rate=2)
+    >>> future = manager.submit('acme', 'getProjects')
+    >>> projects = future.result()
+"""
+import sys
+import time
+import threading
+from collections import deque
+
+from basecamp import Basecamp
+from transport import ConnectionPool
+from workers import Future, RateLimiter
+
+_stop = object()
+
+
+class AccountStats(object):
+    """Counters of calls made for an account
+    """
+
+    def __init__(self):
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        # seconds spent in completed and failed calls
+        self.busy = 0.0
+        # seconds calls spent waiting in the queue
+        self.waited = 0.0
+
+    def copy(self):
+        stats = AccountStats()
+        stats.__dict__.update(self.__dict__)
+        return stats
+
+    def __repr__(self):
+        return '<AccountStats %s>' % ', '.join(['%s=%s' % item for item in
+                                                sorted(self.__dict__.items())])
+
+
+class Account(object):
+    """Account session with its queue, limits and stats
+    """
+
+    def __init__(self, name, session, rate=None, concurrency=2):
+        self.name = name
+        self.session = session
+        self.limiter = rate and RateLimiter(rate) or None
+        self.concurrency = concurrency
+        self.calls = deque()
+        self.stats = AccountStats()
+
+
+class AccountManager(object):
+    """Hosts sessions of many accounts and schedules their calls fairly
+
+    concurrency - number of worker threads shared by all accounts
+    poolSize - idle keep-alive connections kept per host
+    """
+
+    def __init__(self, concurrency=8, poolSize=4):
+        self.pool = ConnectionPool(poolSize)
+        self.accounts = {}
+        self._order = []
+        self._next = 0
+        self._condition = threading.Condition()
+        self._sessions = threading.local()
+        self._workers = []
+        for i in range(concurrency):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def addAccount(self, name, url, username, password, rate=None,
+                   concurrency=2, headers={}):
+        """Register account session
+
+        rate - maximum number of calls per second for this account
+        concurrency - maximum number of calls of this account running
+                      at the same time
+        """
+        session = Basecamp(url, username, password, headers)
+        session.client.pool = self.pool
+        self._condition.acquire()
+        try:
+            if name in self.accounts:
+                raise ValueError, 'Account %s is already added' % name
+            self.accounts[name] = Account(name, session, rate, concurrency)
+            self._order.append(name)
+        finally:
+            self._condition.release()
+        return session
+
+    def removeAccount(self, name):
+        """Drop account, its queued calls are cancelled
+        """
+        self._condition.acquire()
+        try:
+            account = self.accounts.pop(name)
+            self._order.remove(name)
+        finally:
+            self._condition.release()
+        for future, func, args, kw, queued in account.calls:
+            future.setError((KeyError, KeyError(name), None))
+
+    def session(self, name):
+        return self.accounts[name].session
+
+    def submit(self, name, func, *args, **kw):
+        """Queue call for account and return Future of its result
+
+        func is either a name of Basecamp method or a callable taking
+        account session as the first argument.
+        """
+        future = Future()
+        self._condition.acquire()
+        try:
+            account = self.accounts[name]
+            account.calls.append((future, func, args, kw, time.time()))
+            account.stats.queued += 1
+            self._condition.notify()
+        finally:
+            self._condition.release()
+        return future
+
+    def stats(self):
+        """Return dict of account names and their AccountStats snapshots
+        """
+        self._condition.acquire()
+        try:
+            return dict([(name, account.stats.copy())
+                         for name, account in self.accounts.items()])
+        finally:
+            self._condition.release()
+
+    def close(self):
+        """Stop workers once queued calls are done and close connections
+        """
+        self._condition.acquire()
+        try:
+            self._order.append(_stop)
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+        for worker in self._workers:
+            worker.join()
+        self.pool.clear()
+
+    def _pick(self):
+        # round-robin over accounts having calls they are allowed to run
+        names = self._order
+        for i in range(len(names)):
+            name = names[(self._next + i) % len(names)]
+            if name is _stop:
+                continue
+            account = self.accounts[name]
+            if (not account.calls or
+                    account.stats.running >= account.concurrency):
+                continue
+            if account.limiter is not None and \
+                    not account.limiter.tryAcquire():
+                continue
+            self._next = (self._next + i + 1) % len(names)
+            return account
+        return None
+
+    def _work(self):
+        while True:
+            self._condition.acquire()
+            try:
+                while True:
+                    account = self._pick()
+                    if account is not None:
+                        break
+                    pending = [a for a in self.accounts.values() if a.calls]
+                    if _stop in self._order and not pending:
+                        return
+                    # calls waiting for rate budget are retried shortly
+                    self._condition.wait(pending and 0.05 or None)
+                future, func, args, kw, queued = account.calls.popleft()
+                account.stats.queued -= 1
+                account.stats.running += 1
+                account.stats.waited += time.time() - queued
+            finally:
+                self._condition.release()
+            self._call(account, future, func, args, kw)
+
+    def _call(self, account, future, func, args, kw):
+        # sessions are not thread safe, every worker has its own clones
+        sessions = self._sessions.__dict__
+        origin, session = sessions.get(account.name, (None, None))
+        if origin is not account.session:
+            session = account.session.clone()
+            sessions[account.name] = (account.session, session)
+        start = time.time()
+        error = None
+        try:
+            if isinstance(func, basestring):
+                result = getattr(session, func)(*args, **kw)
+            else:
+                result = func(session, *args, **kw)
+        except Exception:
+            error = sys.exc_info()
+        self._condition.acquire()
+        try:
+            account.stats.running -= 1
+            account.stats.busy += time.time() - start
+            if error is None:
+                account.stats.completed += 1
+            else:
+                account.stats.failed += 1
+            self._condition.notify()
+        finally:
+            self._condition.release()
+        if error is None:
+            future.setResult(result)
+        else:
+            future.setError(error)
@@ -0,0 +1,347 @@
+"""Write-behind queue of Basecamp mutations
+
+MutationQueue accepts mutations at once and returns a Future of their
+result. Mutations are journaled, collapsed with pending mutations of
+the same entity and made in the background in batches:
+
+    >>> queue = bc.useMutationQueue('mutations.journal')
+    >>> queue.completeTodoItem(1)
+    >>> queue.uncompleteTodoItem(1)     # only this one is sent
+    >>> entry = queue.createTimeEntryForProject(1, hours='1.0')
+    >>> queue.destroyTimeEntry(entry)   # neither is sent if still pending
+
+Collapsed mutations share the result of the one actually made. Pending
+mutations found in the journal on start are queued again, their Futures
+are listed in `recovered`.
+"""
+import os
+import time
+import json
+import threading
+from collections import OrderedDict
+
+from workers import Future, runConcurrently
+
+
+class Mutation(object):
+    """Pending call of a Basecamp method
+    """
+
+    def __init__(self, seq, key, method, args, kw):
+        self.seq = seq
+        self.key = key
+        self.method = method
+        self.args = args
+        self.kw = kw
+        # sequence numbers of journal records this mutation stands for
+        self.seqs = [seq]
+        self.futures = [Future()]
+
+
+class Journal(object):
+    """Append-only file of accepted and completed mutations
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = []
+        if os.path.exists(path):
+            for line in open(path):
+                try:
+                    self.records.append(json.loads(line))
+                except ValueError:
+                    # torn last line
+                    break
+        self._file = open(path, 'a')
+
+    def write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def truncate(self):
+        self._file.close()
+        self._file = open(self.path, 'w')
+
+    def close(self):
+        self._file.close()
+
+
+class MutationQueue(object):
+    """Collapses and flushes mutations in the background
+
+    journal - path of journal file, mutations are not durable without it
+    interval - seconds mutations may wait before being flushed
+    batchSize - maximum number of mutations flushed at once, reaching it
+                flushes without waiting
+    concurrency - number of parallel sessions used for flushing
+    """
+
+    def __init__(self, bc, journal=None, interval=1.0, batchSize=50,
+                 concurrency=4):
+        self.bc = bc
+        self.interval = interval
+        self.batchSize = batchSize
+        self.concurrency = concurrency
+        self.recovered = []
+        self._pending = OrderedDict()
+        self._inflight = 0
+        # time by which pending mutations should be flushed
+        self._due = None
+        self._flushing = False
+        # Futures of time entries being created -> their mutations
+        self._creates = {}
+        self._seq = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._sessions = threading.local()
+        self.journal = None
+        if journal is not None:
+            self._recover(Journal(journal))
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __len__(self):
+        return len(self._pending)
+
+    # Mutations
+    def completeTodoItem(self, todo_item_id):
+        return self._add('completeTodoItem', (todo_item_id,))
+
+    def uncompleteTodoItem(self, todo_item_id):
+        return self._add('uncompleteTodoItem', (todo_item_id,))
+
+    def createTimeEntryForProject(self, project_id, **kw):
+        return self._add('createTimeEntryForProject', (project_id,), kw)
+
+    def createTimeEntryForTodoItem(self, todo_item_id, **kw):
+        return self._add('createTimeEntryForTodoItem', (todo_item_id,), kw)
+
+    def updateTimeEntry(self, id, **kw):
+        """Update time entry, id may be Future of the entry being created
+        """
+        return self._add('updateTimeEntry', (id,), kw)
+
+    def destroyTimeEntry(self, id):
+        """Destroy time entry, id may be Future of the entry being created
+        """
+        return self._add('destroyTimeEntry', (id,))
+
+    def _add(self, method, args, kw=None):
+        kw = kw or {}
+        self._condition.acquire()
+        try:
+            if self._closed:
+                raise RuntimeError, 'Mutation queue is closed'
+            self._seq += 1
+            seq = self._seq
+            if self.journal is not None:
+                self.journal.write({'seq': seq, 'method': method,
+                                    'args': [self._encode(arg)
+                                             for arg in args],
+                                    'kw': kw})
+            mutation = self._collapse(seq, method, args, kw)
+            if self._due is None and self._pending:
+                self._due = time.time() + self.interval
+            self._condition.notifyAll()
+            return mutation.futures[-1]
+        finally:
+            self._condition.release()
+
+    def _collapse(self, seq, method, args, kw):
+        """Queue mutation merging it into pending one of the same entity
+        """
+        if method in ('completeTodoItem', 'uncompleteTodoItem'):
+            key = ('todo_item', args[0])
+        elif method.startswith('create'):
+            key = ('new', seq)
+        else:
+            key = ('time_entry', args[0])
+            created = self._creates.get(args[0])
+            if created is not None and created.key in self._pending:
+                # entry is not created yet
+                if method == 'updateTimeEntry':
+                    created.kw.update(kw)
+                    return self._merge(created, seq)
+                del self._pending[created.key]
+                del self._creates[args[0]]
+                self._resolve(created, None)
+                mutation = Mutation(seq, key, method, args, kw)
+                self._resolve(mutation, True)
+                return mutation
+
+        mutation = self._pending.get(key)
+        if mutation is not None:
+            if method == 'updateTimeEntry' and \
+                    mutation.method == 'updateTimeEntry':
+                mutation.kw.update(kw)
+            elif mutation.method == 'destroyTimeEntry':
+                # updates of destroyed entry are dropped
+                pass
+            else:
+                # later call wins, e.g. uncomplete after complete
+                mutation.method, mutation.args, mutation.kw = method, args, kw
+            return self._merge(mutation, seq)
+
+        mutation = Mutation(seq, key, method, args, kw)
+        self._pending[key] = mutation
+        if key[0] == 'new':
+            self._creates[mutation.futures[0]] = mutation
+        return mutation
+
+    def _merge(self, mutation, seq):
+        mutation.seqs.append(seq)
+        mutation.futures.append(Future())
+        return mutation
+
+    def _resolve(self, mutation, result=None, error=None):
+        if self.journal is not None:
+            for seq in mutation.seqs:
+                record = {'done': seq}
+                if mutation.key[0] == 'new' and error is None and \
+                        getattr(result, 'id', None) is not None:
+                    # to resolve references to the entry on recovery
+                    record['id'] = result.id
+                self.journal.write(record)
+        for future in mutation.futures:
+            if error is not None:
+                future.setError(error)
+            else:
+                future.setResult(result)
+
+    # Journal
+    def _encode(self, arg):
+        if isinstance(arg, Future):
+            mutation = self._creates.get(arg)
+            if mutation is None:
+                arg = arg.result().id
+            else:
+                return {'ref': mutation.seq}
+        return arg
+
+    def _recover(self, journal):
+        done = set([record['done'] for record in journal.records
+                    if 'done' in record])
+        # ids of created entries and Futures of entries to be created
+        created = dict([(record['done'], record['id'])
+                        for record in journal.records if 'id' in record])
+        pending = [record for record in journal.records
+                   if 'seq' in record and record['seq'] not in done]
+        journal.truncate()
+        self.journal = journal
+        for record in pending:
+            args = []
+            for arg in record['args']:
+                if isinstance(arg, dict):
+                    arg = created.get(arg['ref'])
+                args.append(arg)
+            if None in args:
+                # the entry referred to failed to be created
+                continue
+            kw = dict([(str(name), value)
+                       for name, value in record['kw'].items()])
+            future = self._add(str(record['method']), tuple(args), kw)
+            created[record['seq']] = future
+            self.recovered.append(future)
+
+    # Flushing
+    def flush(self):
+        """Flush pending mutations now and wait for them
+        """
+        self._condition.acquire()
+        try:
+            futures = [mutation.futures[-1]
+                       for mutation in self._pending.values()]
+            self._flushing = True
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass
+
+    def close(self):
+        """Flush pending mutations and stop
+        """
+        self._condition.acquire()
+        try:
+            self._closed = True
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+        self._thread.join()
+        if self.journal is not None:
+            self.journal.close()
+
+    def _run(self):
+        while True:
+            self._condition.acquire()
+            try:
+                # wait for mutations to collapse until they are due,
+                # batch is full, or flush is requested
+                while not self._closed and not self._flushing and \
+                        (not self._pending or
+                         (len(self._pending) < self.batchSize and
+                          time.time() < self._due)):
+                    self._condition.wait(self._pending and
+                                         self._due - time.time() or None)
+                if self._closed and not self._pending:
+                    return
+                batch = self._take()
+                self._inflight += len(batch)
+                if self._pending:
+                    self._due = time.time()
+                else:
+                    self._due = None
+                    self._flushing = False
+            finally:
+                self._condition.release()
+            if batch:
+                self._flush(batch)
+
+    def _take(self):
+        batch = []
+        for key, mutation in self._pending.items():
+            if len(batch) >= self.batchSize:
+                break
+            args = []
+            for arg in mutation.args:
+                if isinstance(arg, Future):
+                    if not arg.done():
+                        # entry being created in flight
+                        break
+                    try:
+                        arg = arg.result().id
+                    except Exception:
+                        # entry failed to be created
+                        arg = None
+                args.append(arg)
+            else:
+                del self._pending[key]
+                mutation.args = tuple(args)
+                batch.append(mutation)
+        return batch
+
+    def _call(self, mutation):
+        session = getattr(self._sessions, 'session', None)
+        if session is None:
+            session = self._sessions.session = self.bc.clone()
+        return getattr(session, mutation.method)(*mutation.args,
+                                                 **mutation.kw)
+
+    def _flush(self, batch):
+        for index, mutation, result, error in runConcurrently(
+                self._call, batch, self.concurrency):
+            self._condition.acquire()
+            try:
+                self._creates.pop(mutation.futures[0], None)
+                self._resolve(mutation, result, error)
+                self._inflight -= 1
+                if self.journal is not None and not self._pending and \
+                        not self._inflight:
+                    self.journal.truncate()
+            finally:
+                self._condition.release()
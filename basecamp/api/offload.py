@@ -0,0 +1,140 @@
+"""Parsing of large xml responses in worker processes
+
+Parsing a multi-megabyte report with minidom and building resources from
+it keeps one core busy and holds the GIL. ParseOffload sends such bodies
+to a pool of worker processes. Workers return resources packed into
+plain tuples of attribute values, which are cheap to pickle, and the
+calling process only unpacks them.
+
+Use submit() to overlap downloading of the next chunk of data with
+decoding of the previous ones:
+
+    >>> offload = bc.useParseOffload()
+    >>> pending = []
+    >>> for path in paths:
+    ...     contents = bc.get(path).contents
+    ...     pending.append(offload.submit(TimeEntry, contents))
+    >>> entries = [e for result in pending for e in result.get()]
+"""
+import threading
+import multiprocessing
+from xml.dom import minidom
+
+from resources.base import _RESOURCE, _ARRAY
+
+
+def pack(resource):
+    """Pack resource into tuple of its attribute values
+    """
+    values = []
+    for name, kind, factory in resource.fieldTable():
+        value = resource.__dict__.get(name)
+        if value is not None:
+            if kind is _RESOURCE:
+                value = pack(value)
+            elif kind is _ARRAY:
+                value = [pack(item) for item in value]
+        values.append(value)
+    return tuple(values)
+
+
+def unpack(factory, values):
+    """Build resource of factory type from packed values
+    """
+    resource = factory.__new__(factory)
+    data = resource.__dict__
+    for (name, kind, nested), value in zip(factory.fieldTable(), values):
+        if value is None:
+            continue
+        if kind is _RESOURCE:
+            value = unpack(nested, value)
+        elif kind is _ARRAY:
+            value = [unpack(nested, item) for item in value]
+        data[name] = value
+    return resource
+
+
+def decode(factory, contents):
+    """Parse xml and return packed resources of factory type found in it
+    """
+    document = minidom.parseString(contents)
+    try:
+        return [pack(factory.load(node)) for node in
+                document.getElementsByTagName(factory._resource_type)]
+    finally:
+        document.unlink()
+
+
+def _decode(args):
+    return decode(*args)
+
+
+class DecodeResult(object):
+    """Pending result of resources decoding
+    """
+
+    def __init__(self, factory, result):
+        self.factory = factory
+        self._result = result
+
+    def ready(self):
+        return self._result.ready()
+
+    def get(self, timeout=None):
+        """Wait for and return list of decoded resources
+        """
+        if timeout is None:
+            # waiting without timeout can't be interrupted in Python 2
+            timeout = 1e6
+        return [unpack(self.factory, values)
+                for values in self._result.get(timeout)]
+
+
+class ParseOffload(object):
+    """Decodes large xml bodies in a pool of worker processes
+
+    threshold - minimal body size in bytes worth to be sent to a worker
+    processes - number of worker processes, number of CPUs by default
+    """
+
+    def __init__(self, threshold=1024 * 1024, processes=None):
+        self.threshold = threshold
+        self.processes = processes
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        self._lock.acquire()
+        try:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.processes)
+            return self._pool
+        finally:
+            self._lock.release()
+
+    def accepts(self, contents):
+        """Whether the given body should be decoded by a worker
+        """
+        return len(contents) >= self.threshold
+
+    def submit(self, factory, contents):
+        """Start decoding of resources of factory type found in contents
+
+        Returns DecodeResult.
+        """
+        result = self.pool.apply_async(_decode, ((factory, contents),))
+        return DecodeResult(factory, result)
+
+    def decode(self, factory, contents):
+        """Decode resources in a worker process and return them
+        """
+        return self.submit(factory, contents).get()
+
+    def close(self):
+        """Stop worker processes
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
@@ -0,0 +1,106 @@
+"""Polling of changed projects
+
+Every cycle ProjectPoller fetches projects list once and compares their
+last_changed_on with watermarks stored on the previous cycle. Only
+changed projects are crawled, so polling cost depends on activity rather
+than on the account size:
+
+    >>> def handle(kind, parent, resource, new):
+    ...     store(kind, resource)
+    >>> poller = ProjectPoller(bc, {'categories': {}, 'todo_lists': {},
+    ...                             'companies': {'people': {}}}, handle)
+    >>> poller.run()
+"""
+import random
+import threading
+
+from crawler import Crawler
+
+
+class ProjectPoller(object):
+    """Re-crawls projects changed since the last poll
+
+    spec - crawler spec of resources to collect for every changed project
+    handler - called with (kind, parent, resource, new) for every crawled
+              resource, changed projects included
+    interval - seconds between poll cycles
+    jitter - fraction of interval by which it is randomly shifted, so
+             pollers started together don't hit Basecamp at once
+    watermarks - dict-like mapping of project ids to last_changed_on
+                 values, e.g. a shelve to persist them across restarts
+    """
+
+    def __init__(self, bc, spec=None, handler=None, interval=60, jitter=0.1,
+                 watermarks=None, concurrency=8):
+        self.bc = bc
+        self.spec = spec or {}
+        self.handler = handler
+        self.interval = interval
+        self.jitter = jitter
+        self.concurrency = concurrency
+        if watermarks is None:
+            watermarks = {}
+        self.watermarks = watermarks
+        self.errors = []
+        self._stop = threading.Event()
+
+    def session(self):
+        """Return session reading around resource cache of bc, so that
+        changes made by others are seen and cached results refreshed
+        """
+        session = self.bc.clone()
+        session.refreshCache = True
+        return session
+
+    def changedProjects(self):
+        """Fetch projects and return those changed since last poll
+        """
+        return [project for project in self.session().getProjects()
+                if self.watermarks.get(str(project.id)) !=
+                   project.last_changed_on]
+
+    def poll(self):
+        """Run single poll cycle and return list of changed projects
+
+        Watermarks are advanced only if crawling went without errors,
+        otherwise changed projects are crawled again on the next cycle.
+        Errors of the last cycle are kept in `errors` list.
+        """
+        changed = self.changedProjects()
+        if not changed:
+            self.errors = []
+            return changed
+
+        crawler = Crawler(self.session(), {'projects': self.spec},
+                          self.concurrency,
+                          roots={'projects': changed})
+        for record in crawler:
+            if self.handler is not None:
+                self.handler(*record)
+        self.errors = crawler.errors
+        if not crawler.errors:
+            for project in changed:
+                self.watermarks[str(project.id)] = project.last_changed_on
+        return changed
+
+    def nextDelay(self):
+        """Seconds to wait before the next cycle
+        """
+        return max(0, self.interval *
+                   (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def run(self):
+        """Poll until stop() is called
+
+        Failed cycles don't stop polling, their error is kept in `errors`.
+        """
+        self._stop.clear()
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception, e:
+                self.errors = [(None, None, e)]
+            self._stop.wait(self.nextDelay())
+
+    def stop(self):
+        self._stop.set()
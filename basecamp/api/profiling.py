@@ -0,0 +1,349 @@
+"""Profiling of Basecamp method calls
+
+Profiler wraps methods of a session and profiles some or all of their
+calls, either deterministically with cProfile or by sampling stacks of
+the calling thread. Time of every call is split into phases: network
+(Basecamp.open), parse (fromXML) and model (building resources).
+Generators returned by iter* methods are timed while they are consumed
+and recorded once exhausted or closed:
+
+    >>> profiler = bc.useProfiler(['getEntriesReport'], sampling=True)
+    >>> entries = bc.getEntriesReport('20120101', '20121231')
+    >>> print profiler.report()
+    >>> profiler.dump('profiles')
+
+dump() writes a file of collapsed stacks per call site (method and the
+line it was called from), which flamegraph.pl and speedscope read.
+"""
+import os
+import sys
+import time
+import types
+import random
+import pstats
+import cProfile
+import threading
+from collections import defaultdict
+
+# methods profiled by default are those with names starting so
+PREFIXES = ('get', 'iter', 'create', 'complete', 'uncomplete', 'update',
+            'destroy')
+
+# helpers which are phases or too low level to be profiled on their own
+EXCLUDED = ('get', 'getErrors')
+
+
+def defaultMethods(cls):
+    return [name for name in dir(cls) if name.startswith(PREFIXES) and
+            name not in EXCLUDED and callable(getattr(cls, name))]
+
+
+def frameLabel(code):
+    return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                           code.co_firstlineno)
+
+
+def collapseStats(stats):
+    """Convert pstats.Stats into dict of collapsed stacks and microseconds
+
+    cProfile keeps caller/callee pairs, not whole stacks, so time of a
+    function called from several places is split between them in
+    proportion to time spent in it from every caller.
+    """
+    callees = defaultdict(list)
+    roots = []
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        if not callers:
+            roots.append(func)
+        for caller, edge in callers.items():
+            callees[caller].append((func, edge[3]))
+
+    def label(func):
+        filename, line, name = func
+        return '%s (%s:%d)' % (name, os.path.basename(filename), line)
+
+    stacks = defaultdict(int)
+
+    def walk(func, path, share):
+        tt, ct = stats.stats[func][2:4]
+        path = path + (label(func),)
+        if ct > 0:
+            stacks[';'.join(path)] += int(tt * share / ct * 1e6)
+        for callee, time in callees.get(func, ()):
+            if label(callee) not in path and ct > 0:
+                walk(callee, path, time * share / ct)
+
+    for root in roots:
+        walk(root, (), stats.stats[root][3])
+    return dict([(stack, value) for stack, value in stacks.items() if value])
+
+
+class SiteStats(object):
+    """Counters of profiled calls made from one call site
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.phases = defaultdict(float)
+        # collapsed stack -> samples or microseconds
+        self.stacks = defaultdict(int)
+        self.pstats = None
+
+
+class Call(object):
+    """Profiled call in progress
+    """
+
+    def __init__(self, site):
+        self.site = site
+        self.phase = None
+        # nesting of phase wrappers, only the outermost one is timed
+        self.depth = 0
+        self.started = None
+        self.phases = defaultdict(float)
+        self.stacks = defaultdict(int)
+        self.elapsed = 0.0
+        self.profile = None
+
+
+class PhaseTimer(object):
+    """Accounts time spent in phase to the profiled call of the thread
+    """
+
+    def __init__(self, profiler, phase):
+        self.profiler = profiler
+        self.phase = phase
+
+    def __enter__(self):
+        call = self.profiler._active.get(threading.current_thread().ident)
+        if call is not None:
+            if call.depth == 0:
+                call.phase = self.phase
+                call.started = time.time()
+            call.depth += 1
+
+    def __exit__(self, *exc_info):
+        call = self.profiler._active.get(threading.current_thread().ident)
+        if call is not None and call.depth:
+            call.depth -= 1
+            if call.depth == 0:
+                call.phases[call.phase] += time.time() - call.started
+                call.phase = None
+        return False
+
+
+class Profiler(object):
+    """Profiles calls of Basecamp methods
+
+    methods - names of methods to profile, by default all API calls
+    rate - fraction of calls to profile
+    sampling - sample stacks every `interval` seconds instead of
+               deterministic profiling with cProfile
+    """
+
+    def __init__(self, methods=None, rate=1.0, sampling=False,
+                 interval=0.001):
+        self.methods = methods
+        self.rate = rate
+        self.sampling = sampling
+        self.interval = interval
+        self.sites = defaultdict(SiteStats)
+        self._active = {}
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    def install(self, bc):
+        """Wrap methods of the session, its clones should be installed too
+        """
+        methods = self.methods
+        if methods is None:
+            methods = defaultMethods(bc.__class__)
+        for name in methods:
+            setattr(bc, name, self._wrapMethod(name, getattr(bc, name)))
+        bc.open = self._wrapPhase('network', bc.open)
+        bc.fromXML = self._wrapPhase('parse', bc.fromXML)
+        bc.loadResources = self._wrapPhase('model', bc.loadResources)
+        bc.loadResource = self._wrapPhase('model', bc.loadResource)
+
+    def _wrapMethod(self, name, method):
+        def profiled(*args, **kw):
+            ident = threading.current_thread().ident
+            if ident in self._active or random.random() >= self.rate:
+                return method(*args, **kw)
+            caller = sys._getframe(1)
+            site = '%s@%s:%d' % (name,
+                                 os.path.basename(caller.f_code.co_filename),
+                                 caller.f_lineno)
+            call = Call(site)
+            if not self.sampling:
+                call.profile = cProfile.Profile()
+            try:
+                result = self._profile(ident, call, method, args, kw)
+            except:
+                self._record(call)
+                raise
+            if isinstance(result, types.GeneratorType):
+                # requests are made while the result is consumed
+                return self._iterate(call, result)
+            self._record(call)
+            return result
+        profiled.__name__ = name
+        profiled.__doc__ = method.__doc__
+        return profiled
+
+    def _wrapPhase(self, phase, method):
+        # wrappers are named after phases to show up in profiled stacks
+        timer = PhaseTimer(self, phase)
+        if phase == 'network':
+            def network(*args, **kw):
+                with timer:
+                    return method(*args, **kw)
+            return network
+        if phase == 'parse':
+            def parse(*args, **kw):
+                with timer:
+                    return method(*args, **kw)
+            return parse
+        def model(*args, **kw):
+            with timer:
+                return method(*args, **kw)
+        return model
+
+    def _iterate(self, call, iterator):
+        """Yield items of iterator returned by profiled call, timing the
+        steps taken to get them, call is recorded once it is consumed
+        """
+        try:
+            while True:
+                ident = threading.current_thread().ident
+                try:
+                    if ident in self._active:
+                        # consumed within another profiled call
+                        item = iterator.next()
+                    else:
+                        item = self._profile(ident, call, iterator.next,
+                                             (), {})
+                except StopIteration:
+                    return
+                yield item
+        finally:
+            self._record(call)
+
+    def _profile(self, ident, call, method, args, kw):
+        self._active[ident] = call
+        if self.sampling:
+            self._startSampler()
+        start = time.time()
+        try:
+            if call.profile is not None:
+                return call.profile.runcall(method, *args, **kw)
+            return method(*args, **kw)
+        finally:
+            call.elapsed += time.time() - start
+            del self._active[ident]
+
+    def _record(self, call):
+        profile = call.profile
+        self._lock.acquire()
+        try:
+            site = self.sites[call.site]
+            site.calls += 1
+            site.total += call.elapsed
+            for phase, seconds in call.phases.items():
+                site.phases[phase] += seconds
+            for stack, count in call.stacks.items():
+                site.stacks[stack] += count
+            if profile is not None:
+                if site.pstats is None:
+                    site.pstats = pstats.Stats(profile)
+                else:
+                    site.pstats.add(profile)
+        finally:
+            self._lock.release()
+
+    # Sampling
+    def _startSampler(self):
+        self._lock.acquire()
+        try:
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample)
+                self._sampler.daemon = True
+                self._sampler.start()
+        finally:
+            self._lock.release()
+
+    def _sample(self):
+        root = Profiler._profile.im_func.func_code
+        while True:
+            time.sleep(self.interval)
+            self._lock.acquire()
+            try:
+                # stop once there are no calls, restarted with next one
+                if not self._active:
+                    self._sampler = None
+                    return
+            finally:
+                self._lock.release()
+            frames = sys._current_frames()
+            for ident, call in self._active.items():
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None and frame.f_code is not root:
+                    stack.append(frameLabel(frame.f_code))
+                    frame = frame.f_back
+                if frame is None:
+                    # call is just starting or over
+                    continue
+                stack.reverse()
+                call.stacks[';'.join(stack)] += 1
+
+    # Results
+    def collapsed(self, site):
+        """Return dict of collapsed stacks and their weights for call site
+
+        Weights are samples in sampling mode and microseconds otherwise.
+        """
+        stats = self.sites[site]
+        if stats.pstats is not None:
+            return collapseStats(stats.pstats)
+        return dict(stats.stacks)
+
+    def dump(self, directory):
+        """Write collapsed stacks of every call site into directory
+
+        Returns list of written files.
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        paths = []
+        for site in sorted(self.sites):
+            filename = site.replace(os.sep, '_').replace(':', '_')
+            path = os.path.join(directory, filename + '.collapsed')
+            stream = open(path, 'w')
+            try:
+                for stack, value in sorted(self.collapsed(site).items()):
+                    stream.write('%s %d\n' % (stack, value))
+            finally:
+                stream.close()
+            paths.append(path)
+        return paths
+
+    def report(self):
+        """Return table of calls, total and phase times per call site
+        """
+        lines = ['%-40s %6s %9s %9s %9s %9s' % ('site', 'calls', 'total',
+                                                'network', 'parse', 'model')]
+        for site, stats in sorted(self.sites.items(),
+                                  key=lambda item: -item[1].total):
+            lines.append('%-40s %6d %9.3f %9.3f %9.3f %9.3f' % (
+                site, stats.calls, stats.total, stats.phases['network'],
+                stats.phases['parse'], stats.phases['model']))
+        return '\n'.join(lines)
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self.sites.clear()
+        finally:
+            self._lock.release()
@@ -0,0 +1,235 @@
+"""In-memory queries over fetched resources
+
+Collection keeps resources of one type with secondary indexes on their
+attributes: hash indexes for equality, e.g. on project_id, and sorted
+ones for ranges, e.g. on date. select() picks the most selective index
+for its conditions and checks the rest on candidates only, join()
+matches two collections through a hash table instead of nested loops:
+
+    >>> entries = Collection(bc.getEntriesReport('20120101', '20121231'))
+    >>> entries.addIndex('person_id')
+    >>> entries.addIndex('date', sorted=True)
+    >>> january = entries.select(person_id=5,
+    ...                          date=between('2012-01-01', '2012-01-31'))
+    >>> projects = Collection(bc.getProjects())
+    >>> for entry, project in join(january, projects, 'project_id'):
+    ...     print project.name, entry.hours
+
+Attribute values are read from instances, resources changed after they
+were added should be added again to keep indexes correct.
+"""
+from bisect import bisect_left, bisect_right
+
+
+class between(object):
+    """Condition of select matching values from low to high inclusive
+
+    Either bound may be None to leave the range open.
+    """
+
+    def __init__(self, low=None, high=None):
+        self.low = low
+        self.high = high
+
+    def __call__(self, value):
+        return value is not None and \
+            (self.low is None or value >= self.low) and \
+            (self.high is None or value <= self.high)
+
+    def __repr__(self):
+        return 'between(%r, %r)' % (self.low, self.high)
+
+
+class HashIndex(object):
+    """Positions of resources by attribute value
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.positions = {}
+
+    def add(self, resources, start):
+        positions = self.positions
+        name = self.name
+        for position, resource in enumerate(resources, start):
+            value = resource.__dict__.get(name)
+            bucket = positions.get(value)
+            if bucket is None:
+                positions[value] = [position]
+            else:
+                bucket.append(position)
+
+    def lookup(self, value):
+        return self.positions.get(value, ())
+
+
+class SortedIndex(object):
+    """Positions of resources ordered by attribute value
+
+    Resources without value are kept apart, only lookup(None) returns
+    them. Adding resources sorts the index again on next lookup.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.keys = []
+        self.positions = []
+        self.missing = []
+        self._pending = []
+
+    def add(self, resources, start):
+        name = self.name
+        for position, resource in enumerate(resources, start):
+            value = resource.__dict__.get(name)
+            if value is None:
+                self.missing.append(position)
+            else:
+                self._pending.append((value, position))
+
+    def sort(self):
+        if self._pending:
+            pairs = zip(self.keys, self.positions) + self._pending
+            pairs.sort()
+            self.keys = [key for key, position in pairs]
+            self.positions = [position for key, position in pairs]
+            self._pending = []
+
+    def range(self, low=None, high=None):
+        """Return positions of resources with values from low to high
+        """
+        self.sort()
+        start = 0
+        stop = len(self.keys)
+        if low is not None:
+            start = bisect_left(self.keys, low)
+        if high is not None:
+            stop = bisect_right(self.keys, high)
+        return self.positions[start:stop]
+
+    def lookup(self, value):
+        if value is None:
+            return self.missing
+        return self.range(value, value)
+
+
+class Collection(object):
+    """Resources of one type with secondary indexes on attributes
+    """
+
+    def __init__(self, resources=()):
+        self.resources = []
+        self.indexes = {}
+        self.add(resources)
+
+    def __len__(self):
+        return len(self.resources)
+
+    def __iter__(self):
+        return iter(self.resources)
+
+    def __getitem__(self, index):
+        return self.resources[index]
+
+    def add(self, resources):
+        """Append resources, updating existing indexes
+        """
+        start = len(self.resources)
+        resources = list(resources)
+        self.resources.extend(resources)
+        for index in self.indexes.values():
+            index.add(resources, start)
+
+    def addIndex(self, name, sorted=False):
+        """Index resources by attribute name
+
+        Hash indexes serve equality conditions and joins, sorted ones
+        ranges as well. Returns the index, existing one is kept.
+        """
+        index = self.indexes.get(name)
+        if index is None or (sorted and not isinstance(index, SortedIndex)):
+            if sorted:
+                index = SortedIndex(name)
+                index.add(self.resources, 0)
+                index.sort()
+            else:
+                index = HashIndex(name)
+                index.add(self.resources, 0)
+            self.indexes[name] = index
+        return index
+
+    def lookup(self, name, value):
+        """Return resources with attribute equal to value
+        """
+        return self.select(**{name: value})
+
+    def range(self, name, low=None, high=None):
+        """Return resources with attribute from low to high inclusive
+        """
+        return self.select(**{name: between(low, high)})
+
+    def select(self, **conditions):
+        """Return collection of resources matching all conditions
+
+        Conditions are attribute values, or between ranges. Resources
+        are kept in the order they were added.
+        """
+        resources = self.resources
+        candidates = None
+        chosen = None
+        for name, condition in conditions.items():
+            index = self.indexes.get(name)
+            if index is None:
+                continue
+            if isinstance(condition, between):
+                if not isinstance(index, SortedIndex):
+                    continue
+                positions = index.range(condition.low, condition.high)
+            else:
+                positions = index.lookup(condition)
+            if candidates is None or len(positions) < len(candidates):
+                candidates = positions
+                chosen = name
+        if candidates is None:
+            candidates = xrange(len(resources))
+        elif isinstance(self.indexes[chosen], SortedIndex):
+            # hash index buckets are in order already
+            candidates = sorted(candidates)
+
+        checks = [(name, condition) for name, condition in conditions.items()
+                  if name != chosen]
+        result = Collection()
+        matches = result.resources
+        for position in candidates:
+            resource = resources[position]
+            values = resource.__dict__
+            for name, condition in checks:
+                value = values.get(name)
+                if isinstance(condition, between):
+                    if not condition(value):
+                        break
+                elif value != condition:
+                    break
+            else:
+                matches.append(resource)
+        return result
+
+
+def join(left, right, leftKey, rightKey='id', outer=False):
+    """Yield (left, right) pairs of resources with equal keys
+
+    Pairs follow the order of left collection. The right one is looked
+    up through its hash index on rightKey, built if there is none. With
+    outer set left resources without match are yielded with None.
+    """
+    if not isinstance(right, Collection):
+        right = Collection(right)
+    index = right.addIndex(rightKey)
+    resources = right.resources
+    for resource in left:
+        key = resource.__dict__.get(leftKey)
+        positions = key is not None and index.lookup(key) or ()
+        if positions:
+            for position in positions:
+                yield resource, resources[position]
+        elif outer:
+            yield resource, None
@@ -1,12 +1,14 @@
 """Basecamp resources
 
+Resource classes are imported on first access.
 """
+from basecamp.api.lazy import lazyPackage
 
-from project import Project
-from company import Company
-from person import Person
-from todolist import TodoList
-from todoitem import TodoItem
-from timeentry import TimeEntry
-from category import Category
-from message import Message
\ No newline at end of file
+lazyPackage(__name__, {'Project': 'project',
+                       'Company': 'company',
+                       'Person': 'person',
+                       'TodoList': 'todolist',
+                       'TodoItem': 'todoitem',
+                       'TimeEntry': 'timeentry',
+                       'Category': 'category',
+                       'Message': 'message'})
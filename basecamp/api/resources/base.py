@@ -2,9 +2,14 @@
 
 """
 import copy
-from xml.dom import minidom
+import json
 
-from attributes import Attribute
+from attributes import Attribute, ResourceAttribute, ArrayAttribute
+
+# kinds of fields in field tables
+_VALUE, _RESOURCE, _ARRAY = range(3)
+
+_fieldTables = {}
 
 def tagName2Attribute(name):
     return name.replace('-', '_')
@@ -43,6 +48,86 @@ class Resource(object):
     def __contains__(self, key):
         return key in self.fieldNames()
     
+    @classmethod
+    def fieldTable(cls):
+        """Return (name, kind, factory) for all Attribute type fields
+        
+        Table is built once per class, so encoding doesn't need to look
+        through class attributes for every resource.
+        """
+        table = _fieldTables.get(cls)
+        if table is None:
+            table = []
+            for name, attr in sorted(cls.__dict__.items()):
+                if isinstance(attr, ResourceAttribute):
+                    table.append((name, _RESOURCE, attr.factory))
+                elif isinstance(attr, ArrayAttribute):
+                    table.append((name, _ARRAY, attr.factory))
+                elif isinstance(attr, Attribute):
+                    table.append((name, _VALUE, None))
+            table = _fieldTables[cls] = tuple(table)
+        return table
+    
+    # Dict & JSON Layer
+    def toDict(self):
+        """Return dict of set attribute values
+        
+        Nested resources become dicts and arrays lists of dicts.
+        """
+        data = {}
+        values = self.__dict__
+        for name, kind, factory in self.fieldTable():
+            value = values.get(name)
+            if value is None:
+                continue
+            if kind is _RESOURCE:
+                value = value.toDict()
+            elif kind is _ARRAY:
+                value = [item.toDict() for item in value]
+            data[name] = value
+        return data
+    
+    @classmethod
+    def fromDict(cls, data):
+        """Build resource from dict returned by toDict
+        
+        Values are trusted to have proper types and are not converted,
+        unknown keys are ignored.
+        """
+        resource = cls.__new__(cls)
+        values = resource.__dict__
+        for name, kind, factory in cls.fieldTable():
+            value = data.get(name)
+            if value is None:
+                continue
+            if kind is _RESOURCE:
+                value = factory.fromDict(value)
+            elif kind is _ARRAY:
+                value = [factory.fromDict(item) for item in value]
+            values[name] = value
+        return resource
+    
+    def toJSON(self):
+        return json.dumps(self.toDict(), separators=(',', ':'))
+    
+    @classmethod
+    def fromJSON(cls, data):
+        return cls.fromDict(json.loads(data))
+    
+    @classmethod
+    def toJSONArray(cls, resources):
+        """Encode list of resources into single JSON array
+        """
+        return json.dumps([resource.toDict() for resource in resources],
+                          separators=(',', ':'))
+    
+    @classmethod
+    def fromJSONArray(cls, data):
+        """Decode JSON array into list of resources of this class
+        """
+        fromDict = cls.fromDict
+        return [fromDict(item) for item in json.loads(data)]
+    
     # XML Layer
     def fromString(self, data):
         """Parse xml and return updated object
@@ -82,6 +167,7 @@ class Resource(object):
     def prettyXML(self):
         """Serialize to pretty xml
         """
+        from xml.dom import minidom
         return minidom.parseString(self.serialize()).toprettyxml()
 
     
\ No newline at end of file
@@ -3,11 +3,14 @@
 
 """
 
-import httplib
 import urllib
 import urlparse
 import base64
 
+from transport import HTTPTransport
+# BBB: pool used to live here
+from transport import ConnectionPool
+
 
 def isRelativeURL(url):
     """Determines whether the given URL is a relative path segment
@@ -55,16 +58,125 @@ def getFullPath(pieces, params):
         ('', '', pieces[2], pieces[3], query, pieces[5]))
 
 
+class Headers(object):
+    """Read-only case-insensitive mapping of response headers
+
+    Built from the list of (name, value) pairs on first access.
+    """
+
+    __slots__ = ('_items', '_headers')
+
+    def __init__(self, items):
+        self._items = items
+        self._headers = None
+
+    def _parse(self):
+        headers = self._headers
+        if headers is None:
+            headers = {}
+            for name, value in self._items:
+                name = name.lower()
+                if name in headers:
+                    value = '%s, %s' % (headers[name], value)
+                headers[name] = value
+            self._headers = headers
+        return headers
+
+    def __getitem__(self, name):
+        return self._parse()[name.lower()]
+
+    def get(self, name, default=None):
+        return self._parse().get(name.lower(), default)
+
+    def __contains__(self, name):
+        return name.lower() in self._parse()
+
+    def keys(self):
+        return self._parse().keys()
+
+    def items(self):
+        return self._parse().items()
+
+    def __iter__(self):
+        return iter(self._parse())
+
+    def __len__(self):
+        return len(self._parse())
+
+    def __repr__(self):
+        return '<Headers %r>' % self._parse()
+
+
+class Response(object):
+    """Immutable result of RESTClient.open
+
+    contents is a string, or a file-like object for streamed requests;
+    read() returns the whole body in both cases.
+    """
+
+    __slots__ = ('url', 'status', 'reason', 'headers', 'contents', '_body')
+
+    def __init__(self, url, status, reason, headers, contents):
+        init = super(Response, self).__setattr__
+        init('url', url)
+        init('status', status)
+        init('reason', reason)
+        init('headers', Headers(headers))
+        init('contents', contents)
+        init('_body', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError, 'Response is immutable'
+
+    @property
+    def streamed(self):
+        return not isinstance(self.contents, basestring)
+
+    @property
+    def fullStatus(self):
+        return '%i %s' % (self.status, self.reason)
+
+    def read(self):
+        """Return body, streamed one is read to the end on first call
+        """
+        if not self.streamed:
+            return self.contents
+        if self._body is None:
+            super(Response, self).__setattr__('_body', self.contents.read())
+        return self._body
+
+    def close(self):
+        """Release connection of streamed response which is not read
+        """
+        if self.streamed:
+            self.contents.close()
+
+    def __repr__(self):
+        return '<Response %s %s>' % (self.fullStatus, self.url)
+
+
 class RESTClient(object):
+    """HTTP client making requests through transport
 
-    connectionFactory = httplib.HTTPConnection
-    sslConnectionFactory = httplib.HTTPSConnection
+    open() returns Response; status, reason, headers and contents of the
+    last response are also kept on the client for backwards
+    compatibility.
+    """
 
-    def __init__(self, url=None):
+    # httplib connection factories and DNSCache, see HTTPTransport
+    connectionFactory = None
+    sslConnectionFactory = None
+    dnsCache = None
+
+    def __init__(self, url=None, pool=None, transport=None):
         self.requestHeaders = {}
+        self.pool = pool
+        # transport used instead of httplib connections if set
+        self.transport = transport
         self._reset()
         self._requestData = None
         self.url = ''
+        self.response = None
         if url:
             self.open(url)
 
@@ -78,9 +190,10 @@ class RESTClient(object):
         self.status = None
         self.reason = None
 
-    def open(self, url='', data=None, params=None, headers=None, method='GET'):
+    def open(self, url='', data=None, params=None, headers=None, method='GET',
+             timeout=None, cancel=None, stream=False):
         # Create a correct absolute URL and set it.
-        self.url = absoluteURL(self.url, url)
+        self.url = fullURL = absoluteURL(self.url, url)
 
         # Create the full set of request headers
         requestHeaders = self.requestHeaders.copy()
@@ -91,40 +204,48 @@ class RESTClient(object):
         self._reset()
 
         # Store all the request data
-        self._requestData = (url, data, params, headers, method)
+        self._requestData = (url, data, params, headers, method, timeout,
+                             cancel, stream)
 
-        # Make a connection and retrieve the result
-        pieces = urlparse.urlparse(self.url)
-        if pieces[0] == 'https':
-            connection = self.sslConnectionFactory(pieces[1])
-        else:
-            connection = self.connectionFactory(pieces[1])
+        # Make a request and retrieve the result
+        pieces = urlparse.urlparse(fullURL)
+        url = urlparse.urlunparse(pieces[:2] + ('',) * 4) + \
+            getFullPath(pieces, params)
+        transport = self.transport
+        if transport is None:
+            transport = self.httpTransport()
         try:
-            connection.request(
-                method, getFullPath(pieces, params), data, requestHeaders)
-            response = connection.getresponse()
+            response = transport.request(method, url, data, requestHeaders,
+                                         timeout, cancel, stream)
         except Exception, e:
-            connection.close()
-            self.status, self.reason = e.args
-            raise e
-        else:
-            self.headers = response.getheaders()
-            self.contents = response.read()
-            self.status = response.status
-            self.reason = response.reason
-            connection.close()
+            self.reason = str(e)
+            raise
+        result = Response(url, response.status, response.reason,
+                          response.headers, response.body)
+        self.response = result
+        self.headers = response.headers
+        self.contents = response.body
+        self.status = response.status
+        self.reason = response.reason
+        return result
+
+    def httpTransport(self):
+        """Return HTTPTransport for client connection settings
+        """
+        return HTTPTransport(self.pool, self.connectionFactory,
+                             self.sslConnectionFactory, self.dnsCache)
 
     def get(self, url='', params=None, headers=None):
-        self.open(url, None, params, headers)
+        return self.open(url, None, params, headers)
 
     def put(self, url='', data='', params=None, headers=None):
-        self.open(url, data, params, headers, 'PUT')
+        return self.open(url, data, params, headers, 'PUT')
 
     def post(self, url='', data='', params=None, headers=None):
-        self.open(url, data, params, headers, 'POST')
+        return self.open(url, data, params, headers, 'POST')
 
     def delete(self, url='', params=None, headers=None):
-        self.open(url, None, params, headers, 'DELETE')
+        return self.open(url, None, params, headers, 'DELETE')
 
     def setCredentials(self, username, password):
         creds = username + u':' + password
@@ -132,5 +253,5 @@ class RESTClient(object):
         self.requestHeaders['Authorization'] = creds
 
     def reload(self):
-        self.open(*self._requestData)
+        return self.open(*self._requestData)
 
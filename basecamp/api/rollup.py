@@ -0,0 +1,415 @@
+"""Incrementally maintained rollups of hours logged in time entries
+
+RollupEngine is fed time entries, e.g. from Basecamp.iterEntriesReport,
+and keeps totals of hours in every rollup it has, grouped by entry
+attributes and a period of the entry date. Entries added again are
+treated as changed and their previous hours are taken back, so keeping
+totals current costs a few dict updates per entry and reading them
+only depends on the number of groups:
+
+    >>> engine = RollupEngine(company.time_zone_id)
+    >>> engine.addRollup('weekly', ('person_id',), 'week')
+    >>> engine.addRollup('monthly', ('project_id',), 'month')
+    >>> engine.feed(bc.iterEntriesReport('20120101', '20121231'))
+    >>> engine['weekly'].total(person_id=5)
+    >>> engine.current('weekly', person_id=5)     # this week so far
+    >>> engine.remove(entry_id)
+
+Entry dates are account local days already, the time zone is only used
+to find out which day, and so which period, it is now. Both Rails zone
+names, as in Company.time_zone_id, and tz database names are accepted.
+"""
+import threading
+from datetime import date, datetime, timedelta
+
+PERIODS = ('day', 'week', 'month', 'year')
+
+_dates = {}
+
+# Rails time zone names, which Basecamp returns as Company.time_zone_id,
+# and their tz database counterparts (ActiveSupport::TimeZone::MAPPING)
+RAILS_ZONES = {
+    'International Date Line West': 'Etc/GMT+12',
+    'Midway Island': 'Pacific/Midway',
+    'American Samoa': 'Pacific/Pago_Pago',
+    'Hawaii': 'Pacific/Honolulu',
+    'Alaska': 'America/Juneau',
+    'Pacific Time (US & Canada)': 'America/Los_Angeles',
+    'Tijuana': 'America/Tijuana',
+    'Mountain Time (US & Canada)': 'America/Denver',
+    'Arizona': 'America/Phoenix',
+    'Chihuahua': 'America/Chihuahua',
+    'Mazatlan': 'America/Mazatlan',
+    'Central Time (US & Canada)': 'America/Chicago',
+    'Saskatchewan': 'America/Regina',
+    'Guadalajara': 'America/Mexico_City',
+    'Mexico City': 'America/Mexico_City',
+    'Monterrey': 'America/Monterrey',
+    'Central America': 'America/Guatemala',
+    'Eastern Time (US & Canada)': 'America/New_York',
+    'Indiana (East)': 'America/Indiana/Indianapolis',
+    'Bogota': 'America/Bogota',
+    'Lima': 'America/Lima',
+    'Quito': 'America/Lima',
+    'Atlantic Time (Canada)': 'America/Halifax',
+    'Caracas': 'America/Caracas',
+    'La Paz': 'America/La_Paz',
+    'Santiago': 'America/Santiago',
+    'Newfoundland': 'America/St_Johns',
+    'Brasilia': 'America/Sao_Paulo',
+    'Buenos Aires': 'America/Argentina/Buenos_Aires',
+    'Montevideo': 'America/Montevideo',
+    'Georgetown': 'America/Guyana',
+    'Greenland': 'America/Godthab',
+    'Mid-Atlantic': 'Atlantic/South_Georgia',
+    'Azores': 'Atlantic/Azores',
+    'Cape Verde Is.': 'Atlantic/Cape_Verde',
+    'Dublin': 'Europe/Dublin',
+    'Edinburgh': 'Europe/London',
+    'Lisbon': 'Europe/Lisbon',
+    'London': 'Europe/London',
+    'Casablanca': 'Africa/Casablanca',
+    'Monrovia': 'Africa/Monrovia',
+    'UTC': 'Etc/UTC',
+    'Belgrade': 'Europe/Belgrade',
+    'Bratislava': 'Europe/Bratislava',
+    'Budapest': 'Europe/Budapest',
+    'Ljubljana': 'Europe/Ljubljana',
+    'Prague': 'Europe/Prague',
+    'Sarajevo': 'Europe/Sarajevo',
+    'Skopje': 'Europe/Skopje',
+    'Warsaw': 'Europe/Warsaw',
+    'Zagreb': 'Europe/Zagreb',
+    'Brussels': 'Europe/Brussels',
+    'Copenhagen': 'Europe/Copenhagen',
+    'Madrid': 'Europe/Madrid',
+    'Paris': 'Europe/Paris',
+    'Amsterdam': 'Europe/Amsterdam',
+    'Berlin': 'Europe/Berlin',
+    'Bern': 'Europe/Zurich',
+    'Zurich': 'Europe/Zurich',
+    'Rome': 'Europe/Rome',
+    'Stockholm': 'Europe/Stockholm',
+    'Vienna': 'Europe/Vienna',
+    'West Central Africa': 'Africa/Algiers',
+    'Bucharest': 'Europe/Bucharest',
+    'Cairo': 'Africa/Cairo',
+    'Helsinki': 'Europe/Helsinki',
+    'Kyiv': 'Europe/Kiev',
+    'Riga': 'Europe/Riga',
+    'Sofia': 'Europe/Sofia',
+    'Tallinn': 'Europe/Tallinn',
+    'Vilnius': 'Europe/Vilnius',
+    'Athens': 'Europe/Athens',
+    'Istanbul': 'Europe/Istanbul',
+    'Minsk': 'Europe/Minsk',
+    'Jerusalem': 'Asia/Jerusalem',
+    'Harare': 'Africa/Harare',
+    'Pretoria': 'Africa/Johannesburg',
+    'Kaliningrad': 'Europe/Kaliningrad',
+    'Moscow': 'Europe/Moscow',
+    'St. Petersburg': 'Europe/Moscow',
+    'Volgograd': 'Europe/Volgograd',
+    'Samara': 'Europe/Samara',
+    'Kuwait': 'Asia/Kuwait',
+    'Riyadh': 'Asia/Riyadh',
+    'Nairobi': 'Africa/Nairobi',
+    'Baghdad': 'Asia/Baghdad',
+    'Tehran': 'Asia/Tehran',
+    'Abu Dhabi': 'Asia/Muscat',
+    'Muscat': 'Asia/Muscat',
+    'Baku': 'Asia/Baku',
+    'Tbilisi': 'Asia/Tbilisi',
+    'Yerevan': 'Asia/Yerevan',
+    'Kabul': 'Asia/Kabul',
+    'Ekaterinburg': 'Asia/Yekaterinburg',
+    'Islamabad': 'Asia/Karachi',
+    'Karachi': 'Asia/Karachi',
+    'Tashkent': 'Asia/Tashkent',
+    'Chennai': 'Asia/Kolkata',
+    'Kolkata': 'Asia/Kolkata',
+    'Mumbai': 'Asia/Kolkata',
+    'New Delhi': 'Asia/Kolkata',
+    'Kathmandu': 'Asia/Kathmandu',
+    'Astana': 'Asia/Dhaka',
+    'Dhaka': 'Asia/Dhaka',
+    'Sri Jayawardenepura': 'Asia/Colombo',
+    'Almaty': 'Asia/Almaty',
+    'Novosibirsk': 'Asia/Novosibirsk',
+    'Rangoon': 'Asia/Rangoon',
+    'Bangkok': 'Asia/Bangkok',
+    'Hanoi': 'Asia/Bangkok',
+    'Jakarta': 'Asia/Jakarta',
+    'Krasnoyarsk': 'Asia/Krasnoyarsk',
+    'Beijing': 'Asia/Shanghai',
+    'Chongqing': 'Asia/Chongqing',
+    'Hong Kong': 'Asia/Hong_Kong',
+    'Urumqi': 'Asia/Urumqi',
+    'Kuala Lumpur': 'Asia/Kuala_Lumpur',
+    'Singapore': 'Asia/Singapore',
+    'Taipei': 'Asia/Taipei',
+    'Perth': 'Australia/Perth',
+    'Irkutsk': 'Asia/Irkutsk',
+    'Ulaanbaatar': 'Asia/Ulaanbaatar',
+    'Seoul': 'Asia/Seoul',
+    'Osaka': 'Asia/Tokyo',
+    'Sapporo': 'Asia/Tokyo',
+    'Tokyo': 'Asia/Tokyo',
+    'Yakutsk': 'Asia/Yakutsk',
+    'Darwin': 'Australia/Darwin',
+    'Adelaide': 'Australia/Adelaide',
+    'Canberra': 'Australia/Melbourne',
+    'Melbourne': 'Australia/Melbourne',
+    'Sydney': 'Australia/Sydney',
+    'Brisbane': 'Australia/Brisbane',
+    'Hobart': 'Australia/Hobart',
+    'Vladivostok': 'Asia/Vladivostok',
+    'Guam': 'Pacific/Guam',
+    'Port Moresby': 'Pacific/Port_Moresby',
+    'Magadan': 'Asia/Magadan',
+    'Srednekolymsk': 'Asia/Srednekolymsk',
+    'Solomon Is.': 'Pacific/Guadalcanal',
+    'New Caledonia': 'Pacific/Noumea',
+    'Fiji': 'Pacific/Fiji',
+    'Kamchatka': 'Asia/Kamchatka',
+    'Marshall Is.': 'Pacific/Majuro',
+    'Auckland': 'Pacific/Auckland',
+    'Wellington': 'Pacific/Auckland',
+    "Nuku'alofa": 'Pacific/Tongatapu',
+    'Tokelau Is.': 'Pacific/Fakaofo',
+    'Chatham Is.': 'Pacific/Chatham',
+    'Samoa': 'Pacific/Apia',
+}
+
+
+def parseDate(value):
+    """Return datetime.date of YYYY-MM-DD string, None if missing
+    """
+    if value is None or isinstance(value, date):
+        return value
+    day = _dates.get(value)
+    if day is None:
+        day = _dates[value] = date(int(value[:4]), int(value[5:7]),
+                                   int(value[8:10]))
+    return day
+
+
+def periodStart(day, period, weekStart=0):
+    """Return first day of period containing day
+
+    weekStart - weekday weeks start with, Monday is 0
+    """
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - timedelta((day.weekday() - weekStart) % 7)
+    if period == 'month':
+        return day.replace(day=1)
+    if period == 'year':
+        return day.replace(month=1, day=1)
+    raise ValueError, 'Unknown period: %r' % period
+
+
+def timeZone(zone):
+    """Return tzinfo for time zone name or tzinfo, None stays local time
+
+    Names are tz database ones or Rails ones Basecamp uses, e.g.
+    "Eastern Time (US & Canada)", looked up in tz database which requires
+    pytz.
+    """
+    if zone is None or not isinstance(zone, basestring):
+        return zone
+    try:
+        import pytz
+    except ImportError:
+        raise ImportError, 'pytz is required to use time zone names'
+    try:
+        return pytz.timezone(RAILS_ZONES.get(zone, zone))
+    except pytz.UnknownTimeZoneError:
+        raise ValueError, 'Unknown time zone: %r' % zone
+
+
+class Rollup(object):
+    """Totals of hours grouped by attributes and period of entry date
+
+    dimensions - names of time entry attributes to group by
+    period - one of PERIODS, or None for totals over all time
+    """
+
+    def __init__(self, dimensions=(), period=None, weekStart=0):
+        if period is not None and period not in PERIODS:
+            raise ValueError, 'Unknown period: %r' % period
+        self.dimensions = tuple(dimensions)
+        self.period = period
+        self.weekStart = weekStart
+        # group key -> [hours, entries]
+        self.cells = {}
+
+    def keyOf(self, values):
+        """Return group key of entry values, dimension values followed
+        by the period start
+        """
+        key = tuple([values.get(name) for name in self.dimensions])
+        if self.period is not None:
+            day = values.get('date')
+            if day is not None:
+                day = periodStart(day, self.period, self.weekStart)
+            key += (day,)
+        return key
+
+    def apply(self, values, sign):
+        """Add (sign 1) or take back (sign -1) entry values
+        """
+        key = self.keyOf(values)
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = [0.0, 0]
+        cell[0] += sign * values['hours']
+        cell[1] += sign
+        if not cell[1]:
+            # drop rounding errors with the last entry of group
+            del self.cells[key]
+
+    def _matching(self, criteria):
+        positions = []
+        for name, value in criteria.items():
+            if name == 'period':
+                if self.period is None:
+                    raise ValueError, 'Rollup has no period'
+                positions.append((len(self.dimensions), value))
+            elif name in self.dimensions:
+                positions.append((self.dimensions.index(name), value))
+            else:
+                raise ValueError, 'Rollup has no %r dimension' % name
+        for key, cell in self.cells.items():
+            for position, value in positions:
+                if key[position] != value:
+                    break
+            else:
+                yield key, cell
+
+    def totals(self, **criteria):
+        """Return dict of group keys and hours of groups matching criteria
+
+        Criteria are dimension values and period, the period start date.
+        """
+        return dict([(key, cell[0]) for key, cell in self._matching(criteria)])
+
+    def total(self, **criteria):
+        """Return hours of all groups matching criteria
+        """
+        return sum([cell[0] for key, cell in self._matching(criteria)])
+
+    def count(self, **criteria):
+        """Return number of entries in groups matching criteria
+        """
+        return sum([cell[1] for key, cell in self._matching(criteria)])
+
+
+class RollupEngine(object):
+    """Feeds time entries to rollups and keeps them current
+
+    timezone - tzinfo, Rails or tz database name, e.g.
+               Company.time_zone_id, used for the current period
+    """
+
+    def __init__(self, timezone=None):
+        self.timezone = timeZone(timezone)
+        self.rollups = {}
+        # entry id -> values entry was counted with
+        self._entries = {}
+        self._names = set(['hours', 'date'])
+        self._lock = threading.RLock()
+
+    def __getitem__(self, name):
+        return self.rollups[name]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def addRollup(self, name, dimensions=(), period=None, weekStart=0):
+        """Add rollup, entries fed so far are counted in it
+        """
+        self._lock.acquire()
+        try:
+            rollup = Rollup(dimensions, period, weekStart)
+            missing = set(rollup.dimensions) - self._names
+            if missing and self._entries:
+                # values were taken before the rollup needed them
+                raise ValueError, 'Dimensions %s were not kept for ' \
+                    'entries fed already' % ', '.join(sorted(missing))
+            self._names.update(rollup.dimensions)
+            for values in self._entries.values():
+                rollup.apply(values, 1)
+            self.rollups[name] = rollup
+            return rollup
+        finally:
+            self._lock.release()
+
+    def _values(self, entry):
+        data = entry.__dict__
+        values = dict([(name, data.get(name)) for name in self._names])
+        values['date'] = parseDate(values['date'])
+        hours = values['hours']
+        try:
+            values['hours'] = hours and float(hours) or 0.0
+        except ValueError:
+            raise ValueError, 'Invalid hours: %r' % hours
+        return values
+
+    def add(self, entry):
+        """Count new time entry, or its changes if it was added before
+        """
+        if entry.id is None:
+            raise ValueError, 'Time entry without id can not be tracked'
+        values = self._values(entry)
+        self._lock.acquire()
+        try:
+            previous = self._entries.get(entry.id)
+            if previous == values:
+                return
+            for rollup in self.rollups.values():
+                if previous is not None:
+                    rollup.apply(previous, -1)
+                rollup.apply(values, 1)
+            self._entries[entry.id] = values
+        finally:
+            self._lock.release()
+
+    update = add
+
+    def remove(self, entry):
+        """Take back destroyed time entry, entry may be its id
+        """
+        id = getattr(entry, 'id', entry)
+        self._lock.acquire()
+        try:
+            previous = self._entries.pop(id, None)
+            if previous is not None:
+                for rollup in self.rollups.values():
+                    rollup.apply(previous, -1)
+        finally:
+            self._lock.release()
+
+    def feed(self, entries):
+        """Add all entries of iterable, e.g. a report stream
+        """
+        for entry in entries:
+            self.add(entry)
+
+    def today(self):
+        """Return current date in engine time zone
+        """
+        if self.timezone is None:
+            return date.today()
+        return datetime.now(self.timezone).date()
+
+    def current(self, name, **criteria):
+        """Return hours of rollup in the current period
+        """
+        rollup = self.rollups[name]
+        if rollup.period is None:
+            raise ValueError, 'Rollup has no period'
+        criteria['period'] = periodStart(self.today(), rollup.period,
+                                         rollup.weekStart)
+        return rollup.total(**criteria)
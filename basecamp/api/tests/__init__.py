@@ -0,0 +1 @@
+# Tests, run with: python -m unittest discover basecamp/api/tests
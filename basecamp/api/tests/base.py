@@ -0,0 +1,85 @@
+"""Helpers of tests: in-process transport answering routed requests
+"""
+import re
+import urlparse
+import threading
+import unittest
+
+from basecamp.api import Basecamp
+from basecamp.api.transport import Transport, RawResponse
+
+URL = 'http://example.basecamphq.com/'
+
+
+class FakeTransport(Transport):
+    """Answers requests with responses of matching routes
+
+    Made requests are logged as (method, path) tuples in `requests`,
+    unmatched ones are answered with 404.
+    """
+
+    def __init__(self):
+        self.routes = []
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def route(self, method, pattern, body='', status=200, headers=None):
+        """Answer requests with method and path matching pattern
+
+        body - response body, or function called with path and request
+               body returning it
+        """
+        self.routes.insert(0, (method, re.compile(pattern + '$'), body,
+                               status, headers or {}))
+
+    def request(self, method, url, body=None, headers=None, timeout=None,
+                cancel=None, stream=False):
+        pieces = urlparse.urlsplit(url)
+        path = pieces.path + (pieces.query and '?' + pieces.query or '')
+        self._lock.acquire()
+        try:
+            self.requests.append((method, path))
+        finally:
+            self._lock.release()
+        for routeMethod, pattern, content, status, extra in self.routes:
+            if routeMethod == method and pattern.match(path):
+                if callable(content):
+                    content = content(path, body)
+                break
+        else:
+            content, status, extra = '', 404, {}
+        response = RawResponse(status, 'OK', [('status', '%d OK' % status)] +
+                               extra.items(), content)
+        if stream:
+            return response.streamed()
+        return response
+
+
+class TestCase(unittest.TestCase):
+    """Test case with Basecamp session talking to FakeTransport
+    """
+
+    def setUp(self):
+        self.transport = FakeTransport()
+        self.bc = Basecamp(URL, 'user', 'password')
+        self.bc.client.transport = self.transport
+
+    def requests(self, method=None):
+        return [request for request in self.transport.requests
+                if method is None or request[0] == method]
+
+    def xml(self, tag, **values):
+        """Return XML of a resource element with integer or text children
+        """
+        children = []
+        for name, value in sorted(values.items()):
+            name = name.replace('_', '-')
+            if isinstance(value, int):
+                children.append('<%s type="integer">%d</%s>' % (name, value,
+                                                                name))
+            else:
+                children.append('<%s>%s</%s>' % (name, value, name))
+        return '<%s>\n%s\n</%s>' % (tag, '\n'.join(children), tag)
+
+    def xmlArray(self, tag, *elements):
+        return '<%s type="array">\n%s\n</%s>' % (tag, '\n'.join(elements), tag)
@@ -0,0 +1,48 @@
+import os
+import json
+import shutil
+import tempfile
+
+from basecamp.api.tests.base import TestCase, URL
+
+
+class IdentityCacheTests(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'identity.json')
+        self.transport.route('GET', '/me.xml', self.xml('person', id=77,
+            user_name='user', first_name='Ann', token='secret'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def session(self):
+        session = self.bc.clone()
+        session.useIdentityCache(self.path)
+        return session
+
+    def testCacheHitRebuildsPersonWithoutRequests(self):
+        person = self.session().getAuthenticatedPerson()
+        self.assertEqual((person.id, person.first_name), (77, 'Ann'))
+        self.assertEqual(len(self.requests()), 1)
+
+        # e.g. client account where person lookups are forbidden
+        self.transport.route('GET', '/.*', status=403)
+        person = self.session().getAuthenticatedPerson()
+        self.assertEqual((person.id, person.first_name, person.user_name),
+                         (77, 'Ann', 'user'))
+        self.assertEqual(len(self.requests()), 1)
+
+    def testSecretsAreNotPersisted(self):
+        self.session().getAuthenticatedPerson()
+        stored = json.load(open(self.path)).values()[0]
+        self.assertEqual(stored['id'], 77)
+        self.assertFalse('token' in stored)
+
+    def testIdsStoredByEarlierVersionsAreUsed(self):
+        json.dump({URL.rstrip('/') + ' user': 5}, open(self.path, 'w'))
+        person = self.session().getAuthenticatedPerson()
+        self.assertEqual((person.id, person.user_name), (5, 'user'))
+        self.assertEqual(self.requests(), [])
@@ -0,0 +1,43 @@
+import cPickle
+import unittest
+import StringIO
+
+from basecamp.api.batch import ResourceBatch
+from basecamp.api.export import CSVSink, resourceData
+from basecamp.api.offload import pack, unpack
+from basecamp.api.resources import Company, Project, TodoItem, TodoList
+
+
+class FieldTableTests(unittest.TestCase):
+
+    def setUp(self):
+        self.project = Project(id=1, name='Site', show_writeboards=True,
+                               company=Company(id=3, name='Acme'))
+        self.todoList = TodoList(id=7, name='Launch', todo_items=[
+            TodoItem(id=70, content='Ship'), TodoItem(id=71)])
+
+    def testPackKeepsNestedResourcesAndArrays(self):
+        project = unpack(Project, pack(self.project))
+        self.assertEqual(project.toDict(), self.project.toDict())
+        todoList = unpack(TodoList, pack(self.todoList))
+        self.assertEqual(todoList.toDict(), self.todoList.toDict())
+
+    def testBatchColumns(self):
+        batch = ResourceBatch.fromResources(Project, [self.project,
+                                                      Project(id=2)])
+        batch = cPickle.loads(cPickle.dumps(batch, 2))
+        self.assertEqual(batch.column('id'), [1, 2])
+        self.assertEqual(batch.column('show_writeboards'), [True, None])
+        self.assertEqual(batch[0].company.name, 'Acme')
+        batch = ResourceBatch.fromResources(TodoList, [self.todoList])
+        self.assertEqual([item.id for item in batch[0].todo_items], [70, 71])
+
+    def testFlatRows(self):
+        self.assertEqual(resourceData(self.project, nested=False)['company'],
+                         3)
+        stream = StringIO.StringIO()
+        sink = CSVSink(stream, TodoList)
+        sink.write(self.todoList)
+        header, row = stream.getvalue().splitlines()
+        self.assertFalse('todo_items' in header.split(','))
+        self.assertTrue('Launch' in row.split(','))
@@ -0,0 +1,60 @@
+import time
+
+from basecamp.api.poller import ProjectPoller
+from basecamp.api.tests.base import TestCase
+
+
+class ResourceCacheTests(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.changed = '2012-01-01T00:00:00Z'
+        self.transport.route('GET', '/projects.xml', lambda path, body:
+            self.xmlArray('projects', self.xml('project', id=1,
+                last_changed_on=self.changed)))
+        for project_id, list_id in ((1, 7), (2, 8)):
+            self.transport.route(
+                'GET', '/projects/%d/todo_lists.xml\?filter=all' % project_id,
+                self.xmlArray('todo-lists', self.xml('todo-list', id=list_id,
+                    project_id=project_id)))
+        self.transport.route('POST', '/todo_lists/7/todo_items.xml',
+                             status=201,
+                             headers={'location': '/todo_items/70'})
+
+    def testCachedReadsExpireAfterMaxAge(self):
+        self.bc.useResourceCache(maxAge=0.05)
+        self.bc.getProjects()
+        self.bc.getProjects()
+        self.assertEqual(len(self.requests()), 1)
+        time.sleep(0.1)
+        self.bc.getProjects()
+        self.assertEqual(len(self.requests()), 2)
+
+    def testRefreshCacheReadsAroundCache(self):
+        self.bc.useResourceCache()
+        self.bc.getProjects()
+        session = self.bc.clone()
+        session.refreshCache = True
+        self.changed = '2012-02-01T00:00:00Z'
+        self.assertEqual(session.getProjects()[0].last_changed_on,
+                         self.bc.getProjects()[0].last_changed_on)
+        self.assertEqual(len(self.requests()), 2)
+
+    def testPollerSeesChangesWithCache(self):
+        self.bc.useResourceCache()
+        poller = ProjectPoller(self.bc)
+        self.assertEqual([project.id for project in poller.poll()], [1])
+        self.assertEqual(poller.poll(), [])
+        self.changed = '2012-02-01T00:00:00Z'
+        self.assertEqual([project.id for project in poller.poll()], [1])
+
+    def testCreateTodoItemInvalidatesListsOfItsProjectOnly(self):
+        self.bc.useResourceCache()
+        self.bc.getTodoListsForProject(1)
+        self.bc.getTodoListsForProject(2)
+        self.bc.createTodoItem(7, 'item', responsible_party=5)
+        del self.transport.requests[:]
+        self.bc.getTodoListsForProject(1)
+        self.bc.getTodoListsForProject(2)
+        self.assertEqual(self.requests(),
+                         [('GET', '/projects/1/todo_lists.xml?filter=all')])
@@ -0,0 +1,111 @@
+import socket
+import threading
+import unittest
+
+from basecamp.api import http2
+
+if http2.h2 is not None:
+    import h2.config
+    import h2.events
+    import h2.connection
+    import h2.exceptions
+
+BIG = 'x' * 200000
+SMALL = '<ok/>'
+
+
+class Server(object):
+    """h2c server answering /big with 200 KB and anything else with a few
+    bytes, sending no more than flow control windows allow
+    """
+
+    def __init__(self):
+        self.socket = socket.socket()
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.listen(5)
+        self.port = self.socket.getsockname()[1]
+        thread = threading.Thread(target=self.serve)
+        thread.daemon = True
+        thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                sock = self.socket.accept()[0]
+            except socket.error:
+                return
+            thread = threading.Thread(target=self.handle, args=(sock,))
+            thread.daemon = True
+            thread.start()
+
+    def handle(self, sock):
+        conn = h2.connection.H2Connection(h2.config.H2Configuration(
+            client_side=False, header_encoding='utf-8'))
+        conn.initiate_connection()
+        pending = {}
+        try:
+            sock.sendall(conn.data_to_send())
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    return
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        path = dict(event.headers)[':path']
+                        body = path == '/big' and BIG or SMALL
+                        conn.send_headers(event.stream_id, [
+                            (':status', '200'),
+                            ('content-length', str(len(body)))])
+                        pending[event.stream_id] = body
+                    elif isinstance(event, h2.events.StreamReset):
+                        pending.pop(event.stream_id, None)
+                for id, body in pending.items():
+                    window = min(conn.local_flow_control_window(id),
+                                 conn.max_outbound_frame_size)
+                    while body and window > 0:
+                        chunk, body = body[:window], body[window:]
+                        conn.send_data(id, chunk, end_stream=not body)
+                        window = min(conn.local_flow_control_window(id),
+                                     conn.max_outbound_frame_size)
+                    if body:
+                        pending[id] = body
+                    else:
+                        del pending[id]
+                sock.sendall(conn.data_to_send())
+        except (socket.error, h2.exceptions.ProtocolError):
+            pass
+        finally:
+            sock.close()
+
+    def close(self):
+        self.socket.close()
+
+
+class HTTP2TransportTests(unittest.TestCase):
+
+    def setUp(self):
+        if http2.h2 is None:
+            self.skipTest('h2 is not installed')
+        self.server = Server()
+        self.url = 'http://127.0.0.1:%d' % self.server.port
+        self.transport = http2.HTTP2Transport()
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.close()
+
+    def testRequest(self):
+        response = self.transport.request('GET', self.url + '/small',
+                                          timeout=3)
+        self.assertEqual((response.status, response.body), (200, SMALL))
+
+    def testUnreadStreamedResponseHoldsBackOnlyItsStream(self):
+        streamed = self.transport.request('GET', self.url + '/big',
+                                          timeout=3, stream=True)
+        self.assertEqual(streamed.body.read(10), 'x' * 10)
+        # the big response fills its stream window, more than the initial
+        # connection window, the other request still gets through
+        response = self.transport.request('GET', self.url + '/small',
+                                          timeout=3)
+        self.assertEqual(response.body, SMALL)
+        self.assertEqual(len(streamed.body.read()), len(BIG) - 10)
@@ -0,0 +1,26 @@
+from basecamp.api.tests.base import TestCase
+
+
+class IterMessagesTests(TestCase):
+
+    def route(self, pages):
+        def posts(path, body):
+            page = int(path.partition('page=')[2] or 1)
+            ids = pages(page)
+            return self.xmlArray('posts', *[self.xml('post', id=id)
+                                            for id in ids])
+        self.transport.route('GET', r'/projects/1/posts.xml(\?page=\d+)?',
+                             posts)
+
+    def ids(self, **kw):
+        return [message.id for message in self.bc.iterMessages(1, **kw)]
+
+    def testStopsAfterShortPage(self):
+        self.route(lambda page: {1: [1, 2], 2: [3, 4], 3: [5]}.get(page, []))
+        self.assertEqual(self.ids(), [1, 2, 3, 4, 5])
+
+    def testStopsWhenServerIgnoresPage(self):
+        self.route(lambda page: [1, 2])
+        self.assertEqual(self.ids(readAhead=0), [1, 2])
+        self.assertEqual(len(self.requests()), 2)
+        self.assertEqual(self.ids(), [1, 2])
@@ -0,0 +1,34 @@
+from basecamp.api.tests.base import TestCase
+
+
+class FindAuthenticatedPersonTests(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.transport.route('GET', '/.*', status=403)
+        self.transport.route('GET', '/projects.xml', self.xmlArray(
+            'projects', self.xml('project', id=1)))
+        self.transport.route('GET', '/projects/1/post_categories',
+                             self.xmlArray('post-categories',
+                                           self.xml('post-category', id=2)))
+        self.transport.route('POST', '/projects/1/msg/create',
+                             self.xml('post', id=3, author_id=5), status=201,
+                             headers={'location': '/posts/3.xml'})
+        self.transport.route('DELETE', '/posts/3.xml')
+        self.documents = []
+        fromXML = self.bc.fromXML
+
+        def record(contents):
+            rootElement = fromXML(contents)
+            if rootElement is not None:
+                self.documents.append(rootElement.ownerDocument)
+            return rootElement
+        self.bc.fromXML = record
+
+    def testClientFallbackFreesParsedDocuments(self):
+        person = self.bc.findAuthenticatedPerson()
+        self.assertEqual((person.id, person.user_name), (5, 'user'))
+        self.assertEqual(self.requests('DELETE'), [('DELETE', '/posts/3.xml')])
+        self.assertTrue(len(self.documents) >= 2)
+        for document in self.documents:
+            self.assertEqual(document.documentElement, None)
@@ -0,0 +1,34 @@
+import unittest
+
+from basecamp.api.query import Collection, between
+from basecamp.api.resources import TimeEntry
+
+
+class CollectionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.entries = Collection([
+            TimeEntry(id=1, person_id=5, date='2012-01-02'),
+            TimeEntry(id=2, person_id=5),
+            TimeEntry(id=3, person_id=6, date='2012-01-01'),
+            TimeEntry(id=4, person_id=6)])
+
+    def ids(self, collection):
+        return [entry.id for entry in collection]
+
+    def testSelectNoneWithSortedIndex(self):
+        expected = self.ids(self.entries.select(date=None))
+        self.assertEqual(expected, [2, 4])
+        self.entries.addIndex('date', sorted=True)
+        self.assertEqual(self.ids(self.entries.select(date=None)), expected)
+        self.assertEqual(self.ids(self.entries.select(date=None,
+                                                      person_id=6)), [4])
+
+    def testSortedIndexKeepsAddedResourcesWithoutValue(self):
+        self.entries.addIndex('date', sorted=True)
+        self.entries.add([TimeEntry(id=5), TimeEntry(id=6,
+                                                      date='2012-01-03')])
+        self.assertEqual(self.ids(self.entries.select(date=None)), [2, 4, 5])
+        self.assertEqual(self.ids(self.entries.range('date')), [1, 3, 6])
+        self.assertEqual(self.ids(self.entries.select(
+            date=between('2012-01-02'))), [1, 6])
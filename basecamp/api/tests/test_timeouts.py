@@ -0,0 +1,62 @@
+import time
+import threading
+
+from basecamp.api.timeouts import DeadlineExceededError
+from basecamp.api.tests.base import TestCase
+
+
+class CallScopeTests(TestCase):
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.transport.route('GET', '/me.xml', self.xml('person', id=5))
+
+    def inThread(self, func):
+        results = []
+
+        def run():
+            try:
+                results.append(func())
+            except Exception, e:
+                results.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        return results[0]
+
+    def testDeadlineAppliesToThreadEnteringIt(self):
+        with self.bc.deadline(0.01):
+            time.sleep(0.02)
+            self.assertRaises(DeadlineExceededError, self.bc.getCurrentPerson)
+            person = self.inThread(self.bc.getCurrentPerson)
+            self.assertEqual(person.id, 5)
+
+    def testExitRestoresScopeOfItsThreadOnly(self):
+        entered = threading.Event()
+        exited = threading.Event()
+
+        def other():
+            with self.bc.deadline(0.05):
+                entered.set()
+                exited.wait()
+            return self.bc._deadline
+
+        with self.bc.deadline(10) as call:
+            thread = threading.Thread(target=other)
+            thread.start()
+            entered.wait()
+            # other thread's scope doesn't replace this one
+            self.assertEqual(self.bc._cancellation, call.cancellation)
+            exited.set()
+            thread.join()
+            self.assertEqual(self.bc._cancellation, call.cancellation)
+            time.sleep(0.06)
+            self.assertEqual(self.bc.getCurrentPerson().id, 5)
+        self.assertEqual(self.bc._deadline, None)
+
+    def testClonesInheritScopeOfCloningThread(self):
+        with self.bc.deadline(10) as call:
+            session = self.bc.clone()
+        self.assertEqual(session._cancellation, call.cancellation)
+        self.assertEqual(self.bc._cancellation, None)
@@ -0,0 +1,160 @@
+"""Timeouts, deadlines and cancellation of requests
+
+"""
+import time
+import socket
+import threading
+
+
+class RequestTimeoutError(Exception):
+    """Server didn't respond in time
+    """
+
+class DeadlineExceededError(RequestTimeoutError):
+    """Overall time limit of the call is over
+    """
+
+class CancelledError(Exception):
+    """Request was cancelled
+    """
+
+
+def splitTimeout(timeout):
+    """Return (connect, read) timeouts from number or pair of numbers
+    """
+    if timeout is None or isinstance(timeout, (int, long, float)):
+        return timeout, timeout
+    return tuple(timeout)
+
+
+class Deadline(object):
+    """Point in time by which the call should be finished
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.time() + seconds
+
+    def remaining(self):
+        """Seconds left, raises DeadlineExceededError if there are none
+        """
+        remaining = self.expires - time.time()
+        if remaining <= 0:
+            raise DeadlineExceededError, 'Deadline of %.3fs is exceeded' % \
+                self.seconds
+        return remaining
+
+    def limit(self, timeout):
+        """Cut (connect, read) timeout pair by remaining time
+        """
+        remaining = self.remaining()
+        return tuple([value is None and remaining or min(value, remaining)
+                      for value in splitTimeout(timeout)])
+
+
+class Cancellation(object):
+    """Handle to cancel requests made under it
+
+    Cancelling closes sockets of requests in flight, so threads blocked
+    on them wake up with CancelledError and release their connections.
+    """
+
+    def __init__(self, parent=None):
+        # requests are cancelled with parent one too
+        self.parent = parent
+        self.cancelled = False
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        self._lock.acquire()
+        try:
+            self.cancelled = True
+            connections = list(self._connections)
+        finally:
+            self._lock.release()
+        for connection in connections:
+            sock = getattr(connection, 'sock', None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+
+    def isCancelled(self):
+        if self.cancelled:
+            return True
+        return self.parent is not None and self.parent.isCancelled()
+
+    def check(self):
+        """Raise CancelledError if cancelled
+        """
+        if self.cancelled:
+            raise CancelledError, 'Request is cancelled'
+        if self.parent is not None:
+            self.parent.check()
+
+    def attach(self, connection):
+        """Register connection of a request in flight
+        """
+        self._lock.acquire()
+        try:
+            self._connections.add(connection)
+        finally:
+            self._lock.release()
+        if self.parent is not None:
+            self.parent.attach(connection)
+        self.check()
+
+    def detach(self, connection):
+        self._lock.acquire()
+        try:
+            self._connections.discard(connection)
+        finally:
+            self._lock.release()
+        if self.parent is not None:
+            self.parent.detach(connection)
+
+
+class CallScope(object):
+    """Context manager applying deadline and cancellation to all calls
+    made through the session inside it
+
+        >>> with bc.deadline(5) as call:
+        ...     person = bc.getAuthenticatedPerson()
+
+    call.cancel() may be used from another thread to abort the calls.
+    Nested scopes can't extend deadline of outer ones. The scope applies
+    to calls of the thread entering it only, other threads sharing the
+    session are not affected.
+    """
+
+    def __init__(self, session, seconds=None):
+        self.session = session
+        self.seconds = seconds
+        self.cancellation = Cancellation(session._cancellation)
+
+    def cancel(self):
+        self.cancellation.cancel()
+
+    @property
+    def cancelled(self):
+        return self.cancellation.isCancelled()
+
+    def __enter__(self):
+        # kept per thread by session, see Basecamp._deadline
+        scope = self.session._scope
+        self._saved = (self.session._deadline, self.session._cancellation)
+        deadline = self.session._deadline
+        if self.seconds is not None:
+            if deadline is None or \
+                    deadline.expires > time.time() + self.seconds:
+                deadline = Deadline(self.seconds)
+        scope.deadline = deadline
+        scope.cancellation = self.cancellation
+        return self
+
+    def __exit__(self, *exc_info):
+        scope = self.session._scope
+        scope.deadline, scope.cancellation = self._saved
+        return False
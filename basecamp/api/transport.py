@@ -0,0 +1,500 @@
+"""Transports used by RESTClient to make HTTP requests
+
+A transport takes request method, absolute URL, body and headers and
+returns RawResponse. HTTPTransport talks to a real server with httplib,
+RecordingTransport records interactions made through another transport
+and ReplayTransport plays recorded interactions back without network,
+e.g. to profile parsing and scheduling in isolation:
+
+    >>> recorder = RecordingTransport(HTTPTransport())
+    >>> bc.client.transport = recorder
+    >>> projects = bc.getProjects()
+    >>> bc.client.transport = ReplayTransport(recorder.interactions)
+"""
+import sys
+import time
+import socket
+import urlparse
+import threading
+from cStringIO import StringIO
+
+from lazy import lazyImport
+from workers import callInThread, runConcurrently
+from timeouts import splitTimeout, RequestTimeoutError, CancelledError
+
+httplib = lazyImport('httplib')
+ssl = lazyImport('ssl')
+
+_sslContext = []
+
+# methods safe to send again when a pooled connection fails, a POST may
+# have reached the server already and would create resources twice
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
+
+
+def sslContext():
+    """Return default SSL context shared by HTTPS connections
+
+    httplib creates a new context for every connection otherwise, which
+    loads CA certificates again each time.
+    """
+    if not _sslContext:
+        _sslContext.append(ssl.create_default_context())
+    return _sslContext[0]
+
+
+class ReplayError(Exception):
+    """There is no recorded response for the request
+    """
+
+
+class RawResponse(object):
+    """Status, reason, headers list and body returned by transport
+
+    Body is a string, or a file-like object for streamed requests.
+    """
+
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def streamed(self):
+        """Return the same response with buffered body wrapped into
+        file-like object
+        """
+        return RawResponse(self.status, self.reason, self.headers,
+                           StringIO(self.body))
+
+
+class StreamedBody(object):
+    """File-like body of streamed response
+
+    Connection is returned to the pool once the body is read to the end,
+    and closed if the body is closed before that.
+    """
+
+    def __init__(self, response, connection, release):
+        self._response = response
+        self._connection = connection
+        self._release = release
+
+    def read(self, size=-1):
+        if self._connection is None:
+            return ''
+        try:
+            if size is None or size < 0:
+                data = self._response.read()
+            else:
+                data = self._response.read(size)
+        except Exception:
+            self.close()
+            raise
+        if not data or self._response.isclosed():
+            connection, self._connection = self._connection, None
+            self._release(connection, self._response)
+        return data
+
+    def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            connection.close()
+
+
+class Transport(object):
+    """Base transport
+    """
+
+    def request(self, method, url, body=None, headers=None, timeout=None,
+                cancel=None, stream=False):
+        """Make request and return RawResponse
+
+        timeout - number of seconds or (connect, read) pair
+        cancel - timeouts.Cancellation handle
+        stream - return body as file-like object to read it incrementally
+        """
+        raise NotImplementedError
+
+    def submit(self, method, url, body=None, headers=None, timeout=None,
+               cancel=None):
+        """Start request and return Future of its RawResponse
+
+        Transports with native asynchronous I/O should override this,
+        by default request is made in a separate thread.
+        """
+        return callInThread(self.request, method, url, body, headers,
+                            timeout, cancel)
+
+    def close(self):
+        """Release all resources held by transport
+        """
+
+
+class ConnectionPool(object):
+    """Keeps idle keep-alive connections for reuse
+
+    Connections are stored per scheme and host, no more than `maxsize`
+    idle connections are kept for each of them. Pool may be shared by
+    RESTClient instances working in different threads.
+    """
+
+    def __init__(self, maxsize=10):
+        self.maxsize = maxsize
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, scheme, host):
+        """Return idle connection or None if there is no one
+        """
+        self._lock.acquire()
+        try:
+            connections = self._idle.get((scheme, host))
+            if connections:
+                return connections.pop()
+            return None
+        finally:
+            self._lock.release()
+
+    def put(self, scheme, host, connection):
+        """Return connection back to the pool
+        """
+        self._lock.acquire()
+        try:
+            connections = self._idle.setdefault((scheme, host), [])
+            if len(connections) < self.maxsize:
+                connections.append(connection)
+                return
+        finally:
+            self._lock.release()
+        connection.close()
+
+    def clear(self):
+        """Close all idle connections
+        """
+        self._lock.acquire()
+        try:
+            idle, self._idle = self._idle, {}
+        finally:
+            self._lock.release()
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+class DNSCache(object):
+    """Caches addresses host names resolve to for `ttl` seconds
+
+    Connections made through createConnection skip DNS lookups while
+    addresses are fresh; addresses of a host which all failed to connect
+    are dropped.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._addresses = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port):
+        """Return getaddrinfo list of addresses for host and port
+        """
+        key = (host, port)
+        self._lock.acquire()
+        try:
+            entry = self._addresses.get(key)
+        finally:
+            self._lock.release()
+        if entry is not None and entry[0] > time.time():
+            return entry[1]
+        addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        self._lock.acquire()
+        try:
+            self._addresses[key] = (time.time() + self.ttl, addresses)
+        finally:
+            self._lock.release()
+        return addresses
+
+    def invalidate(self, host=None):
+        """Forget addresses of host, or of all hosts
+        """
+        self._lock.acquire()
+        try:
+            if host is None:
+                self._addresses.clear()
+            else:
+                for key in self._addresses.keys():
+                    if key[0] == host:
+                        del self._addresses[key]
+        finally:
+            self._lock.release()
+
+    def createConnection(self, address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT,
+                         source_address=None):
+        """Drop-in replacement of socket.create_connection
+        """
+        host, port = address
+        error = None
+        for family, socktype, proto, name, sockaddr in \
+                self.resolve(host, port):
+            sock = None
+            try:
+                sock = socket.socket(family, socktype, proto)
+                if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sockaddr)
+                return sock
+            except socket.error, error:
+                if sock is not None:
+                    sock.close()
+        self.invalidate(host)
+        if error is not None:
+            raise error
+        raise socket.error, 'getaddrinfo returns an empty list'
+
+
+class HTTPTransport(Transport):
+    """Makes requests with httplib, reusing connections from pool if any
+
+    Connection factories default to httplib.HTTPConnection and
+    HTTPSConnection, the latter sharing one SSL context. With dnsCache
+    set new connections resolve hosts through it.
+    """
+
+    connectionFactory = None
+    sslConnectionFactory = None
+    dnsCache = None
+
+    def __init__(self, pool=None, connectionFactory=None,
+                 sslConnectionFactory=None, dnsCache=None):
+        self.pool = pool
+        if connectionFactory is not None:
+            self.connectionFactory = connectionFactory
+        if sslConnectionFactory is not None:
+            self.sslConnectionFactory = sslConnectionFactory
+        if dnsCache is not None:
+            self.dnsCache = dnsCache
+
+    def request(self, method, url, body=None, headers=None, timeout=None,
+                cancel=None, stream=False):
+        pieces = urlparse.urlparse(url)
+        path = urlparse.urlunparse(('', '') + tuple(pieces[2:])) or '/'
+        headers = headers or {}
+        connectTimeout, readTimeout = splitTimeout(timeout)
+        if cancel is not None:
+            cancel.check()
+        connection = None
+        if self.pool is not None:
+            connection = self.pool.get(pieces[0], pieces[1])
+        if connection is not None:
+            try:
+                response = self._request(connection, method, path, body,
+                                         headers, readTimeout, cancel)
+            except (RequestTimeoutError, CancelledError):
+                connection.close()
+                raise
+            except (socket.error, httplib.HTTPException):
+                # idle keep-alive connection was closed by server,
+                # try once again with a fresh one if that is safe
+                exc_info = sys.exc_info()
+                connection.close()
+                if method.upper() not in IDEMPOTENT_METHODS:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                connection = None
+        if connection is None:
+            connection = self.connect(pieces[0], pieces[1], connectTimeout)
+            try:
+                response = self._request(connection, method, path, body,
+                                         headers, readTimeout, cancel)
+            except Exception:
+                connection.close()
+                raise
+
+        def release(connection, response):
+            if cancel is not None:
+                cancel.detach(connection)
+            if self.pool is not None and not getattr(response, 'will_close',
+                                                      True):
+                self.pool.put(pieces[0], pieces[1], connection)
+            else:
+                connection.close()
+
+        if stream:
+            return RawResponse(response.status, response.reason,
+                               response.getheaders(),
+                               StreamedBody(response, connection, release))
+        try:
+            result = RawResponse(response.status, response.reason,
+                                 response.getheaders(), response.read())
+        except Exception:
+            if cancel is not None:
+                cancel.detach(connection)
+            connection.close()
+            self._reraise(cancel)
+        release(connection, response)
+        return result
+
+    def connect(self, scheme, host, timeout=None):
+        """Create new connection to the host
+        """
+        kw = {}
+        if timeout is not None:
+            kw['timeout'] = timeout
+        if scheme == 'https':
+            factory = self.sslConnectionFactory
+            if factory is None:
+                factory = httplib.HTTPSConnection
+                kw['context'] = sslContext()
+        else:
+            factory = self.connectionFactory or httplib.HTTPConnection
+        connection = factory(host, **kw)
+        if self.dnsCache is not None:
+            # httplib connections open sockets through this attribute
+            connection._create_connection = self.dnsCache.createConnection
+        return connection
+
+    def warmUp(self, url, count, timeout=None):
+        """Open `count` connections to host of url at once and put them
+        into the pool, so first requests don't wait for connecting and
+        TLS handshakes
+
+        Returns number of connections established.
+        """
+        if self.pool is None:
+            raise ValueError, 'Connections can only be kept in a pool'
+        scheme, host = urlparse.urlparse(url)[:2]
+        connectTimeout = splitTimeout(timeout)[0]
+
+        def establish(index):
+            connection = self.connect(scheme, host, connectTimeout)
+            try:
+                connection.connect()
+            except Exception:
+                connection.close()
+                raise
+            return connection
+
+        established = 0
+        for index, item, connection, error in runConcurrently(
+                establish, range(count), max(count, 1)):
+            if error is None:
+                self.pool.put(scheme, host, connection)
+                established += 1
+        return established
+
+    def _request(self, connection, method, path, body, headers, timeout,
+                 cancel):
+        try:
+            if cancel is not None:
+                cancel.attach(connection)
+            if connection.sock is None:
+                connection.connect()
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            connection.request(method, path, body, headers)
+            return connection.getresponse()
+        except Exception:
+            if cancel is not None:
+                cancel.detach(connection)
+            self._reraise(cancel)
+
+    def _reraise(self, cancel):
+        """Translate current exception into timeout or cancellation error
+        """
+        exc_info = sys.exc_info()
+        if cancel is not None and cancel.isCancelled():
+            raise CancelledError, 'Request is cancelled'
+        if isinstance(exc_info[1], socket.timeout):
+            raise RequestTimeoutError, 'Request timed out: %s' % exc_info[1]
+        raise exc_info[0], exc_info[1], exc_info[2]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.clear()
+
+
+class RecordingTransport(Transport):
+    """Records all interactions made through another transport
+
+    Every interaction is a dict with method, url, body, status, reason,
+    headers, response (body) and elapsed (seconds) keys.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.interactions = []
+        self._lock = threading.Lock()
+
+    def request(self, method, url, body=None, headers=None, timeout=None,
+                cancel=None, stream=False):
+        # streamed bodies are read at once to record them
+        start = time.time()
+        response = self.transport.request(method, url, body, headers,
+                                          timeout, cancel)
+        interaction = {'method': method,
+                       'url': url,
+                       'body': body,
+                       'status': response.status,
+                       'reason': response.reason,
+                       'headers': list(response.headers),
+                       'response': response.body,
+                       'elapsed': time.time() - start}
+        self._lock.acquire()
+        try:
+            self.interactions.append(interaction)
+        finally:
+            self._lock.release()
+        if stream:
+            return response.streamed()
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class ReplayTransport(Transport):
+    """Plays back recorded interactions
+
+    Responses are matched by request method and URL, the same request
+    gets recorded responses in the recorded order. With loop set,
+    responses are repeated once exhausted, which is handy for load
+    testing. `speed` scales recorded response times: 1 replays them as
+    recorded, 2 twice as fast, and 0 (default) disables delays.
+    """
+
+    def __init__(self, interactions, loop=False, speed=0):
+        self.loop = loop
+        self.speed = speed
+        self._responses = {}
+        self._positions = {}
+        self._lock = threading.Lock()
+        for interaction in interactions:
+            key = (interaction['method'], interaction['url'])
+            self._responses.setdefault(key, []).append(interaction)
+
+    def request(self, method, url, body=None, headers=None, timeout=None,
+                cancel=None, stream=False):
+        if cancel is not None:
+            cancel.check()
+        key = (method, url)
+        self._lock.acquire()
+        try:
+            responses = self._responses.get(key, ())
+            position = self._positions.get(key, 0)
+            if position >= len(responses):
+                if not self.loop or not responses:
+                    raise ReplayError, 'No recorded response for %s %s' % key
+                position = 0
+            self._positions[key] = position + 1
+        finally:
+            self._lock.release()
+        interaction = responses[position]
+        if self.speed:
+            time.sleep(interaction.get('elapsed', 0) / self.speed)
+        response = RawResponse(interaction['status'], interaction['reason'],
+                               list(interaction['headers']),
+                               interaction['response'])
+        if stream:
+            return response.streamed()
+        return response
@@ -0,0 +1,198 @@
+"""Concurrency helpers used by bulk Basecamp API calls
+
+"""
+import sys
+import time
+import threading
+import Queue
+
+_done = object()
+
+
+class RateLimiter(object):
+    """Token bucket limiting how many requests per second are started
+
+    rate - average number of permits per second
+    burst - how many permits may be taken at once after an idle period
+    """
+
+    def __init__(self, rate, burst=1):
+        assert rate > 0
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._stamp = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a permit is available
+        """
+        while True:
+            wait = self._take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def tryAcquire(self):
+        """Take a permit if it is available right now
+        """
+        return not self._take()
+
+    def _take(self):
+        # take a permit and return 0 or return seconds to wait for it
+        self._lock.acquire()
+        try:
+            now = time.time()
+            self._tokens = min(self.burst,
+                self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+        finally:
+            self._lock.release()
+
+
+class Future(object):
+    """Result of an operation completed in another thread
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._result = None
+        self._error = None
+
+    def done(self):
+        return self._event.is_set()
+
+    def setResult(self, result):
+        self._result = result
+        self._complete()
+
+    def setError(self, error):
+        """Set exc_info tuple of failed operation
+        """
+        self._error = error
+        self._complete()
+
+    def _complete(self):
+        self._lock.acquire()
+        try:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        finally:
+            self._lock.release()
+        for callback in callbacks:
+            callback(self)
+
+    def addCallback(self, callback):
+        """Call callback(future) when operation is completed
+        """
+        self._lock.acquire()
+        try:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        finally:
+            self._lock.release()
+        callback(self)
+
+    def wait(self, timeout=None):
+        """Wait for operation, return whether it is completed
+        """
+        return self._event.wait(timeout)
+
+    def result(self, timeout=None):
+        """Wait for operation and return its result or raise its error
+        """
+        if not self._event.wait(timeout):
+            raise RuntimeError, 'Operation is not completed in time'
+        if self._error is not None:
+            raise self._error[0], self._error[1], self._error[2]
+        return self._result
+
+
+def callInThread(func, *args, **kw):
+    """Call func in a new daemon thread and return Future of its result
+    """
+    future = Future()
+
+    def call():
+        try:
+            future.setResult(func(*args, **kw))
+        except Exception:
+            future.setError(sys.exc_info())
+
+    thread = threading.Thread(target=call)
+    thread.daemon = True
+    thread.start()
+    return future
+
+
+def runConcurrently(func, items, concurrency=4, rateLimiter=None):
+    """Call func(item) for every item using a pool of worker threads
+
+    Yields (index, item, result, error) tuples in completion order, where
+    index is the position of item in the given iterable and error is the
+    exc_info tuple if func raised. Items are pulled from the iterable
+    lazily, so at most a couple of items per worker are held in memory.
+    If the consumer stops iterating, workers finish their current call
+    and exit.
+    """
+    assert concurrency > 0
+    inbox = Queue.Queue(concurrency * 2)
+    outbox = Queue.Queue()
+    stop = threading.Event()
+
+    def feed():
+        try:
+            for entry in enumerate(items):
+                while not stop.is_set():
+                    try:
+                        inbox.put(entry, timeout=0.1)
+                        break
+                    except Queue.Full:
+                        continue
+                if stop.is_set():
+                    break
+        finally:
+            for i in range(concurrency):
+                inbox.put(_done)
+
+    def work():
+        while True:
+            entry = inbox.get()
+            if entry is _done:
+                break
+            if stop.is_set():
+                # drain the inbox so that the feeder can exit too
+                continue
+            index, item = entry
+            if rateLimiter is not None:
+                rateLimiter.acquire()
+            try:
+                outbox.put((index, item, func(item), None))
+            except Exception:
+                outbox.put((index, item, None, sys.exc_info()))
+        outbox.put(_done)
+
+    threads = [threading.Thread(target=feed)]
+    threads.extend([threading.Thread(target=work)
+                    for i in range(concurrency)])
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    running = concurrency
+    try:
+        while running:
+            entry = outbox.get()
+            if entry is _done:
+                running -= 1
+                continue
+            yield entry
+    finally:
+        stop.set()
@@ -0,0 +1,227 @@
+"""Compare HTTP/1.1 connection pool with HTTP/2 transport on a fan-out
+
+Fetches time entries of many todo items concurrently, as
+Basecamp.completeTodoItems does for mutations, from local stand-in
+servers speaking HTTP/1.1 and HTTP/2 (h2c). Servers run in their own
+process, answer after the same simulated latency, and every new
+connection costs a simulated handshake, so the numbers show what
+multiplexing saves. Requires h2:
+
+    python benchmarks/http2.py --items 2000 --concurrency 100
+    python benchmarks/http2.py --latency 0.05 --connect-latency 0.2
+"""
+import time
+import socket
+import Queue
+import argparse
+import threading
+import SocketServer
+import BaseHTTPServer
+import multiprocessing
+
+import h2.events
+import h2.exceptions
+import h2.config
+import h2.connection
+
+from basecamp.api import Basecamp
+from basecamp.api.bulk import batchCall
+
+ENTRIES = '<time-entries type="array">\n%s</time-entries>\n' % ''.join([
+    '<time-entry>\n  <id type="integer">%d</id>\n  <hours>1.0</hours>\n'
+    '  <date type="date">2012-01-01</date>\n</time-entry>\n' % i
+    for i in range(5)])
+
+
+class Stats(object):
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def count(self, connections=0, requests=0):
+        self._lock.acquire()
+        try:
+            self.connections += connections
+            self.requests += requests
+        finally:
+            self._lock.release()
+
+
+class HTTP1Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        self.server.stats.count(connections=1)
+        time.sleep(self.server.connectLatency)
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+
+    def do_GET(self):
+        self.server.stats.count(requests=1)
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(ENTRIES)))
+        self.end_headers()
+        self.wfile.write(ENTRIES)
+
+    def log_message(self, *args):
+        pass
+
+
+class HTTP2Handler(SocketServer.BaseRequestHandler):
+    """Answers every request stream after latency, in parallel
+
+    Latency is the same for all streams, so they are answered in the
+    order they came by a single thread.
+    """
+
+    def handle(self):
+        self.server.stats.count(connections=1)
+        time.sleep(self.server.connectLatency)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.due = Queue.Queue()
+        responder = threading.Thread(target=self.respond)
+        responder.daemon = True
+        responder.start()
+        self.conn = h2.connection.H2Connection(h2.config.H2Configuration(
+            client_side=False, header_encoding='utf-8'))
+        self.conn.initiate_connection()
+        self.request.sendall(self.conn.data_to_send())
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            self.lock.acquire()
+            try:
+                for event in self.conn.receive_data(data):
+                    if isinstance(event, h2.events.StreamEnded):
+                        self.server.stats.count(requests=1)
+                        self.due.put((time.time() + self.server.latency,
+                                      event.stream_id))
+                    elif isinstance(event, h2.events.WindowUpdated):
+                        self.sendPending()
+                self.request.sendall(self.conn.data_to_send())
+            finally:
+                self.lock.release()
+
+    def respond(self):
+        next = None
+        while True:
+            ids = [next or self.due.get()]
+            next = None
+            wait = ids[0][0] - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            # answer all streams due by now at once
+            while True:
+                try:
+                    item = self.due.get_nowait()
+                except Queue.Empty:
+                    break
+                if item[0] > time.time():
+                    next = item
+                    break
+                ids.append(item)
+            self.lock.acquire()
+            try:
+                for due, id in ids:
+                    try:
+                        self.conn.send_headers(id, [
+                            (':status', '200'),
+                            ('content-type', 'application/xml'),
+                            ('content-length', str(len(ENTRIES)))])
+                    except h2.exceptions.ProtocolError:
+                        # client reset the stream
+                        continue
+                    self.pending[id] = ENTRIES
+                self.sendPending()
+                self.request.sendall(self.conn.data_to_send())
+            except (socket.error, h2.exceptions.ProtocolError):
+                # client is gone
+                return
+            finally:
+                self.lock.release()
+
+    def sendPending(self):
+        for id, body in self.pending.items():
+            window = min(self.conn.local_flow_control_window(id),
+                         self.conn.max_outbound_frame_size)
+            if window <= 0:
+                continue
+            chunk, body = body[:window], body[window:]
+            self.conn.send_data(id, chunk, end_stream=not body)
+            if body:
+                self.pending[id] = body
+            else:
+                del self.pending[id]
+
+
+class Server(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+
+def serve(pipe, handler, latency, connectLatency):
+    """Run server in child process, send its port and, when asked,
+    numbers of connections and requests through pipe
+    """
+    server = Server(('127.0.0.1', 0), handler)
+    server.latency = latency
+    server.connectLatency = connectLatency
+    server.stats = Stats()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    pipe.send(server.server_address[1])
+    pipe.recv()
+    pipe.send((server.stats.connections, server.stats.requests))
+
+
+def run(label, handler, args):
+    pipe, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve, args=(
+        child, handler, args.latency, args.connect_latency))
+    process.start()
+    try:
+        bc = Basecamp('http://127.0.0.1:%d/' % pipe.recv(), 'user',
+                      'password')
+        if handler is HTTP2Handler:
+            bc.useHTTP2()
+        start = time.time()
+        results = batchCall(bc, 'getEntriesForTodoItem',
+                            range(1, args.items + 1), args.concurrency,
+                            retries=0)
+        elapsed = time.time() - start
+        if bc.client.transport is not None:
+            bc.client.transport.close()
+        pipe.send('stats')
+        connections, requests = pipe.recv()
+    finally:
+        process.terminate()
+    failed = len([result for result in results.values()
+                  if not isinstance(result, list)])
+    print '%-10s %8.2fs %10.1f requests/s %6d connections %6d failed' % (
+        label, elapsed, args.items / elapsed, connections, failed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='seconds before server answers a request')
+    parser.add_argument('--connect-latency', type=float, default=0.1,
+                        help='seconds a new connection takes, handshake')
+    args = parser.parse_args(argv)
+
+    run('HTTP/1.1', HTTP1Handler, args)
+    run('HTTP/2', HTTP2Handler, args)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
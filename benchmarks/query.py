@@ -0,0 +1,82 @@
+"""Compare nested loops with indexed queries over generated time entries
+
+Selects entries of one person within a month and joins them to their
+projects, both with list comprehensions and with query.Collection:
+
+    python benchmarks/query.py --entries 1000000 --projects 200
+"""
+import time
+import random
+import argparse
+
+from basecamp.api.resources import Project, TimeEntry
+from basecamp.api.query import Collection, between, join
+
+
+def build(entries, projects, people):
+    random.seed(0)
+    return ([Project(id=i, name=u'Project %d' % i) for i in range(projects)],
+            [TimeEntry(id=i, project_id=random.randrange(projects),
+                       person_id=random.randrange(people),
+                       date=u'2012-%02d-%02d' % (random.randint(1, 12),
+                                                 random.randint(1, 28)),
+                       hours=u'1.0')
+             for i in range(entries)])
+
+
+def measure(label, func):
+    start = time.time()
+    result = func()
+    print '%-32s %10.2fms %8d rows' % (label, (time.time() - start) * 1000,
+                                       len(result))
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--entries', type=int, default=200000)
+    parser.add_argument('--projects', type=int, default=200)
+    parser.add_argument('--people', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    projects, entries = build(args.entries, args.projects, args.people)
+    people = range(args.people)[:args.queries]
+    low, high = u'2012-03-01', u'2012-03-31'
+
+    def loops():
+        rows = []
+        for person in people:
+            for entry in entries:
+                if entry.person_id == person and low <= entry.date <= high:
+                    for project in projects:
+                        if project.id == entry.project_id:
+                            rows.append((entry, project))
+        return rows
+
+    collection = Collection(entries)
+    projectCollection = Collection(projects)
+
+    def indexes():
+        collection.addIndex('person_id')
+        collection.addIndex('date', sorted=True)
+        projectCollection.addIndex('id')
+        return collection.indexes
+
+    def queries():
+        rows = []
+        for person in people:
+            rows.extend(join(collection.select(person_id=person,
+                                               date=between(low, high)),
+                             projectCollection, 'project_id'))
+        return rows
+
+    expected = measure('nested loops', loops)
+    measure('building indexes', indexes)
+    rows = measure('indexed select and hash join', queries)
+    assert len(rows) == len(expected)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
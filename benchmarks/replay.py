@@ -0,0 +1,89 @@
+"""Replay a recorded cassette and report throughput and memory usage
+
+Every recorded GET request is made again through Basecamp.get and its
+response is decoded into resources, so the numbers cover transport,
+parsing and modelling without any network:
+
+    python benchmarks/replay.py session.cassette --rounds 20
+    python benchmarks/replay.py session.cassette --offload 65536
+"""
+import sys
+import time
+import resource
+import argparse
+
+from basecamp.api import Basecamp
+from basecamp.api.cassette import loadCassette
+from basecamp.api.resources import Project, Company, Person, Category
+from basecamp.api.resources import TodoList, TimeEntry, Message
+
+FACTORIES = dict((factory._resource_type, factory) for factory in
+                 (Project, Company, Person, Category, TodoList, TimeEntry,
+                  Message))
+
+
+def factoryFor(contents):
+    """Guess resource type of a list response by its first element
+    """
+    bc = Basecamp('http://localhost/', '', '')
+    root = bc.fromXML(contents)
+    if root is None:
+        return None
+    if root.tagName in FACTORIES:
+        return FACTORIES[root.tagName]
+    for node in root.childNodes:
+        if node.nodeType == node.ELEMENT_NODE:
+            return FACTORIES.get(node.tagName)
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('cassette')
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=None,
+                        help='simulated latency per request, seconds')
+    parser.add_argument('--offload', type=int, default=None,
+                        help='decode bodies larger than this in processes')
+    parser.add_argument('--identity-map', action='store_true')
+    args = parser.parse_args(argv)
+
+    interactions = [i for i in loadCassette(args.cassette)
+                    if i['method'] == 'GET' and i['status'] == 200]
+    if not interactions:
+        print 'No successful GET requests in cassette'
+        return 1
+    url = interactions[0]['url']
+    base = url[:url.index('/', url.index('//') + 2)]
+    calls = [(i['url'][len(base):], factoryFor(i['response']))
+             for i in interactions]
+
+    bc = Basecamp(base, '', '')
+    bc.useCassette(args.cassette, latency=args.latency, loop=True)
+    if args.offload is not None:
+        bc.useParseOffload(args.offload)
+    if args.identity_map:
+        bc.useIdentityMap()
+
+    requests = resources = 0
+    start = time.time()
+    for i in range(args.rounds):
+        for path, factory in calls:
+            contents = bc.get(path).contents
+            requests += 1
+            if factory is not None:
+                resources += len(bc.decodeResources(factory, contents))
+    elapsed = time.time() - start
+    if bc.parseOffload is not None:
+        bc.parseOffload.close()
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print 'requests:  %d (%.1f/s)' % (requests, requests / elapsed)
+    print 'resources: %d (%.1f/s)' % (resources, resources / elapsed)
+    print 'elapsed:   %.3fs' % elapsed
+    print 'max rss:   %d KB' % maxrss
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""Compare Resource.toDict/fromDict with a hand-written getattr encoder
+
+Builds todo lists with nested todo items and reports resources encoded
+and decoded per second:
+
+    python benchmarks/serialize.py --lists 2000 --items 20
+"""
+import time
+import json
+import argparse
+
+from basecamp.api.resources import TodoList, TodoItem
+
+
+def handWritten(resource):
+    data = {}
+    for name in resource.fieldNames():
+        value = getattr(resource, name)
+        if value is None:
+            continue
+        if isinstance(value, list):
+            value = [handWritten(item) for item in value]
+        data[name] = value
+    return data
+
+
+def build(lists, items):
+    result = []
+    for i in range(lists):
+        todoList = TodoList(id=i, name=u'List %d' % i, project_id=1,
+                            position=i, private='false')
+        todoList.todo_items = [
+            TodoItem(id=i * items + j, content=u'Item %d' % j,
+                     todo_list_id=i, position=j, completed='true')
+            for j in range(items)]
+        result.append(todoList)
+    return result
+
+
+def measure(label, func, count):
+    start = time.time()
+    result = func()
+    elapsed = time.time() - start
+    print '%-24s %8.3fs %10d resources/s' % (label, elapsed, count / elapsed)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--lists', type=int, default=2000)
+    parser.add_argument('--items', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    lists = build(args.lists, args.items)
+    count = args.lists * (args.items + 1)
+    measure('getattr loop', lambda: [handWritten(l) for l in lists], count)
+    measure('toDict', lambda: [l.toDict() for l in lists], count)
+    data = measure('toJSONArray', lambda: TodoList.toJSONArray(lists), count)
+    dicts = json.loads(data)
+    measure('fromDict', lambda: [TodoList.fromDict(d) for d in dicts], count)
+    measure('fromJSONArray', lambda: TodoList.fromJSONArray(data), count)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
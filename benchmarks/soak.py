@@ -0,0 +1,173 @@
+"""Decode reports over and over and track memory growth and GC pauses
+
+Every call fetches a time report from an in-process transport and decodes
+it, so the numbers cover parsing and modelling only. Pauses of the cyclic
+garbage collector are taken from its debug statistics:
+
+    python benchmarks/soak.py --calls 5000 --entries 200
+    python benchmarks/soak.py --calls 5000 --bulk
+"""
+import os
+import re
+import gc
+import sys
+import time
+import json
+import resource
+import argparse
+import tempfile
+
+from basecamp.api import Basecamp
+from basecamp.api.resources import TimeEntry
+from basecamp.api.transport import Transport, RawResponse
+
+ENTRY = """<time-entry>
+  <id type="integer">%(id)d</id>
+  <project-id type="integer">1</project-id>
+  <person-id type="integer">2</person-id>
+  <todo-item-id type="integer" nil="true"></todo-item-id>
+  <date type="date">2012-01-01</date>
+  <hours type="float">1.5</hours>
+  <description>Entry %(id)d</description>
+</time-entry>
+"""
+
+GC_START = re.compile(r'gc: collecting generation (\d)')
+GC_DONE = re.compile(r'gc: done.* ([0-9.]+)s elapsed')
+
+
+class ReportTransport(Transport):
+    """Answers every request with the same time report
+    """
+
+    def __init__(self, entries):
+        self.body = '<time-entries type="array">\n%s</time-entries>\n' % \
+            ''.join([ENTRY % {'id': i} for i in range(entries)])
+
+    def request(self, method, url, body=None, headers=None, timeout=None,
+                cancel=None, stream=False):
+        response = RawResponse(200, 'OK', [('status', '200 OK')], self.body)
+        if stream:
+            return response.streamed()
+        return response
+
+
+def currentRSS():
+    """Return resident set size in KB, max RSS where /proc is missing
+    """
+    try:
+        for line in open('/proc/self/status'):
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def collectStats(path):
+    """Return list of (generation, seconds) pauses logged by gc
+    """
+    pauses = []
+    generation = None
+    for line in open(path):
+        match = GC_START.match(line)
+        if match is not None:
+            generation = int(match.group(1))
+            continue
+        match = GC_DONE.match(line)
+        if match is not None and generation is not None:
+            pauses.append((generation, float(match.group(1))))
+            generation = None
+    return pauses
+
+
+def soak(bc, calls, stream, samples):
+    """Make calls, return list of (calls made, RSS) samples
+    """
+    rss = [(0, currentRSS())]
+    every = max(calls // samples, 1)
+    for i in range(1, calls + 1):
+        if stream:
+            for entry in bc.iterResources(TimeEntry,
+                                          '/time_entries/report.xml'):
+                pass
+        else:
+            bc.getEntriesReport('20120101', '20121231')
+        if i % every == 0:
+            rss.append((i, currentRSS()))
+    return rss
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--entries', type=int, default=200,
+                        help='time entries per report')
+    parser.add_argument('--bulk', action='store_true',
+                        help='decode with Basecamp.useBulkDecoder')
+    parser.add_argument('--no-pause', action='store_true',
+                        help="don't pause gc while bulk decoding")
+    parser.add_argument('--stream', action='store_true',
+                        help='decode incrementally with iterResources')
+    parser.add_argument('--samples', type=int, default=10,
+                        help='number of RSS measurements')
+    parser.add_argument('--json', action='store_true',
+                        help='print results as JSON to track them over time')
+    args = parser.parse_args(argv)
+
+    bc = Basecamp('http://localhost/', '', '')
+    bc.client.transport = ReportTransport(args.entries)
+    if args.bulk:
+        bc.useBulkDecoder(not args.no_pause)
+
+    # warm up so that imports and caches don't count as growth
+    soak(bc, 10, args.stream, 1)
+    gc.collect()
+
+    # gc writes its statistics to C stderr
+    log = tempfile.NamedTemporaryFile()
+    stderr = os.dup(2)
+    sys.stderr.flush()
+    os.dup2(log.fileno(), 2)
+    gc.set_debug(gc.DEBUG_STATS)
+    start = time.time()
+    try:
+        rss = soak(bc, args.calls, args.stream, args.samples)
+    finally:
+        elapsed = time.time() - start
+        gc.set_debug(0)
+        os.dup2(stderr, 2)
+        os.close(stderr)
+    pauses = collectStats(log.name)
+    log.close()
+
+    times = sorted(seconds for generation, seconds in pauses)
+    full = len([generation for generation, seconds in pauses
+                if generation == 2])
+    results = {
+        'calls': args.calls, 'entries': args.entries,
+        'mode': args.stream and 'stream' or args.bulk and 'bulk' or 'dom',
+        'elapsed': elapsed, 'callsPerSecond': args.calls / elapsed,
+        'rssStart': rss[0][1], 'rssEnd': rss[-1][1],
+        'rssGrowth': rss[-1][1] - rss[0][1],
+        'collections': len(times), 'fullCollections': full,
+        'gcTotal': sum(times),
+        'gcMax': times and times[-1] or 0.0,
+        'gcP99': times and times[int(len(times) * 0.99)] or 0.0}
+    if args.json:
+        print json.dumps(results)
+        return 0
+    print '%(calls)d calls of %(entries)d entries, %(mode)s decoding' % \
+        results
+    print 'time: %(elapsed).2fs, %(callsPerSecond).1f calls/s' % results
+    print 'RSS: %(rssStart)d KB -> %(rssEnd)d KB, grew by %(rssGrowth)d KB' \
+        % results
+    for calls, kb in rss[1:]:
+        print '  after %6d calls %8d KB' % (calls, kb)
+    print 'gc: %(collections)d collections (%(fullCollections)d full), ' \
+        'total %(gcTotal).3fs, max %(gcMax).4fs, p99 %(gcP99).4fs' % results
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
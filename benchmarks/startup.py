@@ -0,0 +1,61 @@
+"""Measure import time and memory of a fresh interpreter importing the API
+
+Every round starts a new interpreter, so nothing is cached between them:
+
+    python benchmarks/startup.py --rounds 20
+    python benchmarks/startup.py --statement "from basecamp.api import Basecamp"
+"""
+import sys
+import json
+import argparse
+import subprocess
+
+CHILD = """
+import sys, time, resource
+before = set(sys.modules)
+start = time.time()
+exec %r
+elapsed = time.time() - start
+sys.stdout.write('%%.6f %%d %%d' %% (elapsed,
+    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    len([name for name in set(sys.modules) - before
+         if sys.modules[name] is not None])))
+"""
+
+
+def measure(statement):
+    """Run statement in a new interpreter, return (seconds, KB, modules)
+    """
+    output = subprocess.check_output([sys.executable, '-c',
+                                      CHILD % statement])
+    elapsed, rss, modules = output.split()
+    return float(elapsed), int(rss), int(modules)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--statement', default='import basecamp.api')
+    parser.add_argument('--json', action='store_true',
+                        help='print results as JSON to track them over time')
+    args = parser.parse_args(argv)
+
+    baseline = sorted(measure('pass') for i in range(args.rounds))
+    results = sorted(measure(args.statement) for i in range(args.rounds))
+    elapsed = [result[0] for result in results]
+    median = elapsed[len(elapsed) // 2]
+    rss = results[-1][1] - baseline[-1][1]
+    modules = results[-1][2]
+    if args.json:
+        print json.dumps({'statement': args.statement, 'min': elapsed[0],
+                          'median': median, 'rss': rss, 'modules': modules})
+    else:
+        print args.statement
+        print 'import time: min %.1fms, median %.1fms' % (elapsed[0] * 1000,
+                                                          median * 1000)
+        print 'memory: +%d KB max RSS, %d modules loaded' % (rss, modules)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -19,7 +19,6 @@ setup(name='basecamp.api',
       url='',
       license='GPL',
       packages=find_packages(exclude=['ez_setup']),
-      namespace_packages=['basecamp'],
       include_package_data=True,
       zip_safe=False,
       install_requires=[